@@ -0,0 +1,142 @@
+"""
+    persistent cache of the ARIMA orders found by auto_arima, so that unchanged series
+    skip the order search and only refit their coefficients
+"""
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from set_up.addresses_constants import ADRS_ARIMA_ORDER_CACHE
+from set_up.constants import FORCE_ARIMA_ORDER_SEARCH
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+def series_fingerprint(series):
+    """hash of the values of a series
+
+    Args:
+        series (array like): values of the time series
+
+    Returns:
+        String: hex digest of the float64 values
+    """
+    values = np.ascontiguousarray(np.asarray(series, dtype=np.float64).reshape(-1))
+    return hashlib.sha1(values.tobytes()).hexdigest()
+
+class ArimaOrderCache:
+    """ARIMA orders keyed by admin level, location, product and a fingerprint of the series.
+
+    Args:
+        adrs (String, optional): json file of the cache, None keeps the cache in memory only.
+                                    Defaults to ADRS_ARIMA_ORDER_CACHE.
+        force_search (bool, optional): ignore the stored orders and search again.
+                                        Defaults to FORCE_ARIMA_ORDER_SEARCH.
+    """
+
+    def __init__(self, adrs=ADRS_ARIMA_ORDER_CACHE, force_search=FORCE_ARIMA_ORDER_SEARCH):
+        self.adrs = adrs
+        self.force_search = force_search
+        self.hits = 0
+        self.misses = 0
+        self.orders = {}
+        if adrs is not None and Path(adrs).is_file():
+            with open(adrs, encoding='utf-8') as cache_file:
+                self.orders = json.load(cache_file)
+
+    @staticmethod
+    def key(admin_label, location, product, series, seasonal=False):
+        """build the cache key of a series
+
+        Args:
+            admin_label (String): admin level of the series
+            location (String): location of the series (None for admin level 0)
+            product (String): product of the series
+            series (array like): values the order search runs on
+            seasonal (bool, optional): seasonal order search. Defaults to False.
+
+        Returns:
+            String: cache key
+        """
+        return '|'.join([str(admin_label), str(location), str(product),
+                         'seasonal' if seasonal else 'arima', series_fingerprint(series)])
+
+    def lookup(self, key):
+        """get a stored order
+
+        Args:
+            key (String): output of `key`
+
+        Returns:
+            tuple: (p, d, q), or ((p, d, q), (P, D, Q, m)) for seasonal keys.
+                    None if the order has to be searched.
+        """
+        entry = None if self.force_search else self.orders.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if 'seasonal_order' in entry:
+            return tuple(entry['order']), tuple(entry['seasonal_order'])
+        return tuple(entry['order'])
+
+    def store(self, key, order, seasonal_order=None):
+        """store a searched order
+
+        Args:
+            key (String): output of `key`
+            order (tuple): (p, d, q)
+            seasonal_order (tuple, optional): (P, D, Q, m). Defaults to None.
+        """
+        entry = {'order': [int(i) for i in order]}
+        if seasonal_order is not None:
+            entry['seasonal_order'] = [int(i) for i in seasonal_order]
+        self.orders[key] = entry
+
+    def subset(self, keys):
+        """in-memory copy of the cache restricted to some keys, small enough to be sent
+        to a worker process
+
+        Args:
+            keys (list): keys the worker will look up
+
+        Returns:
+            ArimaOrderCache: cache without a file
+        """
+        cache = ArimaOrderCache(adrs=None, force_search=self.force_search)
+        cache.orders = {key: self.orders[key] for key in keys if key in self.orders}
+        return cache
+
+    def merge(self, other):
+        """add the orders and the hit / miss counts of a worker cache (see `subset`)
+
+        Args:
+            other (ArimaOrderCache): cache returned by a worker
+        """
+        self.orders.update(other.orders)
+        self.hits += other.hits
+        self.misses += other.misses
+
+    def save(self):
+        """write the cache to disk
+
+        Returns:
+            String: address of the cache file (None for in-memory caches)
+        """
+        if self.adrs is None:
+            return None
+        Path(self.adrs).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.adrs, 'w', encoding='utf-8') as cache_file:
+            json.dump(self.orders, cache_file, indent=1, sort_keys=True)
+        return self.adrs
+
+    def log_stats(self, stage):
+        """log the number of cache hits and misses
+
+        Args:
+            stage (String): name of the stage that used the cache
+        """
+        log.info("ARIMA order cache for %s: %d hits, %d misses%s", stage, self.hits,
+                 self.misses, " (forced re-search)" if self.force_search else "")
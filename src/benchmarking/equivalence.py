@@ -0,0 +1,730 @@
+"""
+    numerical equivalence harness: runs the reference (series by series) implementation of an
+    imputation or forecasting step and a candidate engine on the same fixtures, and reports the
+    largest absolute and relative difference of every column together with the run times.
+    The references are copies of the baseline code, not calls into the current modules, with
+    one deliberate change: the merged local regression intervals are sorted (see
+    `baseline_local_regression_lists`). A rewrite of a step is only accepted while its outputs match the reference.
+
+    run from the src folder:
+        python -m benchmarking.equivalence [--checks local_regression geo_imputation]
+                                           [--candidate local_regression=module:function]
+    The exit status is 1 when a check does not match, so the harness can run as a test.
+"""
+import argparse
+import importlib
+import logging
+from pathlib import Path
+import sys
+import time
+import warnings
+
+import numpy as np
+import numpy.polynomial.polynomial as Polynomial
+import pandas as pd
+import pmdarima as pm
+from statsmodels.tsa.arima.model import ARIMA
+
+from arima_order_cache import ArimaOrderCache
+from benchmarking.run_benchmarks import benchmark_configuration, isolated_working_directory
+from benchmarking.synthetic_panel import generate_market_panel, scaled_panel_settings
+from modeling_permutation.arima_imputation import arima_imputation_panel
+from modeling_permutation.finding_nearest_cities import find_nearest_cities
+from modeling_permutation.geo_imputation import perform_geo_imputation
+from modeling_permutation.global_regression import perform_global_regression_batch
+from modeling_permutation.local_regression import perform_local_regression_batch
+from modeling_permutation.price_panel import PricePanel
+from modeling_prediction import model as prediction_model
+from preprocessing.data_loading import data_loading
+from preprocessing.month_index import months_to_timestamps, with_month_index
+from preprocessing.preprocessong_controler import preprocessong_controler
+from set_up.constants import MIN_DATE, MAX_DATE
+from set_up.labels import ALL_ADMIN_LOCATIONS
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+# a value matches when |candidate - reference| <= ATOL + RTOL * |reference|
+RTOL = 1e-6
+ATOL = 1e-8
+# months forecasted by the forecasting check
+FORECAST_STEPS = 3
+
+##############################################################################################
+# reference implementations: the series by series code of the baseline the optimized engines
+# replaced. They are copies of the baseline functions (not calls into the current modules), so
+# a later change of the pipeline code cannot move the reference along with the candidate. The
+# only deliberate difference is the order of the merged local regression intervals, which the
+# baseline left to list(set(...)) and the copy sorts (see `baseline_local_regression_lists`).
+
+def series_tables(table, admin_label):
+    """split a long admin table into single column series, as the imputation steps did
+    before the panels
+
+    Args:
+        table (dataframe): long admin table with a RangeIndex
+        admin_label (String): admin level of the table
+
+    Yields:
+        tuple: row index of the series in the table, product, single column dataframe
+               indexed from 0
+    """
+    price_columns = [col for col in table.columns if col not in ["year_month", admin_label]]
+    locations = [None] if admin_label not in table.columns else pd.unique(table[admin_label])
+    for ad in locations:
+        rows = table.index if ad is None else table.index[table[admin_label] == ad]
+        for price in price_columns:
+            yield rows, price, table.loc[rows, [price]].reset_index(drop=True)
+
+def baseline_local_regression_lists(nan_indices_raw, ts_length, one_way_window=8):
+    """intervals of the local regression, copy of the baseline `local_regression_lists` (with
+    sorted merged intervals)
+
+    Args:
+        nan_indices_raw (list): indexes of the NaN values of the series
+        ts_length (int): length of the series
+        one_way_window (int, optional): half the window size. Defaults to 8.
+
+    Returns:
+        list: one list of indexes per interval
+    """
+    list_of_lists = []
+    counter = 0
+    counter_list = 0
+    nan_indices = [index for index in nan_indices_raw
+                   if index >= 1 + one_way_window and index < ts_length - one_way_window - 1]
+    for i in nan_indices:
+        new_list = list(range(i - one_way_window, i + one_way_window + 1))
+        if counter > 0:
+            # merge overlapping intervals
+            if (nan_indices[counter] - one_way_window) < list_of_lists[counter_list - 1][-1]:
+                # the baseline used list(set(...)), whose order is the one of the hash table: the
+                # intervals crossing index 32 or 64 came out rotated, and the checks of their first
+                # and last indexes looked at the wrong months. The sorted interval it documents
+                # is kept instead.
+                list_of_lists[counter_list - 1] = sorted(set(list_of_lists[counter_list - 1] + new_list))
+                counter += 1
+                continue
+        list_of_lists.append(new_list)
+        counter += 1
+        counter_list += 1
+
+    # intervals starting or ending with NaN values are dropped
+    list_of_lists = [lst for lst in list_of_lists
+                     if lst and (lst[0] not in nan_indices_raw or lst[1] not in nan_indices_raw)
+                     and (lst[-1] not in nan_indices_raw and lst[-2] not in nan_indices_raw)]
+
+    # intervals with more than 60% NaN values are dropped
+    delete_counter = 0
+    for i in range(len(list_of_lists)):
+        common_elements = set(nan_indices_raw).intersection(set(list_of_lists[i - delete_counter]))
+        if len(common_elements) > int(0.6 * len(list_of_lists[i - delete_counter])):
+            list_of_lists.pop(i - delete_counter)
+            delete_counter += 1
+    return list_of_lists
+
+def baseline_local_regression_imputation(df, one_way_window=8):
+    """local regression of a single series, copy of the baseline
+    `perform_local_regression_imputation`
+
+    Args:
+        df (dataframe): single column series indexed from 0, modified in place
+        one_way_window (int, optional): half the window size. Defaults to 8.
+    """
+    nan_indices = df[df.isna().any(axis=1)].index.tolist()
+    for indices_to_fit in baseline_local_regression_lists(nan_indices, len(df), one_way_window):
+        subset = df.loc[indices_to_fit]
+        subset_cleaned = subset.dropna()
+        x = subset_cleaned.index.astype(float)
+        y = subset_cleaned.values
+        nan_indices = subset[subset[subset.columns[0]].isna()].index
+        coefs = np.array(Polynomial.polyfit(x, y, 3)).flatten()
+        df.loc[nan_indices, df.columns[0]] = Polynomial.Polynomial(coefs)(nan_indices)
+
+def reference_local_regression(table, admin_label):
+    """local regression of every series with the baseline per-series function
+
+    Args:
+        table (dataframe): long admin table
+        admin_label (String): admin level of the table
+
+    Returns:
+        dataframe: imputed table
+    """
+    table = table.reset_index(drop=True)
+    for rows, price, single_good_admin in list(series_tables(table, admin_label)):
+        baseline_local_regression_imputation(single_good_admin)
+        table.loc[rows, price] = single_good_admin[price].values
+    return table
+
+def baseline_global_regression_imputation(df, dim = 3):
+    """global regression of a single series, copy of the baseline
+    `perform_global_regression_imputation` (its message moved from print to the log)
+
+    Args:
+        df (dataframe): single column series indexed from 0, modified in place
+        dim (int, optional): degree of the polynomial. Defaults to 3.
+    """
+    subset_cleaned = df.dropna()
+    x = subset_cleaned.index.astype(float)
+    y = subset_cleaned.values
+    if len(x) < 6:
+        log.warning("Too few measurements available. This time series will not be imputed and NaN values remain.")
+        return
+    nan_indices = df.index[df.isna()[df.columns[0]]]
+    coefs = np.array(Polynomial.polyfit(x, y, dim)).flatten()
+    df.loc[nan_indices, df.columns[0]] = Polynomial.Polynomial(coefs)(nan_indices)
+
+def reference_global_regression(table, admin_label):
+    """global regression of every series with the baseline per-series function
+
+    Args:
+        table (dataframe): long admin table
+        admin_label (String): admin level of the table
+
+    Returns:
+        dataframe: imputed table
+    """
+    table = table.reset_index(drop=True)
+    for rows, price, single_good_admin in list(series_tables(table, admin_label)):
+        baseline_global_regression_imputation(single_good_admin, dim = 3)
+        table.loc[rows, price] = single_good_admin[price].values
+    return table
+
+def reference_geo_imputation(table, admin_label, number_of_runs=2):
+    """the row by row geographic fill the admin 1 imputation started with: every NaN value
+    is replaced by the mean of the values of the 4 nearest locations in the same month,
+    fills of earlier rows are visible to the later ones
+
+    Args:
+        table (dataframe): long admin 1 table
+        admin_label (String): admin level of the table
+        number_of_runs (int, optional): how often the fill is repeated. Defaults to 2.
+
+    Returns:
+        dataframe: imputed table
+    """
+    df = table.reset_index(drop=True)
+    nearest_locations = find_nearest_cities(list(pd.unique(df[admin_label])), n = 4)
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=RuntimeWarning, message="Mean of empty slice")
+        for _ in range(number_of_runs):
+            for index, row in df.iterrows():
+                for col in df.columns:
+                    if pd.isna(row[col]):
+                        current_location = df.iloc[index][admin_label]
+                        current_date = df.iloc[index]["year_month"]
+                        nearest_locations_values = [
+                            df[(df['year_month'] == current_date) & (df[admin_label] == neighbor)][col]
+                            for neighbor in nearest_locations[current_location]]
+                        df.loc[index, col] = np.nanmean(nearest_locations_values)
+    return df
+
+def arima_inputs(table, admin_label):
+    """inputs of the ARIMA imputation: the table without NaN values (linear interpolation,
+    constant at the edges) and the table with NaN values
+
+    Args:
+        table (dataframe): long admin table
+        admin_label (String): admin level of the table
+
+    Returns:
+        PricePanel: prices without NaN values
+        PricePanel: prices with NaN values
+    """
+    nan_panel = PricePanel.from_frame(table, admin_label)
+    n_months = len(nan_panel.months)
+    series = nan_panel.values.reshape(n_months, -1)
+    filled = np.ones_like(series)  # series without any value stay at 1
+    for i in range(series.shape[1]):
+        known = np.flatnonzero(~np.isnan(series[:, i]))
+        if len(known):
+            filled[:, i] = np.interp(np.arange(n_months), known, series[known, i])
+    panel = PricePanel(filled.reshape(nan_panel.values.shape), nan_panel.months,
+                       nan_panel.locations, nan_panel.products, nan_panel.admin_label)
+    return panel, nan_panel
+
+def reference_arima_imputation(table, admin_label):
+    """ARIMA imputation of every series, one after the other and with a fresh order search,
+    as the baseline `arima_imputation_fn` did on the long tables
+
+    Args:
+        table (dataframe): long admin table
+        admin_label (String): admin level of the table
+
+    Returns:
+        dataframe: imputed table
+    """
+    panel, nan_panel = arima_inputs(table, admin_label)
+    df, nan_df = panel.to_frame(), nan_panel.to_frame()
+    price_columns = [col for col in df.columns if col not in ["year_month", admin_label]]
+    for ad in df[admin_label].unique().tolist():
+        for price in price_columns:
+            single_good_admin_copy = nan_df[nan_df[admin_label] == ad][[price]].reset_index(drop=True)
+            local_nan_indices = single_good_admin_copy.index[single_good_admin_copy[price].isna()]
+            local_nan_indices = local_nan_indices[local_nan_indices >= 5]
+
+            single_good_admin = df[df[admin_label] == ad][[price]].reset_index(drop=True)
+            log_transformed_data = np.log(single_good_admin + 1).fillna(0)
+            order = pm.auto_arima(log_transformed_data, stepwise=False, seasonal=False).order
+            model_fit = ARIMA(log_transformed_data, order=order).fit()
+            for index in local_nan_indices:
+                predicted_values = model_fit.get_prediction(start=index, end=index).predicted_mean
+                single_good_admin.iloc[index] = np.exp(predicted_values) - 1
+
+            df.loc[df[admin_label] == ad, price] = single_good_admin[price].values
+    return df
+
+def forecast_inputs(table, admin_label):
+    """table without NaN values the forecasts are trained on (see `arima_inputs`)
+
+    Args:
+        table (dataframe): long admin table
+        admin_label (String): admin level of the table
+
+    Returns:
+        dataframe: table without NaN values
+    """
+    panel, _ = arima_inputs(table, admin_label)
+    return panel.to_frame()
+
+def baseline_n_step_arima_forecast(data, n_steps):
+    """recursive ARIMA forecast, copy of the baseline `n_step_arima_forecast`: the model is
+    refitted on the history extended by every forecasted value
+
+    Args:
+        data (Series): log prices
+        n_steps (int): forecasted months
+
+    Returns:
+        list: log forecasts
+    """
+    # the baseline searched the order twice with the same settings, the search is deterministic
+    arima_params = pm.auto_arima(data, stepwise=False, seasonal=False).order
+    model_fit = ARIMA(data, order=arima_params).fit()
+    predictions = []
+    history = data.copy()
+    for _ in range(n_steps):
+        forecast = model_fit.forecast(steps=1)[0]
+        predictions.append(forecast)
+        history = np.append(history, forecast)
+        model_fit = ARIMA(history, order=arima_params).fit()
+    return predictions
+
+def reference_forecast(table, admin_label, n_steps=FORECAST_STEPS):
+    """ARIMA forecast of every (location, product) series, one after the other, without
+    order cache and with a refit after every step, as the baseline model_controler did
+
+    Args:
+        table (dataframe): long admin table
+        admin_label (String): admin level of the table
+        n_steps (int, optional): forecasted months. Defaults to FORECAST_STEPS.
+
+    Returns:
+        dataframe: forecasts (admin label, 'year_month' and product columns)
+    """
+    date_type = 'year_month'
+    df = forecast_inputs(table, admin_label)
+    df[date_type] = months_to_timestamps(df[date_type])
+    products = [col for col in df.columns if col not in [date_type, admin_label]]
+    filtered_df = df.sort_values(by=[admin_label, date_type])
+    forecasts = []
+    for city in pd.unique(filtered_df[admin_label]):
+        city_df = filtered_df[filtered_df[admin_label] == city]
+        commodity_forecast = {}
+        for commodity in products:
+            ts_data = city_df[[date_type, commodity]].set_index(date_type)[commodity]
+            ts_data = ts_data.replace(0, 1e-9).ffill().bfill()
+            ts_data_log = np.log(ts_data).replace([np.inf, -np.inf], np.nan).dropna()
+            commodity_forecast[commodity] = np.exp(baseline_n_step_arima_forecast(ts_data_log, n_steps))
+        forecast_df = pd.DataFrame(commodity_forecast)
+        forecast_df[date_type] = pd.date_range(start=ts_data.index[-1], periods=n_steps + 1,
+                                               freq='MS')[1:]
+        forecast_df[admin_label] = city
+        forecasts.append(forecast_df[[admin_label, date_type] + products])
+    return pd.concat(forecasts, ignore_index=True)
+
+##############################################################################################
+# candidate engines: the optimized code paths of the pipeline
+
+def candidate_local_regression(table, admin_label):
+    """local regression of all series at once (`perform_local_regression_batch`)"""
+    panel = PricePanel.from_frame(table, admin_label)
+    perform_local_regression_batch(panel.values.reshape(len(panel.months), -1))
+    return panel.to_frame()
+
+def candidate_global_regression(table, admin_label):
+    """global regression of all series at once (`perform_global_regression_batch`)"""
+    panel = PricePanel.from_frame(table, admin_label)
+    perform_global_regression_batch(panel.values.reshape(len(panel.months), -1), dim = 3)
+    return panel.to_frame()
+
+def candidate_geo_imputation(table, admin_label):
+    """geographic fill on the price cube (`perform_geo_imputation`)"""
+    nearest_locations = find_nearest_cities(list(pd.unique(table[admin_label])), n = 4)
+    return perform_geo_imputation(table, admin_label, nearest_locations)
+
+def candidate_arima_imputation(table, admin_label):
+    """ARIMA imputation in a process pool, with an order cache (`arima_imputation_panel`)"""
+    panel, nan_panel = arima_inputs(table, admin_label)
+    with isolated_working_directory() as directory:
+        order_cache = ArimaOrderCache(adrs=str(directory / 'arima_order_cache.json'))
+        panel, _ = arima_imputation_panel(panel, nan_panel, order_cache=order_cache)
+    return panel.to_frame()
+
+def candidate_forecast(table, admin_label, n_steps=FORECAST_STEPS, refit=True):
+    """batch forecast in a process pool, with an order cache (`model_controler`), refitting
+    after every step as the baseline did
+
+    Args:
+        table (dataframe): long admin table
+        admin_label (String): admin level of the table
+        n_steps (int, optional): forecasted months. Defaults to FORECAST_STEPS.
+        refit (bool, optional): refit the models after every step. Defaults to True.
+
+    Returns:
+        dataframe: forecasts (admin label, 'year_month' and product columns)
+    """
+    df = forecast_inputs(table, admin_label)
+    products = [col for col in df.columns if col not in ['year_month', admin_label]]
+    # model_controler reads and writes the order cache of the data folder
+    with isolated_working_directory():
+        return prediction_model.model_controler(df, admin_label, list(pd.unique(df[admin_label])),
+                                                products, n_steps=n_steps, refit=refit)
+
+def candidate_forecast_single_fit(table, admin_label, n_steps=FORECAST_STEPS):
+    """batch forecast of the whole horizon from a single fit (FORECAST_REFIT_EACH_STEP = False)"""
+    return candidate_forecast(table, admin_label, n_steps, refit=False)
+
+# check -> reference, default candidate, admin levels it runs on, whether it fits models
+# and the relative tolerance when it differs from RTOL
+CHECKS = {
+    'local_regression': {'reference': reference_local_regression,
+                         'candidate': candidate_local_regression, 'levels': None, 'slow': False},
+    'global_regression': {'reference': reference_global_regression,
+                          'candidate': candidate_global_regression, 'levels': None, 'slow': False},
+    # the nearest locations are only known for the admin 1 locations
+    'geo_imputation': {'reference': reference_geo_imputation,
+                       'candidate': candidate_geo_imputation, 'levels': ['admin1_label'],
+                       'slow': False},
+    'arima_imputation': {'reference': reference_arima_imputation,
+                         'candidate': candidate_arima_imputation, 'levels': ['admin1_label'],
+                         'slow': True},
+    'forecast': {'reference': reference_forecast, 'candidate': candidate_forecast,
+                 'levels': ['admin1_label'], 'slow': True},
+    # forecasting the horizon from a single fit is an approximation of the refit loop: the
+    # forecasts of the fixtures move by up to 8e-4 relative, larger drifts are reported
+    'forecast_single_fit': {'reference': reference_forecast,
+                            'candidate': candidate_forecast_single_fit,
+                            'levels': ['admin1_label'], 'slow': True, 'rtol': 1e-2},
+}
+
+##############################################################################################
+# fixtures
+
+# gap patterns of the edge case fixture, as (start, stop) fractions of the months
+EDGE_CASE_GAPS = {
+    'complete': [],
+    'leading_gap': [(0, 0.2)],
+    'trailing_gap': [(0.85, 1)],
+    'both_edges': [(0, 0.1), (0.9, 1)],
+    'short_gaps': [(0.3, 0.33), (0.6, 0.62)],
+    'long_gap': [(0.3, 0.7)],
+    'first_and_last_month': [(0, 1 / 60), (59 / 60, 1)],
+    'sparse': [(0, 0.45), (0.5, 0.95)],
+    'empty': [(0, 1)],
+}
+
+def edge_case_fixture(n_months=60, n_products=3, seed=0):
+    """hand made admin 1 table with the gap patterns of EDGE_CASE_GAPS (gaps at the first and
+    last months, long gaps, series with too few or no values). The patterns rotate over the
+    (location, product) series
+
+    Args:
+        n_months (int, optional): number of months. Defaults to 60.
+        n_products (int, optional): number of products. Defaults to 3.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        dataframe: long admin 1 table
+    """
+    rng = np.random.default_rng(seed)
+    locations = [name for name in ALL_ADMIN_LOCATIONS['admin1_label'] if name]
+    products = ['bulgur_price', 'rice_price', 'sugar_price', 'salt_price'][:n_products]
+    months = np.arange(n_months, dtype=np.int32) + 552  # from 2016-01
+    trend = np.exp(np.linspace(0, 1.5, n_months))
+    patterns = list(EDGE_CASE_GAPS.values())
+
+    values = np.empty((n_months, len(locations), len(products)))
+    for i in range(len(locations)):
+        for j in range(len(products)):
+            series = 100 * (j + 1) * trend * np.exp(rng.normal(0, 0.05, n_months))
+            for start, stop in patterns[(i * len(products) + j) % len(patterns)]:
+                series[int(round(start * n_months)):int(round(stop * n_months))] = np.nan
+            values[:, i, j] = series
+    return PricePanel(values, months, locations, products, 'admin1_label').to_frame()
+
+def raw_admin_fixtures(raw_data, levels=('admin1_label', 'admin2_label', 'admin3_label')):
+    """raw admin tables of the pipeline (monthly means before the imputation)
+
+    Args:
+        raw_data (dataframe): raw submissions
+        levels (tuple, optional): admin levels to keep.
+                                  Defaults to ('admin1_label', 'admin2_label', 'admin3_label').
+
+    Returns:
+        dictionary: admin level -> long admin table
+    """
+    _, raw_admins = preprocessong_controler(raw_data, min_date=MIN_DATE, max_date=MAX_DATE)
+    return {level: raw_admins[level] for level in levels if level in raw_admins}
+
+def build_fixtures(raw_adrs=None, seed=0):
+    """fixtures of the checks: the edge case table and the raw admin tables of a synthetic
+    panel the size of the Syria panel (or of a raw data file)
+
+    Args:
+        raw_adrs (String, optional): raw data file used instead of the synthetic panel.
+                                     Defaults to None.
+        seed (int, optional): seed of the synthetic panel. Defaults to 0.
+
+    Returns:
+        dictionary: fixture name -> (long table, admin level)
+    """
+    fixtures = {'edge_cases': (edge_case_fixture(seed=seed), 'admin1_label')}
+    if raw_adrs is None:
+        panel_settings = scaled_panel_settings(1)
+        with benchmark_configuration(panel_settings, seed):
+            tables = raw_admin_fixtures(generate_market_panel(**panel_settings, seed=seed))
+        prefix = 'synthetic'
+    else:
+        tables = raw_admin_fixtures(with_month_index(data_loading(raw_adrs)))
+        prefix = Path(raw_adrs).stem
+    for level, table in tables.items():
+        fixtures[f'{prefix}_{level}'] = (table, level)
+    return fixtures
+
+def subset_fixture(table, admin_label, n_locations, n_products):
+    """first locations and products of a table, for the checks that fit models
+
+    Args:
+        table (dataframe): long admin table
+        admin_label (String): admin level of the table
+        n_locations (int): number of locations kept
+        n_products (int): number of products kept
+
+    Returns:
+        dataframe: smaller table
+    """
+    products = [col for col in table.columns if col not in ['year_month', admin_label]]
+    locations = pd.unique(table[admin_label])[:n_locations]
+    table = table[table[admin_label].isin(locations)]
+    return table[['year_month', admin_label] + products[:n_products]].reset_index(drop=True)
+
+##############################################################################################
+# comparison
+
+def compare_frames(reference, candidate, rtol=RTOL, atol=ATOL):
+    """compare two long tables row by row (matched on 'year_month' and the admin label) and
+    column by column
+
+    Args:
+        reference (dataframe): output of the reference implementation
+        candidate (dataframe): output of the candidate engine
+        rtol (float, optional): relative tolerance. Defaults to RTOL.
+        atol (float, optional): absolute tolerance. Defaults to ATOL.
+
+    Returns:
+        dataframe: one row per column with the largest absolute and relative difference, the
+                   number of cells that are NaN in only one of the outputs and the verdict
+    """
+    keys = [col for col in reference.columns
+            if col == 'year_month' or col.startswith('admin') and col.endswith('_label')]
+    columns = [col for col in reference.columns if col not in keys]
+    merged = reference.merge(candidate, on=keys, how='outer', suffixes=('_reference', '_candidate'),
+                             indicator=True)
+    unmatched = int((merged['_merge'] != 'both').sum())
+
+    rows = []
+    for col in columns:
+        if col not in candidate.columns:
+            rows.append({'column': col, 'max_abs_diff': np.nan, 'max_rel_diff': np.nan,
+                         'nan_mismatches': len(reference), 'unmatched_rows': unmatched,
+                         'equivalent': False})
+            continue
+        expected = merged[col + '_reference'].to_numpy(dtype=np.float64)
+        actual = merged[col + '_candidate'].to_numpy(dtype=np.float64)
+        both = ~np.isnan(expected) & ~np.isnan(actual)
+        difference = np.abs(actual[both] - expected[both])
+        scale = np.abs(expected[both])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = np.where(scale > 0, difference / scale, np.where(difference > 0, np.inf, 0))
+        nan_mismatches = int((np.isnan(expected) != np.isnan(actual)).sum())
+        rows.append({'column': col,
+                     'max_abs_diff': difference.max(initial=0.0),
+                     'max_rel_diff': relative.max(initial=0.0),
+                     'nan_mismatches': nan_mismatches, 'unmatched_rows': unmatched,
+                     'equivalent': bool(nan_mismatches == 0 and unmatched == 0
+                                        and (difference <= atol + rtol * scale).all())})
+    return pd.DataFrame(rows)
+
+def timed_call(function, *args):
+    """run a function and measure its duration
+
+    Args:
+        function (callable): function to run
+        *args: arguments of the function
+
+    Returns:
+        output of the function
+        float: seconds spent
+    """
+    start = time.perf_counter()
+    output = function(*args)
+    return output, time.perf_counter() - start
+
+def run_check(check, table, admin_label, candidate=None, rtol=None, atol=ATOL):
+    """run the reference and the candidate of a check on a fixture
+
+    Args:
+        check (String): name of the check (key of CHECKS)
+        table (dataframe): long admin table
+        admin_label (String): admin level of the table
+        candidate (callable, optional): engine taking (table, admin_label) and returning the
+                                        imputed table. Defaults to the pipeline engine of the check.
+        rtol (float, optional): relative tolerance. Defaults to the one of the check.
+        atol (float, optional): absolute tolerance. Defaults to ATOL.
+
+    Returns:
+        dataframe: comparison per column (see `compare_frames`) with the seconds spent by the
+                   reference and the candidate and the speedup
+    """
+    candidate = candidate or CHECKS[check]['candidate']
+    rtol = rtol if rtol is not None else CHECKS[check].get('rtol', RTOL)
+    log.info("running the reference of %s", check)
+    reference_output, reference_seconds = timed_call(CHECKS[check]['reference'], table.copy(),
+                                                     admin_label)
+    log.info("running the candidate of %s", check)
+    candidate_output, candidate_seconds = timed_call(candidate, table.copy(), admin_label)
+
+    report = compare_frames(reference_output, candidate_output, rtol, atol)
+    report.insert(0, 'check', check)
+    report['reference_seconds'] = reference_seconds
+    report['candidate_seconds'] = candidate_seconds
+    report['speedup'] = reference_seconds / candidate_seconds if candidate_seconds else np.inf
+    return report
+
+def assert_equivalent(check, table, admin_label, candidate=None, rtol=None, atol=ATOL):
+    """test helper: raise if the candidate of a check does not match the reference
+
+    Args:
+        check (String): name of the check (key of CHECKS)
+        table (dataframe): long admin table
+        admin_label (String): admin level of the table
+        candidate (callable, optional): engine to test. Defaults to the pipeline engine.
+        rtol (float, optional): relative tolerance. Defaults to the one of the check.
+        atol (float, optional): absolute tolerance. Defaults to ATOL.
+
+    Raises:
+        AssertionError: some columns do not match, with the comparison as message
+
+    Returns:
+        dataframe: the comparison
+    """
+    report = run_check(check, table, admin_label, candidate, rtol, atol)
+    if not report['equivalent'].all():
+        raise AssertionError(f"{check} does not match its reference:\n"
+                             f"{report[~report['equivalent']].to_string(index=False)}")
+    return report
+
+def run_equivalence(checks=None, candidates=None, fixtures=None, n_locations=2, n_products=2,
+                    rtol=None, atol=ATOL):
+    """run checks on all the fixtures they apply to
+
+    Args:
+        checks (list, optional): checks to run. Defaults to the ones that do not fit models.
+        candidates (dictionary, optional): check -> candidate engine replacing the pipeline one.
+                                           Defaults to None.
+        fixtures (dictionary, optional): output of `build_fixtures`. Defaults to None (built).
+        n_locations (int, optional): locations of the fixtures of the model fitting checks.
+                                     Defaults to 2.
+        n_products (int, optional): products of the fixtures of the model fitting checks.
+                                    Defaults to 2.
+        rtol (float, optional): relative tolerance. Defaults to the one of every check.
+        atol (float, optional): absolute tolerance. Defaults to ATOL.
+
+    Returns:
+        dataframe: comparison of every check, fixture and column
+    """
+    checks = checks or [name for name, check in CHECKS.items() if not check['slow']]
+    candidates = candidates or {}
+    fixtures = fixtures if fixtures is not None else build_fixtures()
+    reports = []
+    for check in checks:
+        for fixture, (table, admin_label) in fixtures.items():
+            levels = CHECKS[check]['levels']
+            if levels is not None and admin_label not in levels:
+                continue
+            if CHECKS[check]['slow']:
+                table = subset_fixture(table, admin_label, n_locations, n_products)
+            report = run_check(check, table, admin_label, candidates.get(check), rtol, atol)
+            report.insert(1, 'fixture', fixture)
+            reports.append(report)
+    return pd.concat(reports, ignore_index=True)
+
+def load_candidate(specification):
+    """import a candidate engine given as 'check=module:function'
+
+    Args:
+        specification (String): check and engine
+
+    Returns:
+        String: name of the check
+        callable: the engine
+    """
+    check, _, target = specification.partition('=')
+    module_name, _, function_name = target.partition(':')
+    if check not in CHECKS or not function_name:
+        raise ValueError(f"candidates are given as check=module:function with a check of "
+                         f"{list(CHECKS)}, got {specification}")
+    return check, getattr(importlib.import_module(module_name), function_name)
+
+def parse_arguments():
+    """read the command line options
+
+    Returns:
+        argparse.Namespace: parsed options
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checks', nargs='+', choices=list(CHECKS),
+                        help="checks to run (default: the ones that do not fit models)")
+    parser.add_argument('--candidate', action='append', default=[],
+                        help="engine replacing the pipeline one, as check=module:function")
+    parser.add_argument('--raw', help="raw data file used instead of the synthetic panel")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic fixtures")
+    parser.add_argument('--locations', type=int, default=2,
+                        help="locations of the fixtures of the model fitting checks")
+    parser.add_argument('--products', type=int, default=2,
+                        help="products of the fixtures of the model fitting checks")
+    parser.add_argument('--rtol', type=float,
+                        help=f"relative tolerance (default: {RTOL}, or the one of the check)")
+    parser.add_argument('--atol', type=float, default=ATOL, help="absolute tolerance")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    warnings.filterwarnings('ignore')
+    logging.basicConfig(format="{asctime} - {filename} - {message}", style="{",
+                        datefmt="%Y-%m-%d %H:%M:%S", level=logging.INFO)
+    arguments = parse_arguments()
+    results = run_equivalence(arguments.checks,
+                              dict(load_candidate(spec) for spec in arguments.candidate),
+                              build_fixtures(arguments.raw, arguments.seed),
+                              arguments.locations, arguments.products,
+                              arguments.rtol, arguments.atol)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(results.to_string(index=False))
+    failed = results[~results['equivalent']]
+    if len(failed):
+        print(f"\n{len(failed)} columns do not match their reference")
+        sys.exit(1)
+    print("\nall checks match their reference")
@@ -0,0 +1,350 @@
+"""
+    benchmark suite: times the pipeline stages on synthetic panels of several sizes and appends
+    the timings to a local history file, so the slowdowns between commits show up.
+
+    run from the src folder:
+        python -m benchmarking.run_benchmarks [--scales 1 5 20] [--until imputation]
+
+    the 20x panel is not part of the default scales, it needs about 10 GB of memory
+"""
+import argparse
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
+import os
+from pathlib import Path
+import platform
+import subprocess
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from benchmarking.synthetic_panel import location_coordinates, location_hierarchy, \
+    scaled_panel_settings, write_market_panel, PRODUCT_COLUMNS
+from preprocessing.data_loading import data_loading
+from preprocessing.preprocessong_controler import preprocessong_controler
+from modeling_permutation.finding_nearest_cities import CITY_COORDINATES
+from modeling_permutation.imputation_controler import imput_controler
+from modeling_prediction.prediction_controler import prediction_controler
+from results.visualization import visualization_conroler
+from set_up.addresses_constants import ADRS_BENCHMARK_HISTORY
+from set_up.constants import ADMIN_LOCATIONS, PRODUCTS_LABELS, MIN_DATE, MAX_DATE, N_MONTHS, \
+    PREDICT_ADMIN, PREDICT_CITIES, PREDICT_PRODUCTS, BENCHMARK_SCALES, \
+        BENCHMARK_REGRESSION_TOLERANCE
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+# stages in the order they run, a stage needs the output of the ones before it
+BENCHMARK_STAGES = ['loading', 'preprocessing', 'imputation', 'prediction', 'visualization']
+
+@contextmanager
+def benchmark_configuration(panel_settings, seed=0):
+    """point the pipeline configuration to the locations and products of a synthetic panel.
+    ADMIN_LOCATIONS and PRODUCTS_LABELS are shared by all modules, they are changed in place
+    and restored afterwards, also when the run fails. The coordinates of the synthetic admin 1
+    locations are added to CITY_COORDINATES the same way, so the geographic imputation finds
+    neighbours for all of them
+
+    Args:
+        panel_settings (dictionary): settings of the synthetic panel
+        seed (int, optional): seed of the panel. Defaults to 0.
+    """
+    markets = location_hierarchy(panel_settings['n_admin1'], panel_settings['n_admin2'],
+                                 panel_settings['n_admin3'], seed)
+    coordinates = location_coordinates(panel_settings['n_admin1'], seed)
+    n_products = panel_settings.get('n_products', len(PRODUCT_COLUMNS))
+    saved_locations, saved_products = dict(ADMIN_LOCATIONS), list(PRODUCTS_LABELS)
+    saved_coordinates = dict(CITY_COORDINATES)
+    try:
+        CITY_COORDINATES.update(coordinates)
+        for admin_label in ('admin1_label', 'admin2_label', 'admin3_label'):
+            if admin_label in ADMIN_LOCATIONS:
+                ADMIN_LOCATIONS[admin_label] = list(pd.unique(markets[admin_label]))
+        PRODUCTS_LABELS[:] = [label for label in saved_products
+                              if label in PRODUCT_COLUMNS[:n_products]]
+        yield
+    finally:
+        ADMIN_LOCATIONS.clear()
+        ADMIN_LOCATIONS.update(saved_locations)
+        PRODUCTS_LABELS[:] = saved_products
+        CITY_COORDINATES.clear()
+        CITY_COORDINATES.update(saved_coordinates)
+
+@contextmanager
+def isolated_working_directory():
+    """run in an empty temporary 'src' folder. The relative addresses of the pipeline ('./../data')
+    then point into the temporary folder, so the runs start without order cache, stage cache or
+    earlier exports and leave the data folder of the repository untouched
+
+    Yields:
+        Path: the temporary folder
+    """
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as directory:
+        working_directory = Path(directory) / 'src'
+        working_directory.mkdir()
+        os.chdir(working_directory)
+        try:
+            yield Path(directory)
+        finally:
+            os.chdir(previous)
+
+def git_revision():
+    """commit of the working tree
+
+    Returns:
+        String: commit hash (None outside of a git repository)
+        bool: the working tree has uncommitted changes
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status.strip())
+
+def environment():
+    """versions and machine the timings depend on
+
+    Returns:
+        dictionary: description of the environment
+    """
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+def cpu_seconds():
+    """CPU time of the process and of its finished worker processes
+
+    Returns:
+        float: seconds
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def run_stages(raw_adrs, until='visualization'):
+    """run the pipeline stages on a raw file, as main.py does for the task choice 2
+    (imputation and prediction)
+
+    Args:
+        raw_adrs (String): raw csv
+        until (String, optional): last stage to run. Defaults to 'visualization'.
+
+    Returns:
+        dictionary: stage -> {'wall_seconds', 'cpu_seconds'} (the CPU time includes the
+                    process pools of the stage)
+    """
+    stages = BENCHMARK_STAGES[:BENCHMARK_STAGES.index(until) + 1]
+    timings = {}
+
+    def timed(stage, function, *args, **kwargs):
+        log.info("benchmarking the %s stage", stage)
+        wall_start, cpu_start = time.perf_counter(), cpu_seconds()
+        with instrumentation.measure(stage):
+            output = function(*args, **kwargs)
+        timings[stage] = {'wall_seconds': time.perf_counter() - wall_start,
+                          'cpu_seconds': cpu_seconds() - cpu_start}
+        return output
+
+    raw_data = timed('loading', data_loading, raw_adrs)
+    if 'preprocessing' in stages:
+        outlierless_data, admin_raw_data = timed('preprocessing', preprocessong_controler, raw_data,
+                                                 min_date=MIN_DATE, max_date=MAX_DATE)
+    if 'imputation' in stages:
+        _, imputed_data = timed('imputation', imput_controler, outlierless_data, admin_raw_data)
+    predicted_data = defaultdict(lambda: None)
+    if 'prediction' in stages:
+        predicted_data[PREDICT_ADMIN] = timed('prediction', prediction_controler,
+                                              imputed_data[PREDICT_ADMIN], PREDICT_ADMIN,
+                                              PREDICT_CITIES, PREDICT_PRODUCTS, N_MONTHS)
+    if 'visualization' in stages:
+        timed('visualization', visualization_conroler, 2, admin_raw_data, imputed_data,
+              predicted_data)
+    return timings
+
+def benchmark_scale(scale, until='visualization', repeat=1, seed=0, **overrides):
+    """time the stages on a synthetic panel of a given size
+
+    Args:
+        scale (float): size relative to the Syria panel
+        until (String, optional): last stage to run. Defaults to 'visualization'.
+        repeat (int, optional): number of runs, the fastest one is kept. Defaults to 1.
+        seed (int, optional): seed of the panel. Defaults to 0.
+        **overrides: settings of the panel replacing the scaled ones (see `generate_market_frames`)
+
+    Returns:
+        dictionary: history record of the scale
+    """
+    panel_settings = {**scaled_panel_settings(scale), **overrides, 'seed': seed}
+    with isolated_working_directory() as directory, \
+            benchmark_configuration(panel_settings, seed):
+        raw_adrs = str(directory / 'raw.csv')
+        start = time.perf_counter()
+        n_rows = write_market_panel(raw_adrs, **panel_settings)
+        generation_seconds = time.perf_counter() - start
+
+        runs = []
+        for _ in range(repeat):
+            # tracing the allocations would slow down the timed stages
+            instrumentation.start_run(trace_memory=False)
+            timings = run_stages(raw_adrs, until)
+            runs.append({'stages': timings,
+                         'substages': {record['stage']: record['wall_seconds']
+                                       for record in instrumentation.run_report()['stages']
+                                       if record['stage'] not in timings}})
+
+    # the fastest run of every stage, with the sub-stages of that run
+    stages = {}
+    for stage in runs[0]['stages']:
+        fastest = min(runs, key=lambda run, stage=stage: run['stages'][stage]['wall_seconds'])
+        stages[stage] = dict(fastest['stages'][stage])
+        stages[stage]['substages'] = {name: seconds for name, seconds in fastest['substages'].items()
+                                      if name.startswith(stage + '.')}
+    commit, dirty = git_revision()
+    return {'date': datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'dirty': dirty, 'scale': scale, 'panel': panel_settings, 'rows': n_rows,
+            'repeat': repeat, 'generation_seconds': generation_seconds,
+            'max_rss_bytes': instrumentation.max_rss_bytes(), 'environment': environment(),
+            'stages': stages}
+
+def load_history(adrs=ADRS_BENCHMARK_HISTORY):
+    """read the benchmark history
+
+    Args:
+        adrs (String, optional): history file. Defaults to ADRS_BENCHMARK_HISTORY.
+
+    Returns:
+        list: records, oldest first
+    """
+    if not Path(adrs).is_file():
+        return []
+    with open(adrs, encoding='utf-8') as history_file:
+        return [json.loads(line) for line in history_file if line.strip()]
+
+def append_history(record, adrs=ADRS_BENCHMARK_HISTORY):
+    """append a record to the benchmark history
+
+    Args:
+        record (dictionary): output of `benchmark_scale`
+        adrs (String, optional): history file. Defaults to ADRS_BENCHMARK_HISTORY.
+    """
+    Path(adrs).parent.mkdir(parents=True, exist_ok=True)
+    with open(adrs, 'a', encoding='utf-8') as history_file:
+        history_file.write(json.dumps(record, default=str) + '\n')
+
+def previous_record(record, history):
+    """latest earlier record of the same panel and machine, from another commit if there is one
+
+    Args:
+        record (dictionary): new record
+        history (list): earlier records, oldest first
+
+    Returns:
+        dictionary: record to compare with (None if there is none)
+    """
+    comparable = [old for old in history if old['panel'] == record['panel']
+                  and old['environment'] == record['environment']]
+    other_commits = [old for old in comparable if old['commit'] != record['commit']]
+    if other_commits:
+        return other_commits[-1]
+    return comparable[-1] if comparable else None
+
+def compare(record, previous, tolerance=BENCHMARK_REGRESSION_TOLERANCE):
+    """compare the stage timings of a record with an earlier one
+
+    Args:
+        record (dictionary): new record
+        previous (dictionary): earlier record (or None)
+        tolerance (float, optional): slowdown factor flagged as regression.
+                                    Defaults to BENCHMARK_REGRESSION_TOLERANCE.
+
+    Returns:
+        dataframe: one row per stage with the seconds, the ratio to the earlier record and
+                   the regression flag
+    """
+    rows = []
+    for stage, timing in record['stages'].items():
+        before = None if previous is None else previous['stages'].get(stage, {}).get('wall_seconds')
+        ratio = None if before is None else timing['wall_seconds'] / before
+        rows.append({'scale': record['scale'], 'stage': stage,
+                     'seconds': timing['wall_seconds'], 'cpu_seconds': timing['cpu_seconds'],
+                     'previous_seconds': before, 'ratio': ratio,
+                     'regression': ratio is not None and ratio > tolerance})
+    return pd.DataFrame(rows)
+
+def run_benchmarks(scales=BENCHMARK_SCALES, until='visualization', repeat=1, seed=0,
+                   history_adrs=ADRS_BENCHMARK_HISTORY, **overrides):
+    """benchmark all scales, append the records to the history and compare them with the
+    previous ones
+
+    Args:
+        scales (list, optional): sizes relative to the Syria panel. Defaults to BENCHMARK_SCALES.
+        until (String, optional): last stage to run. Defaults to 'visualization'.
+        repeat (int, optional): runs per scale, the fastest one is kept. Defaults to 1.
+        seed (int, optional): seed of the panels. Defaults to 0.
+        history_adrs (String, optional): history file. Defaults to ADRS_BENCHMARK_HISTORY.
+        **overrides: settings of the panels replacing the scaled ones
+
+    Returns:
+        dataframe: comparison of every scale and stage (see `compare`)
+    """
+    # the runs change the working directory
+    history_adrs = str(Path(history_adrs).resolve())
+    comparisons = []
+    for scale in scales:
+        log.info("benchmarking the %sx panel", scale)
+        record = benchmark_scale(scale, until, repeat, seed, **overrides)
+        comparison = compare(record, previous_record(record, load_history(history_adrs)))
+        append_history(record, history_adrs)
+        comparisons.append(comparison)
+        for _, row in comparison[comparison['regression']].iterrows():
+            log.warning("%s stage at %sx is %.2f times slower than before (%.2f s -> %.2f s)",
+                        row['stage'], scale, row['ratio'], row['previous_seconds'],
+                        row['seconds'])
+    return pd.concat(comparisons, ignore_index=True)
+
+def parse_arguments():
+    """read the command line options
+
+    Returns:
+        argparse.Namespace: parsed options
+    """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', type=float, default=BENCHMARK_SCALES,
+                        help="panel sizes relative to the Syria panel")
+    parser.add_argument('--until', default='visualization', choices=BENCHMARK_STAGES,
+                        help="last stage to run")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="runs per scale, the fastest one is kept")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic panels")
+    parser.add_argument('--months', type=int, help="number of months of the panels")
+    parser.add_argument('--products', type=int, help="number of products of the panels")
+    parser.add_argument('--missing-rate', type=float,
+                        help="share of the (admin 1, product, month) cells without prices")
+    parser.add_argument('--outlier-rate', type=float, help="share of the outlying prices")
+    parser.add_argument('--history', default=ADRS_BENCHMARK_HISTORY, help="history file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    warnings.filterwarnings('ignore')
+    logging.basicConfig(format="{asctime} - {filename} - {message}", style="{",
+                        datefmt="%Y-%m-%d %H:%M:%S", level=logging.INFO)
+    arguments = parse_arguments()
+    panel_overrides = {name: value for name, value in
+                       {'n_months': arguments.months, 'n_products': arguments.products,
+                        'missing_rate': arguments.missing_rate,
+                        'outlier_rate': arguments.outlier_rate}.items() if value is not None}
+    results = run_benchmarks([int(scale) if float(scale).is_integer() else scale
+                              for scale in arguments.scales],
+                             arguments.until, arguments.repeat, arguments.seed,
+                             arguments.history, **panel_overrides)
+    print(results.to_string(index=False, float_format='{:.3f}'.format))
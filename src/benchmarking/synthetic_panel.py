@@ -0,0 +1,224 @@
+"""
+    synthetic market panels for the benchmarks. The generated raw data has the schema of the
+    JMMI export read by `isolate_relevant_goods_columns` (one row per market submission), with
+    configurable numbers of months, admin 1 / 2 / 3 locations, products, missing values and
+    outliers
+"""
+import calendar
+import logging
+
+import numpy as np
+import pandas as pd
+
+from modeling_permutation.finding_nearest_cities import CITY_COORDINATES
+from preprocessing.data_cleaning import RELEVANT_COLUMNS
+from preprocessing.month_index import month_range, parse_month
+from set_up.labels import ALL_ADMIN_LOCATIONS, ALL_PRODUCTS_LABELS
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+# size of the Syria panel of the 2015-03 to 2024-04 export (231962 submissions)
+SYRIA_PANEL = {'n_months': 110, 'n_admin1': 12, 'n_admin2': 37, 'n_admin3': 122,
+               'submissions_per_month': 17}
+FIRST_MONTH = '2015-03'
+# largest shift (degrees of latitude / longitude) of a numbered copy from its real location
+COORDINATE_JITTER = 0.25
+
+# product columns in the order of the raw export
+PRODUCT_COLUMNS = [label for label in RELEVANT_COLUMNS if label in ALL_PRODUCTS_LABELS]
+
+def scaled_panel_settings(scale):
+    """generator settings of a panel `scale` times the size of the Syria panel. The number
+    of locations of every admin level grows with the scale, the months and the number of
+    submissions per market and month stay the same
+
+    Args:
+        scale (float): size relative to the Syria panel
+
+    Returns:
+        dictionary: keyword arguments of `generate_market_panel`
+    """
+    settings = dict(SYRIA_PANEL)
+    for admin in ('n_admin1', 'n_admin2', 'n_admin3'):
+        settings[admin] = max(1, int(round(SYRIA_PANEL[admin] * scale)))
+    # every location has a parent location
+    settings['n_admin2'] = max(settings['n_admin2'], settings['n_admin1'])
+    settings['n_admin3'] = max(settings['n_admin3'], settings['n_admin2'])
+    return settings
+
+def location_names(admin_label, count):
+    """names of the synthetic locations of an admin level. The real location names are used
+    first (so the configured prediction cities and the admin 1 coordinates exist), numbered
+    copies of them after that (see `location_coordinates` for their coordinates)
+
+    Args:
+        admin_label (String): admin level
+        count (int): number of locations
+
+    Returns:
+        list: location names
+    """
+    known = [name for name in ALL_ADMIN_LOCATIONS[admin_label] if name]
+    return [known[i % len(known)] if i < len(known) else f"{known[i % len(known)]} {i // len(known) + 1}"
+            for i in range(count)]
+
+def location_coordinates(n_admin1, seed=0):
+    """coordinates of the numbered copies of the admin 1 locations (see `location_names`),
+    used to find their nearest locations in the geographic imputation. A copy gets the
+    coordinates of its real location, shifted by up to COORDINATE_JITTER degrees
+
+    Args:
+        n_admin1 (int): number of admin 1 locations
+        seed (int, optional): seed of the shifts. Defaults to 0.
+
+    Returns:
+        dictionary: name -> (latitude, longitude) of the copies (empty up to 12 locations)
+    """
+    known = [name for name in ALL_ADMIN_LOCATIONS['admin1_label'] if name]
+    copies = location_names('admin1_label', n_admin1)[len(known):]
+    shifts = np.random.default_rng(seed).uniform(-COORDINATE_JITTER, COORDINATE_JITTER,
+                                                 (len(copies), 2))
+    return {name: tuple(np.add(CITY_COORDINATES[known[i % len(known)]], shift).tolist())
+            for i, (name, shift) in enumerate(zip(copies, shifts))}
+
+def location_hierarchy(n_admin1, n_admin2, n_admin3, seed=0):
+    """admin 1 / 2 / 3 labels and codes of the synthetic markets, one row per admin 3
+    location. The children are spread over their parents in turn, so every parent has at least
+    one child
+
+    Args:
+        n_admin1 (int): number of admin 1 locations
+        n_admin2 (int): number of admin 2 locations (at least n_admin1)
+        n_admin3 (int): number of admin 3 locations (at least n_admin2)
+        seed (int, optional): seed of the urban / rural flags. Defaults to 0.
+
+    Returns:
+        dataframe: admin codes and labels of the markets
+    """
+    if not n_admin1 <= n_admin2 <= n_admin3:
+        raise ValueError("every admin 2 / 3 location needs a parent: "
+                         "n_admin1 <= n_admin2 <= n_admin3 is required")
+    parent2 = np.arange(n_admin2) % n_admin1
+    parent3 = np.arange(n_admin3) % n_admin2
+    admin3_label = np.asarray(location_names('admin3_label', n_admin3), dtype=object)
+    admin2_label = np.asarray(location_names('admin2_label', n_admin2), dtype=object)[parent3]
+    admin1_label = np.asarray(location_names('admin1_label', n_admin1), dtype=object)[parent2[parent3]]
+    admin1_code = np.char.add('SY', np.char.zfill((parent2[parent3] + 1).astype(str), 2))
+    admin2_code = np.char.add(admin1_code, np.char.zfill(parent3.astype(str), 2))
+    admin3_code = np.char.add(admin2_code, np.char.zfill(np.arange(n_admin3).astype(str), 3))
+    urban = np.random.default_rng(seed).random(n_admin3) < 0.3
+    return pd.DataFrame({'admin1_code': admin1_code.astype(object), 'admin1_label': admin1_label,
+                         'admin2_code': admin2_code.astype(object), 'admin2_label': admin2_label,
+                         'admin3_code': admin3_code.astype(object), 'admin3_label': admin3_label,
+                         'admin4_code': np.char.add('C', admin3_code).astype(object),
+                         'admin4_label': admin3_label,
+                         'urban_rural': np.where(urban, 'urban', 'rural').astype(object)})
+
+def generate_market_frames(n_months=SYRIA_PANEL['n_months'], n_admin1=SYRIA_PANEL['n_admin1'], # pylint: disable=too-many-arguments, too-many-locals
+                           n_admin2=SYRIA_PANEL['n_admin2'], n_admin3=SYRIA_PANEL['n_admin3'],
+                           n_products=len(PRODUCT_COLUMNS),
+                           submissions_per_month=SYRIA_PANEL['submissions_per_month'],
+                           missing_rate=0.55, empty_price_rate=0.8, gap_rate=0.1,
+                           month_gap_rate=0.05, outlier_rate=0.01, first_month=FIRST_MONTH, seed=0):
+    """generate the raw submissions month by month, so large panels can be written to a file
+    without holding them in memory.
+
+    The log price of a product follows a random walk with drift (the inflation), shifted by a
+    fixed offset per market; every submission adds noise around it. As in the real data, a
+    product is only reported by the markets of an admin 1 region from some month on, and the
+    submissions only carry a few of the products.
+
+    Args:
+        n_months (int, optional): number of months. Defaults to 110.
+        n_admin1 (int, optional): number of admin 1 locations. Defaults to 12.
+        n_admin2 (int, optional): number of admin 2 locations. Defaults to 37.
+        n_admin3 (int, optional): number of admin 3 locations (markets). Defaults to 122.
+        n_products (int, optional): number of product columns, the first ones of the export.
+                                    Defaults to all 19.
+        submissions_per_month (int, optional): submissions of a market in a month. Defaults to 17.
+        missing_rate (float, optional): approximate share of the (admin 1, product, month) cells
+                                        without any price. Defaults to 0.55.
+        empty_price_rate (float, optional): share of the empty prices of a submission for the
+                                            reported products. Defaults to 0.8.
+        gap_rate (float, optional): share of the months a market does not report. Defaults to 0.1.
+        month_gap_rate (float, optional): share of the months no market reports. Defaults to 0.05.
+        outlier_rate (float, optional): share of the prices off by a factor 10. Defaults to 0.01.
+        first_month (String, optional): first month ('yyyy-mm'). Defaults to '2015-03'.
+        seed (int, optional): random seed, the same settings and seed give the same data.
+                              Defaults to 0.
+
+    Yields:
+        dataframe: submissions of one month (none for the months without submissions)
+    """
+    if not 0 < n_products <= len(PRODUCT_COLUMNS):
+        raise ValueError(f"n_products must be between 1 and {len(PRODUCT_COLUMNS)}")
+    rng = np.random.default_rng(seed)
+    products = PRODUCT_COLUMNS[:n_products]
+    markets = location_hierarchy(n_admin1, n_admin2, n_admin3, seed)
+    region = markets['admin1_code'].str[2:].astype(int).to_numpy() - 1
+
+    base_price = np.exp(rng.uniform(np.log(50), np.log(5000), n_products))
+    inflation = rng.normal(0.02, 0.04, (n_months, n_products)).cumsum(axis=0)
+    market_offset = rng.normal(0, 0.15, (n_admin3, n_products))
+    # month from which a region reports a product, uniform over 2 * missing_rate * n_months
+    # (the regions starting after the last month never report the product)
+    first_reported = rng.uniform(0, 2 * missing_rate * n_months, (n_admin1, n_products))
+    month_gaps = rng.random(n_months) < month_gap_rate
+
+    first = parse_month(first_month)
+    submission = 0
+    for i, month in enumerate(month_range(first, first + n_months - 1)):
+        if month_gaps[i]:
+            continue
+        year, month_number = 1970 + int(month) // 12, int(month) % 12 + 1
+        reporting = np.flatnonzero(rng.random(n_admin3) >= gap_rate)
+        market = np.repeat(reporting, submissions_per_month)
+        n_rows = len(market)
+
+        log_price = np.log(base_price) + inflation[i] + market_offset[market] \
+            + rng.normal(0, 0.08, (n_rows, n_products))
+        prices = np.round(np.exp(log_price), 2)
+        outliers = rng.random((n_rows, n_products)) < outlier_rate
+        prices[outliers] *= np.where(rng.random(outliers.sum()) < 0.5, 10, 0.1)
+        prices[(rng.random((n_rows, n_products)) < empty_price_rate)
+               | (first_reported[region[market]] > i)] = np.nan
+
+        days = rng.integers(1, 29, n_rows)
+        frame = pd.DataFrame({
+            'uuid': [f"SYN_{year}_{month_number:02d}_{submission + k:08d}" for k in range(n_rows)],
+            'date': [f"{year}-{month_number:02d}-{day:02d}" for day in days],
+            'year': year,
+            'month': calendar.month_name[month_number],
+        })
+        frame = pd.concat([frame, markets.iloc[market].reset_index(drop=True),
+                           pd.DataFrame(prices, columns=products)], axis=1)
+        submission += n_rows
+        yield frame
+
+def generate_market_panel(**settings):
+    """generate a synthetic raw panel in memory
+
+    Args:
+        **settings: arguments of `generate_market_frames`
+
+    Returns:
+        dataframe: raw submissions
+    """
+    return pd.concat(generate_market_frames(**settings), ignore_index=True)
+
+def write_market_panel(adrs, **settings):
+    """write a synthetic raw panel as csv, one month at a time
+
+    Args:
+        adrs (String): csv address
+        **settings: arguments of `generate_market_frames`
+
+    Returns:
+        int: number of submissions written
+    """
+    n_rows = 0
+    for i, frame in enumerate(generate_market_frames(**settings)):
+        frame.to_csv(adrs, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        n_rows += len(frame)
+    log.info("%d synthetic submissions written to %s", n_rows, adrs)
+    return n_rows
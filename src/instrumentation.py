@@ -0,0 +1,184 @@
+"""
+    lightweight instrumentation of the pipeline: wall time, CPU time, tracemalloc peak and
+    item counts of the stages, written as a json run report next to the exported data
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
+import os
+from pathlib import Path
+import resource
+import threading
+import time
+import tracemalloc
+
+from set_up.constants import INSTRUMENTATION, TRACE_MEMORY
+# needed for reading TIME_FOLDER, it is set during the export
+import set_up.addresses_constants as ac
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+REPORT_FILE_NAME = 'run_report.json'
+
+_lock = threading.Lock()
+_records = {}  # stage -> aggregated record
+_active = []  # records of the stages that are running, in any thread
+_started = {'time': time.perf_counter(), 'date': datetime.now().isoformat(timespec='seconds')}
+
+def start_run(trace_memory=TRACE_MEMORY):
+    """forget the previous measurements and start tracing the memory allocations (only when
+    the instrumentation is on)
+
+    Args:
+        trace_memory (bool, optional): measure the tracemalloc peaks. Defaults to TRACE_MEMORY.
+    """
+    with _lock:
+        _records.clear()
+        _active.clear()
+        _started['time'] = time.perf_counter()
+        _started['date'] = datetime.now().isoformat(timespec='seconds')
+    if INSTRUMENTATION and trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def _record(stage):
+    """aggregated record of a stage, created on first use (call with the lock held)"""
+    if stage not in _records:
+        _records[stage] = {'stage': stage, 'calls': 0, 'items': 0, 'wall_seconds': 0.0,
+                           'cpu_seconds': 0.0, 'max_wall_seconds': 0.0,
+                           'tracemalloc_peak_bytes': None, 'max_rss_bytes': None}
+    return _records[stage]
+
+def _propagate_peak():
+    """give the allocation peak since the last reset to all running stages, then reset it.
+    Every stage therefore sees the highest peak reached while it was running, also when
+    stages are nested or run in several threads (call with the lock held)."""
+    if not tracemalloc.is_tracing():
+        return
+    peak = tracemalloc.get_traced_memory()[1]
+    for active in _active:
+        active['peak'] = max(active['peak'], peak)
+    tracemalloc.reset_peak()
+
+def max_rss_bytes():
+    """highest resident set size of the process so far
+
+    Returns:
+        int: bytes
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+@contextmanager
+def measure(stage, items=None):
+    """measure a block of code. Measuring the same stage again adds up. The CPU time is the
+    one of the whole process (all threads, without worker processes), so stages running at
+    the same time share it.
+
+    Args:
+        stage (String): name of the stage, e.g. 'imputation.admin1_label.arima'
+        items (int, optional): number of items (series, locations...) processed. Defaults to None.
+
+    Yields:
+        dictionary: the 'items' entry can be set inside the block
+    """
+    if not INSTRUMENTATION:
+        yield {}
+        return
+
+    active = {'peak': 0, 'items': items}
+    with _lock:
+        _propagate_peak()
+        _active.append(active)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield active
+    finally:
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        with _lock:
+            _propagate_peak()
+            _active.remove(active)
+            record = _record(stage)
+            record['calls'] += 1
+            record['items'] += active['items'] or 0
+            record['wall_seconds'] += wall
+            record['cpu_seconds'] += cpu
+            record['max_wall_seconds'] = max(record['max_wall_seconds'], wall)
+            if tracemalloc.is_tracing():
+                record['tracemalloc_peak_bytes'] = max(record['tracemalloc_peak_bytes'] or 0,
+                                                       active['peak'])
+            record['max_rss_bytes'] = max_rss_bytes()
+
+def record_item(stage, wall_seconds, cpu_seconds=0.0, items=1):
+    """add the measurement of a single item of a loop, e.g. measured in a worker process
+
+    Args:
+        stage (String): name of the loop, e.g. 'prediction.forecast_series'
+        wall_seconds (float): wall time of the item
+        cpu_seconds (float, optional): CPU time of the item. Defaults to 0.0.
+        items (int, optional): number of items. Defaults to 1.
+    """
+    if not INSTRUMENTATION:
+        return
+    with _lock:
+        record = _record(stage)
+        record['calls'] += 1
+        record['items'] += items
+        record['wall_seconds'] += wall_seconds
+        record['cpu_seconds'] += cpu_seconds
+        record['max_wall_seconds'] = max(record['max_wall_seconds'], wall_seconds)
+
+class Timed:
+    """picklable wrapper measuring a function, for the items of a process pool.
+    Calling it returns the output of the function, its wall time and its CPU time.
+
+    Args:
+        function (callable): module level function
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        output = self.function(*args, **kwargs)
+        return output, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+def run_report(**metadata):
+    """machine readable summary of the measurements
+
+    Args:
+        **metadata: additional entries of the report (e.g. the task choice)
+
+    Returns:
+        dictionary: report with one entry per stage, in order of completion
+    """
+    with _lock:
+        stages = [dict(record) for record in _records.values()]
+    return {'started': _started['date'],
+            'wall_seconds': time.perf_counter() - _started['time'],
+            'max_rss_bytes': max_rss_bytes(),
+            'tracemalloc': tracemalloc.is_tracing(),
+            'pid': os.getpid(),
+            **metadata,
+            'stages': stages}
+
+def write_run_report(adrs=None, **metadata):
+    """write the run report as json, by default into the export directory of the run
+
+    Args:
+        adrs (String, optional): report address.
+                                    Defaults to ADRS_EXPORT_DIR + TIME_FOLDER + '/run_report.json'.
+        **metadata: additional entries of the report
+
+    Returns:
+        String: address of the report (None if the instrumentation is off)
+    """
+    if not INSTRUMENTATION:
+        return None
+    if adrs is None:
+        adrs = ac.ADRS_EXPORT_DIR + ac.TIME_FOLDER + '/' + REPORT_FILE_NAME
+    Path(adrs).parent.mkdir(parents=True, exist_ok=True)
+    with open(adrs, 'w', encoding='utf-8') as report_file:
+        json.dump(run_report(**metadata), report_file, indent=1)
+    log.info("run report written to %s", adrs)
+    return adrs
@@ -1,23 +1,33 @@
 """
     Program that give a csv file will either predict or impute data (or both)
 """
+import argparse
 import logging
 from collections import defaultdict
 import warnings
 
 from set_up.interface import interface
 from preprocessing.data_loading import data_loading
+from preprocessing.data_cleaning import RELEVANT_COLUMNS
 from preprocessing.preprocessong_controler import preprocessong_controler as preprocessing
-from modeling_permutation.imputation_controler import imput_controler as imputation
+from preprocessing.streaming_ingestion import streaming_preprocessing
+from modeling_permutation.imputation_controler import imput_controler as imputation, \
+    load_imputed, imputed_file, reloaded_admin_levels
+from modeling_permutation.incremental_imputation import incremental_imput_controler \
+    as incremental_imputation
 from modeling_prediction.prediction_controler import prediction_controler as prediction
 from results.data_export import export_controler as export
 from results.visualization import visualization_conroler as visualization
+from stage_cache import StageCache, PIPELINE_STAGES, file_fingerprint, frame_fingerprint
+from instrumentation import start_run, measure, write_run_report
 
 from set_up.constants import ADRS_IMPORT, \
     MIN_DATE, MAX_DATE, N_MONTHS, \
         ADMIN_LOCATIONS, PREDICT_ADMIN, \
             PREDICT_CITIES, PREDICT_PRODUCTS, \
-                ADRS_IMPUTED
+                MEMORY_MAPPED_LOADING, STREAMING_INGESTION, \
+                    INCREMENTAL_IMPUTATION, USE_STAGE_CACHE, PRODUCTS_LABELS, \
+                        PRODUCT_MEB_QUANTITIES, FORECAST_REFIT_EACH_STEP, GARCH_SEARCH_PATIENCE
 
 
 warnings.filterwarnings('ignore')
@@ -31,8 +41,31 @@ logging.basicConfig(
 log = logging.getLogger(__name__) # instantiate a Logger
 
 
+def parse_arguments():
+    """read the command line options
+
+    Returns:
+        argparse.Namespace: parsed options
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--invalidate', nargs='+', default=[], choices=PIPELINE_STAGES,
+                        help="recompute these stages (and the stages after them) "
+                             "instead of reloading them from the stage cache")
+    parser.add_argument('--stage-cache', action='store_true',
+                        help="reload the unchanged stages from the stage cache "
+                             "(the same as USE_STAGE_CACHE = True)")
+    parser.add_argument('--no-stage-cache', action='store_true',
+                        help="neither read nor write the stage cache")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    arguments = parse_arguments()
+    stage_cache = StageCache(invalidate=arguments.invalidate,
+                             enabled=(USE_STAGE_CACHE or arguments.stage_cache)
+                             and not arguments.no_stage_cache)
     log.info("Started the program")
+    start_run()
 
     log.info("Runs interface stage")
     choice = interface()
@@ -41,32 +74,87 @@ if __name__ == "__main__":
         log.info("program closed without processing.")
         exit()
 
-    log.info("Runs data loading stage")
-    unprocessed_data = data_loading(ADRS_IMPORT)
+    raw_data_key = file_fingerprint(ADRS_IMPORT) if stage_cache.enabled else None
+    if STREAMING_INGESTION:
+        log.info("Runs streaming data loading and preprocessing stage")
+        with measure('preprocessing') as stage:
+            (outlierless_data, admin_raw_data), preprocessing_key = stage_cache.run(
+                'preprocessing', raw_data_key,
+                {'STREAMING_INGESTION': True, 'MIN_DATE': MIN_DATE, 'MAX_DATE': MAX_DATE,
+                 'ADMIN_LOCATIONS': ADMIN_LOCATIONS, 'PRODUCTS_LABELS': PRODUCTS_LABELS},
+                streaming_preprocessing, ADRS_IMPORT, min_date=MIN_DATE, max_date=MAX_DATE)
+            stage['items'] = len(outlierless_data)
+    else:
+        log.info("Runs data loading stage")
+        with measure('loading') as stage:
+            if MEMORY_MAPPED_LOADING:
+                (unprocessed_data,), loading_key = stage_cache.run(
+                    'loading', raw_data_key,
+                    {'MEMORY_MAPPED_LOADING': True, 'RELEVANT_COLUMNS': RELEVANT_COLUMNS,
+                     'MIN_DATE': MIN_DATE, 'MAX_DATE': MAX_DATE},
+                    lambda: (data_loading(ADRS_IMPORT, columns=RELEVANT_COLUMNS,
+                                          min_date=MIN_DATE, max_date=MAX_DATE),))
+            else:
+                (unprocessed_data,), loading_key = stage_cache.run(
+                    'loading', raw_data_key, {'MEMORY_MAPPED_LOADING': False},
+                    lambda: (data_loading(ADRS_IMPORT),))
+            stage['items'] = len(unprocessed_data)
 
-    log.info("Runs preprocessing stage")
-    outlierless_data, admin_raw_data = preprocessing(unprocessed_data,
-                                                     min_date=MIN_DATE, max_date=MAX_DATE)
+        log.info("Runs preprocessing stage")
+        with measure('preprocessing', items=len(unprocessed_data)):
+            (outlierless_data, admin_raw_data), preprocessing_key = stage_cache.run(
+                'preprocessing', loading_key,
+                {'MIN_DATE': MIN_DATE, 'MAX_DATE': MAX_DATE,
+                 'ADMIN_LOCATIONS': ADMIN_LOCATIONS, 'PRODUCTS_LABELS': PRODUCTS_LABELS},
+                preprocessing, unprocessed_data, min_date=MIN_DATE, max_date=MAX_DATE)
 
     log.info("Runs Imputation stage")
     imputed_data = {}
-    if choice in {1, 2}:
-        data_wihtout_meb, imputed_data = imputation(outlierless_data, admin_raw_data)
-    elif choice == 3:
-        imputed_data[PREDICT_ADMIN] = data_loading(ADRS_IMPUTED[PREDICT_ADMIN])
-    else:
-        raise ValueError("no imputated data was loaded")
+    with measure('imputation'):
+        if choice in {1, 2} and INCREMENTAL_IMPUTATION:
+            # depends on the imputation stored by the previous run, so it is not cached
+            data_wihtout_meb, imputed_data = incremental_imputation(outlierless_data, admin_raw_data)
+            imputation_key = frame_fingerprint(imputed_data.get(PREDICT_ADMIN))
+        elif choice in {1, 2}:
+            # the levels that are not imputed are read from the stored imputation, the cached
+            # output is only valid for the same stored files
+            reloaded_files = {admin: imputed_file(admin) for admin in reloaded_admin_levels()}
+            reloaded_key = {admin: file_fingerprint(adrs) if adrs else None
+                            for admin, adrs in reloaded_files.items()} \
+                if stage_cache.enabled else None
+            (data_wihtout_meb, imputed_data), imputation_key = stage_cache.run(
+                'imputation', preprocessing_key,
+                {'ADMIN_LOCATIONS': ADMIN_LOCATIONS, 'PRODUCTS_LABELS': PRODUCTS_LABELS,
+                 'PRODUCT_MEB_QUANTITIES': PRODUCT_MEB_QUANTITIES,
+                 'reloaded_imputation': reloaded_key},
+                imputation, outlierless_data, admin_raw_data)
+        elif choice == 3:
+            imputed_data[PREDICT_ADMIN] = load_imputed(PREDICT_ADMIN)
+            imputation_key = frame_fingerprint(imputed_data[PREDICT_ADMIN])
+        else:
+            raise ValueError("no imputated data was loaded")
 
     predicted_data = defaultdict(lambda: None) #m makes it so any other key return None
     if choice in {2, 3}:
         log.info("Run prediction stage")
-        predicted_data[PREDICT_ADMIN] = prediction(imputed_data[PREDICT_ADMIN], PREDICT_ADMIN,\
-                                                         PREDICT_CITIES, PREDICT_PRODUCTS, N_MONTHS)
+        with measure('prediction'):
+            (predicted_data[PREDICT_ADMIN],), _ = stage_cache.run(
+                'prediction', imputation_key,
+                {'PREDICT_ADMIN': PREDICT_ADMIN, 'PREDICT_CITIES': PREDICT_CITIES,
+                 'PREDICT_PRODUCTS': PREDICT_PRODUCTS, 'N_MONTHS': N_MONTHS,
+                 'FORECAST_REFIT_EACH_STEP': FORECAST_REFIT_EACH_STEP,
+                 'GARCH_SEARCH_PATIENCE': GARCH_SEARCH_PATIENCE},
+                lambda: (prediction(imputed_data[PREDICT_ADMIN], PREDICT_ADMIN,
+                                    PREDICT_CITIES, PREDICT_PRODUCTS, N_MONTHS),))
 
     log.info("Runs Export stage")
-    export(choice, imputed_data, predicted_data)
+    with measure('export'):
+        export(choice, imputed_data, predicted_data)
 
     log.info("Runs visualization stage")
-    visualization(choice, admin_raw_data, imputed_data, predicted_data)
+    with measure('visualization'):
+        visualization(choice, admin_raw_data, imputed_data, predicted_data)
 
+    # written next to the exported data of this run
+    write_run_report(choice=choice)
     log.info("Program completed")
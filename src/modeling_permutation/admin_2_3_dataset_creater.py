@@ -2,13 +2,23 @@
     file description
 '''
 
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
 import sys
 
+import numpy as np
 import pandas as pd
 
-from modeling_permutation.local_regression import perform_local_regression_imputation
+from modeling_permutation.local_regression import perform_local_regression_batch
+from modeling_permutation.price_panel import PricePanel
+from instrumentation import measure, record_item, Timed
+from set_up.constants import ADMIN_SHARD_WORKERS
 
-def create_admin_2_3_dataset(admin_raw_df, admin_label, upper_admin_cleaned_df, all_admin_df):
+log = logging.getLogger(__name__)  # Logger for this module
+
+def create_admin_2_3_dataset(admin_raw_df, admin_label, upper_admin_cleaned_df, all_admin_df,
+                             n_workers=ADMIN_SHARD_WORKERS):
 
     """
         This function performs data imputation and cleans the preprocessed dataframe for a specific administrative level (only levels 2 or 3),
@@ -31,6 +41,9 @@ def create_admin_2_3_dataset(admin_raw_df, admin_label, upper_admin_cleaned_df,
             admin_label (str): A string that indicates the admin level of the provided `admin_raw_df`.
                                     Allowed values are: 'admin2_label' or 'admin3_label'. For admin level 1,
                                     please use the designated function.
+
+            n_workers (int): Number of processes the locations are imputed on, sharded by their admin level 1
+                                    region. None uses all cores, 1 (the default) runs serially.
         
         Returns:
             pd.DataFrame: A Pandas dataframe that has been cleaned of all NaN values.
@@ -61,72 +74,146 @@ def create_admin_2_3_dataset(admin_raw_df, admin_label, upper_admin_cleaned_df,
     admin_raw_df = admin_raw_df[admin_raw_df[admin_label] != " "]
     admin_raw_df = admin_raw_df.reset_index(drop=True)
 
-    # Find all unique values in the 'admin_level' column
-    unique_admin_levels = admin_raw_df[admin_label].unique()
-    # This summarizes the specific admin locations into a single list
-    admin_location_list = unique_admin_levels.tolist()
-    if " " in admin_location_list:
-        admin_location_list.remove(" ")
-
-    #create a list with all price column names
-    price_columns = [col for col in admin_raw_df.columns if col not in ["year_month", admin_label]]
-
-    # Create a dictionary that assigns each admin location its corresponding location in the admin level above
-    corresponding_higher_admin_location = {}
-    for loc in admin_location_list:
-        if loc == " ":
-            continue
-        test = all_admin_df.loc[all_admin_df[admin_label]==loc]
-        corresponding_higher_admin_location[loc] = test[higher_admin_level_string].iloc[0]
-
-
-    #performing local regression:
-    #iterate through all admin location and prices
-    for ad in admin_location_list:
-        for price in price_columns:            
-
-            #Generate a one-column DataFrame that is ready to be analyzed.
-            sinlge_admin_level_df = admin_raw_df[admin_raw_df[admin_label]== ad ]
-            single_good_admin = sinlge_admin_level_df[price]
-            single_good_admin = single_good_admin.reset_index().drop(columns = ["index"])
-
-            #perform local regression 2 times and impute NaN values directly within single_good_admin
-            perform_local_regression_imputation(single_good_admin,one_way_window = 5)
-            perform_local_regression_imputation(single_good_admin,one_way_window=8)
-          
-            
-            # Find the indices of the rows in target dataframe df where admin_level corresponds to the currently used one
-            new_indices = admin_raw_df[admin_raw_df[admin_label] == ad].index
-            
-            #replace imputed NaN values in the target dataframe df
-            admin_raw_df.loc[new_indices, price] = single_good_admin[price].values
+    # Create a map that assigns each admin location its corresponding location in the admin level above
+    corresponding_higher_admin_location = higher_admin_map(all_admin_df, admin_label, higher_admin_level_string)
+
+
+    #performing the imputation on a (month x location x product) panel:
+    panel = PricePanel.from_frame(admin_raw_df, admin_label)
+
+    #the locations of an admin level 1 region do not depend on the other regions
+    shards = admin1_region_shards(panel.locations, all_admin_df, admin_label)
+    stage = f"imputation.{admin_label}.local_regression_and_fill"
+    if n_workers == 1 or len(shards) == 1:
+        with measure(stage, items=len(panel.locations) * len(panel.products)):
+            impute_admin_2_3_panel(panel, upper_admin_cleaned_df, higher_admin_level_string,
+                                   corresponding_higher_admin_location)
+        return panel.to_frame()
+
+    log.info("Imputing %d admin 1 regions of %s in a process pool", len(shards), admin_label)
+    shard_panels = []
+    for positions in shards:
+        locations = [panel.locations[i] for i in positions]
+        parents = corresponding_higher_admin_location.reindex(locations)
+        upper_rows = upper_admin_cleaned_df[upper_admin_cleaned_df[higher_admin_level_string].isin(parents)]
+        shard_panels.append((PricePanel(panel.values[:, positions, :], panel.months, locations,
+                                        panel.products, admin_label), upper_rows, parents))
+
+    # the imputation levels run in threads of `run_task_graph`, next to the ARIMA process pool:
+    # the workers are spawned, forking a multi-threaded process is unsafe
+    with measure(stage, items=len(panel.locations) * len(panel.products)), \
+            ProcessPoolExecutor(max_workers=n_workers,
+                                mp_context=multiprocessing.get_context('spawn')) as executor:
+        results = executor.map(Timed(impute_admin_2_3_panel), [shard for shard, _, _ in shard_panels],
+                               [upper_rows for _, upper_rows, _ in shard_panels],
+                               [higher_admin_level_string] * len(shard_panels),
+                               [parents for _, _, parents in shard_panels])
+        for positions, (shard, wall, cpu) in zip(shards, results):
+            panel.values[:, positions, :] = shard.values
+            record_item(stage + ".shard", wall, cpu, items=len(positions) * len(panel.products))
+
+    return panel.to_frame()
+
+
+def impute_admin_2_3_panel(panel, upper_admin_cleaned_df, higher_admin_label, higher_locations):
+
+    """
+        This function performs the imputation steps of `create_admin_2_3_dataset()` on a panel; it runs in a worker
+        process when the locations are sharded.
+
+        Parameters:
+            panel (PricePanel): The panel of the admin level (or of a shard of its locations). It is modified in place.
+            upper_admin_cleaned_df (pd.DataFrame): The cleaned dataframe of the admin level above.
+            higher_admin_label (str): The admin level above, e.g. 'admin2_label'.
+            higher_locations (pd.Series): The output of `higher_admin_map()`.
 
+        Returns:
+            PricePanel: The imputed panel.
+    """
 
+    #every (location, product) series is a column of the (month x series) view of the panel;
+    #local regression is performed 2 times on all of them and imputes the NaN values in place
+    series_values = panel.values.reshape(len(panel.months), -1)
+    perform_local_regression_batch(series_values, one_way_window=5)
+    perform_local_regression_batch(series_values, one_way_window=8)
 
     # Perform geographic imputation:
-    # For each NaN value, the locations the admin level above is addressed an its not nan value is used to impute the nan 
-    
-    # Finde nan indices in df
-    for index, row in admin_raw_df.iterrows():
-        for col in admin_raw_df.columns:
-            if pd.isna(row[col]):  # check if it is nan value     
-                
-                current_location = admin_raw_df.iloc[index][admin_label]
-                current_date = admin_raw_df.iloc[index]["year_month"]
-                
-                #use non nan value of upper admin level
-                nearest_locations_values = corresponding_higher_admin_location[current_location]          
+    # For each NaN value, the location of the admin level above is addressed and its non NaN value is used to impute the NaN
+    return fill_from_higher_admin(panel, upper_admin_cleaned_df, higher_admin_label, higher_locations)
 
-                #find one element dataframe with the desired value
-                filtered_df = upper_admin_cleaned_df[   
-                        (upper_admin_cleaned_df['year_month'] == current_date) &  
-                        (upper_admin_cleaned_df[higher_admin_level_string]== nearest_locations_values)][col]
-                
-                 #replace nan value with derived average price
-                admin_raw_df.loc[index, col] = filtered_df.iloc[0]
 
+def admin1_region_shards(locations, all_admin_df, admin_label):
 
+    """
+        This function groups the locations of a panel by the admin level 1 region of the first row of
+        `all_admin_df` in which they appear.
 
-    return admin_raw_df
+        Parameters:
+            locations (list): The locations of the panel.
+            all_admin_df (pd.DataFrame): A dataframe containing the labels of all admin levels.
+            admin_label (str): The admin level of the locations.
 
-    
+        Returns:
+            list: One array of location positions per region (a single shard if the regions are unknown).
+    """
+
+    if "admin1_label" not in all_admin_df.columns or len(locations) == 0:
+        return [np.arange(len(locations))]
+    regions = higher_admin_map(all_admin_df, admin_label, "admin1_label").reindex(locations)
+    region_codes, _ = pd.factorize(regions, use_na_sentinel=False)
+    return [np.flatnonzero(region_codes == code) for code in range(region_codes.max() + 1)]
+
+
+def higher_admin_map(all_admin_df, admin_label, higher_admin_label):
+
+    """
+        This function assigns each admin location its location in the admin level above, using the first
+        row of `all_admin_df` in which the location appears.
+
+        Parameters:
+            all_admin_df (pd.DataFrame): A dataframe containing the labels of all admin levels.
+            admin_label (str): The admin level of the locations, e.g. 'admin3_label'.
+            higher_admin_label (str): The admin level above, e.g. 'admin2_label'.
+
+        Returns:
+            pd.Series: The higher admin location, indexed by the admin location.
+    """
+
+    locations = all_admin_df[[admin_label, higher_admin_label]].drop_duplicates(subset=admin_label)
+    return locations.set_index(admin_label)[higher_admin_label]
+
+
+def fill_from_higher_admin(panel, upper_admin_cleaned_df, higher_admin_label, higher_locations):
+
+    """
+        This function replaces the NaN values of a (month x location x product) panel with the value of the
+        corresponding location in the admin level above at the same month. The values of the upper admin level
+        are gathered for every (month, location) pair with a single reindex.
+
+        Parameters:
+            panel (PricePanel): The panel of the admin level. It is modified in place.
+            upper_admin_cleaned_df (pd.DataFrame): The cleaned dataframe of the admin level above.
+            higher_admin_label (str): The admin level above, e.g. 'admin2_label'.
+            higher_locations (pd.Series): The output of `higher_admin_map()`.
+
+        Returns:
+            PricePanel: The panel, whose NaN values are filled where the admin level above has a value.
+    """
+
+    n_months, n_locations, n_products = panel.values.shape
+    parents = higher_locations.reindex(panel.locations).to_numpy()
+    missing_parents = [loc for loc, parent in zip(panel.locations, parents) if pd.isna(parent)]
+    if missing_parents:
+        log.warning("No location of the admin level above is known for %s, their NaN values remain", missing_parents)
+
+    # upper admin values for every (month, location) row of the panel, in the row order of the panel
+    upper_values = upper_admin_cleaned_df.drop_duplicates(subset=["year_month", higher_admin_label])
+    upper_values = upper_values.set_index(["year_month", higher_admin_label])
+    rows = pd.MultiIndex.from_arrays([np.repeat(np.asarray(panel.months), n_locations),
+                                      np.tile(parents, n_months)])
+    upper_values = upper_values.reindex(index=rows, columns=panel.products).to_numpy(dtype=np.float64)
+
+    values = panel.values.reshape(n_months * n_locations, n_products)
+    nan_mask = np.isnan(values)
+    values[nan_mask] = upper_values[nan_mask]
+    return panel
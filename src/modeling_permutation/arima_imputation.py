@@ -1,10 +1,22 @@
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+
 from statsmodels.tsa.arima.model import ARIMA
 import pmdarima as pm
 import numpy as np
+import pandas as pd
+
+from arima_order_cache import ArimaOrderCache
+from instrumentation import measure, record_item, Timed
+from modeling_permutation.price_panel import PricePanel
+from set_up.constants import IMPUTATION_WORKERS
+
+log = logging.getLogger(__name__)  # Logger for this module
 
 
-def arima_imputation_fn(df_cleaned, admin_label, nan_df):
-   
+def arima_imputation_fn(df_cleaned, admin_label, nan_df, n_workers=IMPUTATION_WORKERS):
+
     """
     This function performs a data imputation technique based on ARIMA time series fitting.
 
@@ -13,73 +25,146 @@ def arima_imputation_fn(df_cleaned, admin_label, nan_df):
 
         nan_df: This pandas DataFrame must have exactly the same dimensions and ordering in the date and admin level columns. It contains NaN values. The only information extracted from this DataFrame is the position of these NaN values.
         Usually, nan_df is the original DataFrame, and df_cleaned is one where some imputation techniques have already taken place. These imputations are refined in this function to improve performance.
+
+        n_workers: number of processes the (location, product) series are fitted on. None uses all cores, 1 runs serially.
+    """
+
+    # Converting both DataFrames into panels; the panel of df_cleaned is a copy of the input
+    panel = PricePanel.from_frame(df_cleaned, admin_label)
+    nan_panel = PricePanel.from_frame(nan_df, admin_label)
+
+    panel, _ = arima_imputation_panel(panel, nan_panel, n_workers)
+    return panel.to_frame()
+
+
+def arima_impute_series(price, series, nan_mask, order=None):
+
     """
+    Fits an ARIMA model on a single (location, product) series and re-predicts the positions that were NaN.
+    The series are independent of each other, which lets them be fitted in separate processes.
 
-    # Creating a copy of df to avoid modifying the original input
-    df = df_cleaned.copy()
+    Inputs:
+        price: name of the product, used as column name of the fitted series.
 
-    price_columns = [col for col in df.columns if col not in ["year_month", admin_label]]
+        series: 1-D array of the series without NaN values.
 
-    # Find all unique values in the 'admin_level' column
-    unique_admin_levels = df[admin_label].unique()
+        nan_mask: 1-D boolean array, True where the original series was NaN.
 
-    # Convert the unique values into a list
-    # This summarizes the specific admin locations into a single list
-    admin_location_list = unique_admin_levels.tolist()  
+        order: ARIMA order to use. If None, it is searched with auto_arima.
 
+    Output:
+        The imputed series as a 1-D array, the ARIMA order that was used and whether the fit succeeded.
+    """
 
-    for ad in admin_location_list:    
-        for price in price_columns:
+    single_good_admin = pd.DataFrame({price: series})
 
-            #Finding the indices of NaN values in nan_df that indicate all positions where there were once NaN values in df_cleaned
-            sinlge_admin_level_df_copy = nan_df[nan_df[admin_label] == ad]
-            single_good_admin_copy = sinlge_admin_level_df_copy[price]
-            single_good_admin_copy = single_good_admin_copy.reset_index().drop(columns=["index"])
+    # Finding the indices of NaN values but only considering values from index 5 onward (6th value)
+    local_nan_indices = np.flatnonzero(nan_mask)
+    local_nan_indices = local_nan_indices[local_nan_indices >= 5]  # Start imputation from the 6th value (index 5)
 
-            # Finding the indices of NaN values in nan_df but only considering values from index 5 onward (6th value)
-            local_nan_indices = single_good_admin_copy.index[single_good_admin_copy.isna()[single_good_admin_copy.columns[0]]] 
-            local_nan_indices = local_nan_indices[local_nan_indices >= 5]  # Start imputation from the 6th value (index 5)
+    ############################
+    # Log-Transformation anwenden
+    log_transformed_data = np.log(single_good_admin + 1)  # +1, to avoid log(0)-Problem
 
+    # Setze NaN-Werte nach der Log-Transformation auf 0
+    log_transformed_data = log_transformed_data.fillna(0)
+    ############################
 
-            #preparing cleaned_df that contains no nan values to fit ARIMA model
-            sinlge_admin_level_df = df[df[admin_label] == ad]
-            single_good_admin = sinlge_admin_level_df[price]
-            single_good_admin = single_good_admin.reset_index().drop(columns=["index"])
+    # Automatic model fitting with auto_arima on the log-transformed data (skipped for cached orders)
+    if order is None:
+        auto_arima_model = pm.auto_arima(log_transformed_data, stepwise=False, seasonal=False)
+        order = auto_arima_model.order
 
-            ############################
-            # Log-Transformation anwenden
-            log_transformed_data = np.log(single_good_admin + 1)  # +1, to avoid log(0)-Problem
+    # Fit the ARIMA model with the order parameters
+    model = ARIMA(log_transformed_data, order=order)
+    try:
+        model_fit = model.fit()
+    except (np.linalg.LinAlgError, ValueError) as error:
+        # the order search can pick an order whose fit fails (e.g. a singular initial covariance);
+        # the series then keeps the values of the previous imputation steps
+        log.warning("ARIMA%s fit failed for %s (%s), keeping the previous imputation", order, price, error)
+        return single_good_admin[price].to_numpy(), order, False
 
-            # Setze NaN-Werte nach der Log-Transformation auf 0
-            log_transformed_data = log_transformed_data.fillna(0)
-            ############################
+    #Generate for each nan value a single prediction
+    for index in local_nan_indices:
+        in_sample_predictions = model_fit.get_prediction(start=index, end=index)
+        predicted_values = in_sample_predictions.predicted_mean
 
-            # Automatic model fitting with auto_arima on the log-transformed data
-            auto_arima_model = pm.auto_arima(log_transformed_data, stepwise=False, seasonal=False)
-            print(auto_arima_model)
+        # Undo log transformation
+        predicted_values = np.exp(predicted_values) - 1
 
-            # Extract the order parameters from auto_arima and fit the ARIMA model
-            order = auto_arima_model.order
-            model = ARIMA(log_transformed_data, order=order)
-            model_fit = model.fit()
+        #save prediction locally
+        single_good_admin.iloc[index] = predicted_values
 
-            #Generate for each nan value a single prediction 
-            for index in local_nan_indices:
-                in_sample_predictions = model_fit.get_prediction(start=index, end=index)
-                predicted_values = in_sample_predictions.predicted_mean
+    return single_good_admin[price].to_numpy(), order, True
 
-                # Undo log transformation
-                predicted_values = np.exp(predicted_values) - 1
 
-                #save prediction locally
-                single_good_admin.iloc[index] = predicted_values
+def arima_imputation_panel(panel, nan_panel, n_workers=IMPUTATION_WORKERS, order_cache=None):
 
+    """
+    Same as `arima_imputation_fn`, but works on `PricePanel`s. The panel is modified in place.
 
-             #save predictions and find the correct indices in df
-            admin_df_indices = df[df[admin_label] == ad].index
-            df.loc[admin_df_indices, price] = single_good_admin.values
+    Inputs:
+        panel: PricePanel without NaN values.
+
+        nan_panel: PricePanel with the same labels as `panel`. Only the position of its NaN values is used.
 
+        n_workers: number of processes the (location, product) series are fitted on. None uses all cores, 1 runs serially.
 
-    return df
+        order_cache: ArimaOrderCache used to skip the order search of unchanged series. If None, the on-disk cache is used.
+
+    Output:
+        The imputed panel and a dictionary (location, product) -> ARIMA order of the fitted series.
+    """
 
-            
+    # Series without NaN values from index 5 onward keep their values, so they are not fitted
+    series_keys = [(ad, price) for ad in panel.locations for price in panel.products
+                   if np.isnan(nan_panel.column(ad, price)[5:]).any()]
+    skipped = len(panel.locations) * len(panel.products) - len(series_keys)
+    if skipped:
+        log.info("%d ARIMA series have nothing to impute and are not fitted", skipped)
+    prices = [price for _, price in series_keys]
+    series = [panel.column(ad, price).copy() for ad, price in series_keys]
+    nan_masks = [np.isnan(nan_panel.column(ad, price)) for ad, price in series_keys]
+
+    # Looking up the orders of series that have not changed since a previous run
+    if order_cache is None:
+        order_cache = ArimaOrderCache()
+    cache_keys = [order_cache.key(panel.admin_label, ad, price, values)
+                  for (ad, price), values in zip(series_keys, series)]
+    cached_orders = [order_cache.lookup(key) for key in cache_keys]
+    order_cache.log_stats("ARIMA imputation")
+
+    # map returns the results in submission order, so the merge does not depend on the scheduling
+    stage = f"imputation.{panel.admin_label or 'admin0_label'}.arima"
+    with measure(stage, items=len(series_keys)):
+        if n_workers == 1:
+            results = list(map(Timed(arima_impute_series), prices, series, nan_masks, cached_orders))
+        else:
+            log.info("Fitting %d ARIMA series in a process pool", len(series_keys))
+            # the imputation levels run in threads of `run_task_graph`: the workers are spawned,
+            # forking a multi-threaded process is unsafe
+            with ProcessPoolExecutor(max_workers=n_workers,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = list(executor.map(Timed(arima_impute_series), prices, series, nan_masks,
+                                            cached_orders))
+
+    orders = {}
+    failed = 0
+    for (ad, price), key, ((imputed_series, order, fitted), wall, cpu) in zip(series_keys, cache_keys, results):
+        record_item(stage + ".series", wall, cpu)
+        if not fitted:
+            # the series keeps the values of the previous imputation steps, the run report counts it
+            record_item(stage + ".failed", wall, cpu)
+            failed += 1
+        log.info("ARIMA%s chosen for %s in %s", order, price, ad)
+        panel.set_column(ad, price, imputed_series)
+        orders[(ad, price)] = order
+        if fitted:
+            # the order of a failed fit is searched again by the next run
+            order_cache.store(key, order)
+    order_cache.save()
+    if failed:
+        log.warning("%d of %d ARIMA fits failed, these series keep the previous imputation", failed, len(series_keys))
+
+    return panel, orders
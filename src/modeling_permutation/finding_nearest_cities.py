@@ -3,6 +3,22 @@
 '''
 import math
 
+# Coordinates of the cities (latitude, longitude)
+CITY_COORDINATES = {
+    "Aleppo": (36.2021, 37.1343),
+    "Al-Hasakeh": (36.5, 40.7333),
+    "Ar-Raqqa": (35.947, 39.017),
+    "Damascus": (33.5138, 36.2765),
+    "Dar'a": (32.6163, 36.1),
+    "Deir-ez-Zor": (35.3315, 40.148),
+    "Hama": (35.1312, 36.7572),
+    "Homs": (34.7343, 36.7123),
+    "Idleb": (35.9318, 36.6317),
+    "Lattakia": (35.7837, 35.5),
+    "Quneitra": (33.2, 35.5),
+    "Rural Damascus": (33.6, 36.5),
+}
+
 def find_nearest_cities(city_list, n=4):
 
     """
@@ -14,31 +30,17 @@ def find_nearest_cities(city_list, n=4):
 
     Returns:
         dict: A dictionary where each key is a city from the input list and the value is a list of
-              the `n` nearest cities. If a city is not found in the predefined list of cities,
+              the `n` nearest cities. If a city is not found in `CITY_COORDINATES`,
               the value will be an empty list.
 
     Functionality:
         This function calculates the geographical distance between cities using the Haversine formula,
         which accounts for the curvature of the Earth. It takes the input list of cities, retrieves their
-        coordinates, and then computes the distance to all other cities in the predefined set. The
+        coordinates, and then computes the distance to all other cities in `CITY_COORDINATES`. The
         resulting nearest cities are sorted by distance, and the closest `n` cities are returned.
     """
 
-    # Coordinates of the cities
-    cities = {
-        "Aleppo": (36.2021, 37.1343),
-        "Al-Hasakeh": (36.5, 40.7333),
-        "Ar-Raqqa": (35.947, 39.017),
-        "Damascus": (33.5138, 36.2765),
-        "Dar'a": (32.6163, 36.1),
-        "Deir-ez-Zor": (35.3315, 40.148),
-        "Hama": (35.1312, 36.7572),
-        "Homs": (34.7343, 36.7123),
-        "Idleb": (35.9318, 36.6317),
-        "Lattakia": (35.7837, 35.5),
-        "Quneitra": (33.2, 35.5),
-        "Rural Damascus": (33.6, 36.5),
-    }
+    cities = CITY_COORDINATES
 
     def haversine(coord1, coord2):
 
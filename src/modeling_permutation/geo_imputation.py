@@ -0,0 +1,91 @@
+'''
+    geographic imputation: fill NaN values with the average of the nearest locations
+'''
+import logging
+import warnings
+
+import numpy as np
+
+from modeling_permutation.price_panel import PricePanel
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+
+def build_neighbour_index(locations, nearest_locations):
+    """convert the dictionary of nearest locations into an array of location positions
+
+    Args:
+        locations (list): locations in the order of the location axis of the price cube
+        nearest_locations (dict): location -> list of its nearest locations
+                                    (as returned by `find_nearest_cities`)
+
+    Returns:
+        np.ndarray: int array of shape (n_locations, n_neighbours). Neighbours that are not
+                    part of `locations` point to the padding position `len(locations)`.
+    """
+    position = {loc: i for i, loc in enumerate(locations)}
+    padding = len(locations)
+    n_neighbours = max((len(nearest_locations.get(loc, [])) for loc in locations), default=0)
+
+    neighbour_index = np.full((len(locations), n_neighbours), padding, dtype=np.intp)
+    for i, loc in enumerate(locations):
+        for j, neighbour in enumerate(nearest_locations.get(loc, [])):
+            neighbour_index[i, j] = position.get(neighbour, padding)
+    return neighbour_index
+
+
+def fill_cube_with_neighbours(cube, neighbour_index, number_of_runs=2):
+    """fill NaN values of a (month x location x product) cube with the mean of its neighbours
+
+    The locations are swept in order and every fill is visible to the locations that
+    come after it within the same run, which mirrors the row by row fill of the long table.
+
+    Args:
+        cube (np.ndarray): float array of shape (n_months, n_locations, n_products).
+                            It is modified in place.
+        neighbour_index (np.ndarray): output of `build_neighbour_index`
+        number_of_runs (int, optional): how often the geographic fill is repeated. Defaults to 2.
+
+    Returns:
+        np.ndarray: the filled cube
+    """
+    n_months, _, n_products = cube.shape
+    # one all-NaN location so that missing neighbours do not contribute to the mean
+    padded = np.concatenate([cube, np.full((n_months, 1, n_products), np.nan)], axis=1)
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=RuntimeWarning, message="Mean of empty slice")
+        for _ in range(number_of_runs):
+            for loc, neighbours in enumerate(neighbour_index):
+                location_values = padded[:, loc, :]
+                nan_mask = np.isnan(location_values)
+                if not nan_mask.any():
+                    continue
+                average_values = np.nanmean(padded[:, neighbours, :], axis=1)
+                location_values[nan_mask] = average_values[nan_mask]
+
+    cube[...] = padded[:, :-1, :]
+    return cube
+
+
+def perform_geo_imputation(df, admin_label, nearest_locations, number_of_runs=2):
+    """replace NaN values of a long admin table with the average of the nearest locations
+
+    Args:
+        df (dataframe): admin data with a 'year_month' column, an admin label column and
+                        one column per price
+        admin_label (String): admin level of the data
+        nearest_locations (dict): location -> list of its nearest locations
+        number_of_runs (int, optional): how often the geographic fill is repeated. Defaults to 2.
+
+    Returns:
+        dataframe: the imputed data
+    """
+    panel = PricePanel.from_frame(df, admin_label)
+
+    log.info("np.nanmean of the neighbours triggers a \"RuntimeWarning: Mean of empty slice\" "
+             "that as been supressed")
+    neighbour_index = build_neighbour_index(panel.locations, nearest_locations)
+    fill_cube_with_neighbours(panel.values, neighbour_index, number_of_runs)
+
+    return panel.to_frame()
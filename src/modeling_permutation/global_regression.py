@@ -2,10 +2,14 @@
     file discription
 '''
 
+import logging
+
 # import pandas as pd
 import numpy as np
 import numpy.polynomial.polynomial as Polynomial
 
+log = logging.getLogger(__name__)  # Logger for this module
+
 def perform_global_regression_imputation(df, dim = 3):
 
     """
@@ -25,7 +29,7 @@ def perform_global_regression_imputation(df, dim = 3):
 
     # Check if there are enough data points for polynomial regression
     if len(x) < 6:  # Ensure there are at least 6 data points available
-        print("Too few measurements available. This time series will not be imputed and NaN values remain.")
+        log.warning("Too few measurements available. This time series will not be imputed and NaN values remain.")
         return  # Exit the function if there are too few measurements
 
     # Identify the indices of the NaN values in the original DataFrame
@@ -46,5 +50,51 @@ def perform_global_regression_imputation(df, dim = 3):
 
 
 
+def perform_global_regression_batch(values, dim = 3, series_labels = None):
+
+    """
+        This function performs the same polynomial regression as `perform_global_regression_imputation()`, but on all the series of a 2-D array at once.
+        All series share the month axis, so the fits only differ by their missing-value masks and their measured months. The masked normal equations of every series are built with batched matrix products and solved in one batched call. The months of every series are mapped onto [-1, 1] over its own first to last measurement, as `np.polyfit` does: scaling over the whole month axis instead leaves the normal equations of series measured on a short span badly conditioned (relative errors up to 1e-4 against the per-series fit); the predictions are the same as with the raw indices.
+
+        Input:
+            values: A numpy float array of shape (n_months, n_series), e.g. the values of a `PricePanel` reshaped to (n_months, n_locations * n_products). Every column is a time series indexed from 0 to n_months - 1.
+            dim: An integer giving the degree of the polynomial.
+            series_labels: Optional list with a label for every column, used to log the series that are not imputed.
 
+        Output:
+            The array, whose NaN values are updated in place with the results of the polynomial regression. Series with fewer than 6 measurements are skipped and keep their NaN values.
+    """
 
+    n_months = values.shape[0]
+    known = ~np.isnan(values)
+
+    # Series with too few data points are not imputed
+    too_few = known.sum(axis=0) < 6
+    for series in np.flatnonzero(too_few & ~known.all(axis=0)):
+        label = series if series_labels is None else series_labels[series]
+        log.warning("Too few measurements available for %s. This time series will not be imputed and NaN values remain.", label)
+
+    fitted = np.flatnonzero(~too_few & ~known.all(axis=0))
+    if len(fitted) == 0:
+        return values
+
+    # months of every series mapped onto [-1, 1] over its first to last measurement
+    fitted_known = known[:, fitted]
+    months = np.arange(n_months, dtype=np.float64)[:, None]
+    first = np.where(fitted_known, months, np.inf).min(axis=0)
+    last = np.where(fitted_known, months, -np.inf).max(axis=0)
+    x = (months - (first + last) / 2) / ((last - first) / 2)  # (n_months, n_series)
+    design = x.T[:, :, None] ** np.arange(dim + 1)  # (n_series, n_months, dim + 1)
+
+    # masked normal equations (V^T M V) c = V^T M y of every series
+    masked = design * fitted_known.T[:, :, None]
+    y = np.where(fitted_known, values[:, fitted], 0.0)
+    gram = masked.transpose(0, 2, 1) @ masked
+    rhs = masked.transpose(0, 2, 1) @ y.T[:, :, None]
+    coefs = np.linalg.solve(gram, rhs)  # (n_series, dim + 1, 1)
+
+    # Predict the NaN values of the fitted series
+    predicted = (design @ coefs)[:, :, 0].T
+    values[:, fitted] = np.where(fitted_known, values[:, fitted], predicted)
+
+    return values
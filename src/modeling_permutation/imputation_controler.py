@@ -2,19 +2,27 @@
     controler of imputation stage
 """
 import logging
+import os
+from pathlib import Path
+
+import numpy as np
 
 from preprocessing.data_loading import data_loading
+from preprocessing.month_index import with_month_index
 
 from modeling_permutation.admin1_dataset_creater import create_admin1_dataset
 from modeling_permutation.admin_2_3_dataset_creater import create_admin_2_3_dataset
 # from modeling_permutation.prim_imputations import basic_impute_data
 from calculate_meb import mult_admin_meb
+from results.data_export import EXPORT_FUNCTIONS
 
-from modeling_permutation.global_regression import perform_global_regression_imputation
-from modeling_permutation.local_regression import perform_local_regression_imputation
+from modeling_permutation.global_regression import perform_global_regression_batch
+from modeling_permutation.local_regression import perform_local_regression_batch
+from modeling_permutation.price_panel import PricePanel
+from instrumentation import measure
+from modeling_permutation.imputation_scheduler import run_task_graph, IMPUTATION_DEPENDENCIES
 
-from set_up.constants import PRODUCTS_LABELS, ADMIN_LOCATIONS
-from set_up.addresses_constants import ADRS_IMPUTED
+from set_up.constants import ADMIN_LOCATIONS, CONCURRENT_IMPUTATION_LEVELS, ADRS_IMPUTED
 
 log = logging.getLogger(__name__)  # Logger for this module
 
@@ -29,14 +37,11 @@ def create_admin0_dataset(data):
     """
     # imputed_data = basic_impute_data(data)
     #perform a local regression followed by a global regression for data imputation
-    admin_0_df = data.copy()
-    for product in PRODUCTS_LABELS:
-        single_price_df = admin_0_df[product]
-        single_price_df = single_price_df.reset_index().drop(columns = ["index"])
-        perform_local_regression_imputation(single_price_df)
-        perform_global_regression_imputation(single_price_df, dim = 3)
-        admin_0_df[product] = single_price_df
-    return admin_0_df
+    admin_0_panel = PricePanel.from_frame(data)
+    series_values = admin_0_panel.values.reshape(len(admin_0_panel.months), -1)
+    perform_local_regression_batch(series_values)
+    perform_global_regression_batch(series_values, dim = 3, series_labels = admin_0_panel.products)
+    return admin_0_panel.to_frame()
 
 def perm_admin(admin_label, raw_admin, preprocessed_df = None, higher_admin_final_dataset=None):
     """permute a given admin level
@@ -52,57 +57,145 @@ def perm_admin(admin_label, raw_admin, preprocessed_df = None, higher_admin_fina
     """
     if admin_label == 'admin0_label' or admin_label is None:
         log.info("Start Imputation for the averaged data")
-        return create_admin0_dataset(raw_admin[admin_label])
+        with measure("imputation.admin0_label", items=len(raw_admin[admin_label])):
+            return create_admin0_dataset(raw_admin[admin_label])
     elif admin_label == 'admin1_label':
         log.info("Start Imputation for admin1_label data (may take more than 20 min)")
         # this method may take around 20 minutes to run
-        return create_admin1_dataset(raw_admin[admin_label], admin_label)
+        with measure("imputation.admin1_label", items=len(raw_admin[admin_label])):
+            return create_admin1_dataset(raw_admin[admin_label], admin_label)
     elif admin_label in ('admin2_label', 'admin3_label'):
         log.info("Start Imputation for admin2 or admin3 data")
-        return create_admin_2_3_dataset(raw_admin[admin_label], admin_label, \
-                                        higher_admin_final_dataset, preprocessed_df)
+        with measure(f"imputation.{admin_label}", items=len(raw_admin[admin_label])):
+            return create_admin_2_3_dataset(raw_admin[admin_label], admin_label, \
+                                            higher_admin_final_dataset, preprocessed_df)
     print("error")
     return None
 
-def imput_controler(preprocessed_df, raw_admin):
+def imputed_file(admin_label):
+    """address of the stored imputation of an admin level. It is stored in EXPORT_FORMAT, the
+    file of another export format (e.g. the csv of an earlier run) is used when there is none
+
+    Args:
+        admin_label (String): admin level in question
+
+    Returns:
+        String: address of the file (None if there is no stored imputation)
+    """
+    adrs = ADRS_IMPUTED.get(admin_label)
+    if adrs is None:
+        return None
+    adrs_root = os.path.splitext(adrs)[0]
+    for candidate in [adrs] + [f'{adrs_root}.{export_format}' for export_format in EXPORT_FUNCTIONS]:
+        if Path(candidate).is_file():
+            if candidate != adrs:
+                log.info("no %s, the imputation stored in %s is used", adrs, candidate)
+            return candidate
+    return None
+
+def load_imputed(admin_label):
+    """load the imputed data of a previous run
+
+    Args:
+        admin_label (String): admin level in question
+
+    Raises:
+        FileNotFoundError: there is no stored imputation of the admin level
+
+    Returns:
+        dataframe: imputed data of the admin level
+    """
+    log.info("load %s imputation", admin_label)
+    adrs = imputed_file(admin_label)
+    if adrs is None:
+        raise FileNotFoundError(f"no stored imputation of {admin_label} ({ADRS_IMPUTED.get(admin_label)})")
+    return with_month_index(data_loading(adrs))
+
+def reloaded_admin_levels():
+    """admin levels `imput_controler` reads back from ADRS_IMPUTED instead of imputing them:
+    the level above the first imputed admin 2 / 3 level when it is not imputed itself
+
+    Returns:
+        list: admin levels
+    """
+    reloaded = []
+    if "admin1_label" not in ADMIN_LOCATIONS \
+            and ("admin2_label" in ADMIN_LOCATIONS or "admin3_label" in ADMIN_LOCATIONS):
+        reloaded.append("admin1_label")
+    if "admin2_label" not in ADMIN_LOCATIONS and "admin3_label" in ADMIN_LOCATIONS:
+        reloaded.append("admin2_label")
+    return reloaded
+
+def merge_complete_locations(imputed, complete, admin_label):
+    """write the imputed locations of an admin level into the data of all its locations,
+    for the locations that are already complete and were not imputed again
+
+    Args:
+        imputed (dataframe): imputed data of the other locations (None if there are none)
+        complete (dataframe): data of all the locations of the admin level, in their order
+        admin_label (String): admin level in question
+
+    Returns:
+        dataframe: data of all the locations
+    """
+    panel = PricePanel.from_frame(complete, admin_label)
+    if imputed is not None:
+        imputed_panel = PricePanel.from_frame(imputed, admin_label)
+        positions = np.ix_([panel.month_position[month] for month in imputed_panel.months],
+                           [panel.location_position[loc] for loc in imputed_panel.locations],
+                           [panel.product_position[product] for product in imputed_panel.products])
+        panel.values[positions] = imputed_panel.values
+    return panel.to_frame()
+
+def imput_controler(preprocessed_df, raw_admin, complete_admin=None):
     """impute data at diffrent admin level 
 
     Args:
         preprocessed_df (dataframe): preprocessed raw data
         raw_admin (dictionary of dataframes): raw data seperated by admins
+        complete_admin (dictionary of dataframes, optional): data of all the locations of an
+                                admin level, for the levels where `raw_admin` only holds the
+                                locations to impute; the imputed locations are written into it
+                                before the levels below use it. Defaults to None.
 
     Returns:
         dictionary of dataframes: imputed data
         dictionary of dataframes: imputed data with meb
     """
-    data_wihtout_meb = {}
-    imputed_data = {}
+    complete_admin = complete_admin or {}
+
+    def impute_level(admin_label, *args, **kwargs):
+        if admin_label not in complete_admin:
+            return perm_admin(admin_label, raw_admin, *args, **kwargs)
+        imputed = perm_admin(admin_label, raw_admin, *args, **kwargs) \
+            if len(raw_admin[admin_label]) else None
+        return merge_complete_locations(imputed, complete_admin[admin_label], admin_label)
+
+    tasks = {}
 
     if "admin0_label" in ADMIN_LOCATIONS:
-        log.info("perform admin 0 imputation")
-        data_wihtout_meb["admin0_label"] = perm_admin("admin0_label", raw_admin)
+        tasks["admin0_label"] = lambda results: impute_level("admin0_label")
 
     if "admin1_label" in ADMIN_LOCATIONS:
-        log.info("perform admin 1 imputation")
-        data_wihtout_meb["admin1_label"] = perm_admin("admin1_label", raw_admin)
-    elif "admin2_label" in ADMIN_LOCATIONS or "admin3_label" in ADMIN_LOCATIONS:
-        log.info("load admin 1 imputation")
-        data_wihtout_meb["admin1_label"] = data_loading(ADRS_IMPUTED['admin1_label'])
+        tasks["admin1_label"] = lambda results: impute_level("admin1_label")
+    elif "admin1_label" in reloaded_admin_levels():
+        tasks["admin1_label"] = lambda results: load_imputed("admin1_label")
 
     if "admin2_label" in ADMIN_LOCATIONS:
-        log.info("perform admin 2 imputation")
-        data_wihtout_meb["admin2_label"] = perm_admin("admin2_label", raw_admin, preprocessed_df, \
-                                                      higher_admin_final_dataset=\
-                                                        data_wihtout_meb["admin1_label"])
-    elif "admin3_label" in ADMIN_LOCATIONS:
-        log.info("load admin 2 imputation")
-        data_wihtout_meb["admin2_label"] = data_loading(ADRS_IMPUTED['admin2_label'])
+        tasks["admin2_label"] = lambda results: impute_level("admin2_label", preprocessed_df, \
+                                                         higher_admin_final_dataset=\
+                                                           results["admin1_label"])
+    elif "admin2_label" in reloaded_admin_levels():
+        tasks["admin2_label"] = lambda results: load_imputed("admin2_label")
 
     if "admin3_label" in ADMIN_LOCATIONS:
-        log.info("perform admin 3 imputation")
-        data_wihtout_meb["admin3_label"] = perm_admin("admin3_label", raw_admin, preprocessed_df, \
-                                                      higher_admin_final_dataset=\
-                                                        data_wihtout_meb["admin2_label"])
+        tasks["admin3_label"] = lambda results: impute_level("admin3_label", preprocessed_df, \
+                                                         higher_admin_final_dataset=\
+                                                           results["admin2_label"])
+
+    # admin 0 and admin 1 run at the same time, admin 2 and admin 3 wait for the level above
+    results, _ = run_task_graph(tasks, IMPUTATION_DEPENDENCIES, concurrent=CONCURRENT_IMPUTATION_LEVELS)
+    data_wihtout_meb = {admin: results[admin] for admin in IMPUTATION_DEPENDENCIES if admin in results}
 
     log.info("perform MEB calculation")
     imputed_data = mult_admin_meb(data_wihtout_meb.copy())
@@ -0,0 +1,100 @@
+"""
+    run the imputation of the admin levels as a dependency graph: admin levels that do not
+    depend on each other (admin 0 and admin 1) run at the same time
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import time
+
+import pandas as pd
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+# admin level -> admin levels whose imputed data it needs
+IMPUTATION_DEPENDENCIES = {
+    'admin0_label': [],
+    'admin1_label': [],
+    'admin2_label': ['admin1_label'],
+    'admin3_label': ['admin2_label'],
+}
+
+def timed_call(task, results):
+    """run a task and measure its duration
+
+    Args:
+        task (callable): function of the results of the finished tasks
+        results (dict): results of the finished tasks
+
+    Returns:
+        output of the task, start and end time (time.perf_counter)
+    """
+    start = time.perf_counter()
+    output = task(results)
+    return output, start, time.perf_counter()
+
+def critical_path_report(timings, dependencies, origin):
+    """durations of the tasks and the critical path leading to the end of every task
+
+    Args:
+        timings (dict): task -> (start, end) times
+        dependencies (dict): task -> tasks it depends on
+        origin (float): start time of the scheduler
+
+    Returns:
+        dataframe: 'task', 'start', 'seconds' and 'critical_path_seconds' (sum of the durations
+                    of the longest dependency chain ending with the task), in order of completion
+    """
+    critical_path = {}
+    rows = []
+    for task, (start, end) in sorted(timings.items(), key=lambda item: item[1][1]):
+        seconds = end - start
+        critical_path[task] = seconds + max((critical_path[dep] for dep in dependencies.get(task, [])),
+                                            default=0.0)
+        rows.append((task, start - origin, seconds, critical_path[task]))
+    return pd.DataFrame(rows, columns=['task', 'start', 'seconds', 'critical_path_seconds'])
+
+def run_task_graph(tasks, dependencies=None, concurrent=True):
+    """run tasks once the tasks they depend on are done; independent tasks run in threads.
+    Threads are used because the tasks share large dataframes and the heavy stages start
+    their own process pools.
+
+    Args:
+        tasks (dict): task name -> callable receiving the dictionary of finished results
+        dependencies (dict, optional): task name -> names of the tasks it needs.
+                                        Defaults to IMPUTATION_DEPENDENCIES.
+        concurrent (bool, optional): run independent tasks at the same time. Defaults to True.
+
+    Returns:
+        dict: task name -> result
+        dataframe: output of `critical_path_report`
+    """
+    if dependencies is None:
+        dependencies = IMPUTATION_DEPENDENCIES
+    for task in tasks:
+        missing = [dep for dep in dependencies.get(task, []) if dep not in tasks]
+        if missing:
+            raise ValueError(f"{task} depends on {missing}, which are not part of the tasks")
+
+    origin = time.perf_counter()
+    results = {}
+    timings = {}
+    pending = dict(tasks)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(len(tasks), 1) if concurrent else 1) as executor:
+        while pending or running:
+            for task in list(pending):
+                if all(dep in results for dep in dependencies.get(task, [])):
+                    running[executor.submit(timed_call, pending.pop(task), results)] = task
+            if not running:
+                raise ValueError(f"cyclic dependencies between {list(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                results[task], start, end = future.result()
+                timings[task] = (start, end)
+
+    report = critical_path_report(timings, dependencies, origin)
+    for task, start, seconds, critical_path in report.itertuples(index=False):
+        log.info("%s took %.1f s (started after %.1f s), critical path %.1f s",
+                 task, seconds, start, critical_path)
+    return results, report
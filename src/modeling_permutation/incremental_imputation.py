@@ -0,0 +1,243 @@
+"""
+    incremental (monthly) imputation: the imputed data of the previous run is reused for the
+    months before a trailing window, only that window and the series whose raw data changed
+    are imputed again. The reused history is written into the raw data, so the regressions and
+    ARIMA fits of the window treat the imputed values of the previous run as observed prices.
+"""
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from arima_order_cache import series_fingerprint
+from preprocessing.month_index import format_months, month_range, with_month_index
+from modeling_permutation.imputation_controler import imput_controler
+from modeling_permutation.price_panel import PricePanel
+from preprocessing.data_loading import data_loading
+from results.data_export import export_file
+from set_up.addresses_constants import ADRS_IMPUTATION_FINGERPRINTS
+from set_up.constants import ADMIN_LOCATIONS, INCREMENTAL_WINDOW_MONTHS, ADRS_INCREMENTAL_IMPUTED
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+def series_key(location, product):
+    """name of a (location, product) series in the fingerprint file
+
+    Args:
+        location: location label (None for admin level 0)
+        product (String): product label
+
+    Returns:
+        String: key of the series
+    """
+    return f"{location}|{product}"
+
+def raw_fingerprints(panel, months=None):
+    """fingerprints of the raw series of a panel
+
+    Args:
+        panel (PricePanel): raw data of an admin
+        months (list, optional): months covered by the fingerprints. Defaults to None (all).
+
+    Returns:
+        dictionary: series key -> fingerprint
+    """
+    values = panel.values if months is None \
+        else panel.values[[panel.month_position[month] for month in months]]
+    return {series_key(location, product): series_fingerprint(values[:, i, j])
+            for i, location in enumerate(panel.locations)
+            for j, product in enumerate(panel.products)}
+
+def load_fingerprints(adrs=ADRS_IMPUTATION_FINGERPRINTS):
+    """load the fingerprints written by the last imputation
+
+    Args:
+        adrs (String, optional): json file. Defaults to ADRS_IMPUTATION_FINGERPRINTS.
+
+    Returns:
+        dictionary: admin level -> {'months': [first, last month], 'series': fingerprints}
+    """
+    if not Path(adrs).is_file():
+        return {}
+    with open(adrs, encoding='utf-8') as fingerprint_file:
+        return json.load(fingerprint_file)
+
+def save_fingerprints(raw_admin, adrs=ADRS_IMPUTATION_FINGERPRINTS):
+    """store the fingerprints of the raw data the imputation ran on. The fingerprints of the
+    other admin levels in the file are kept
+
+    Args:
+        raw_admin (dictionary of dataframes): raw data seperated by admins
+        adrs (String, optional): json file. Defaults to ADRS_IMPUTATION_FINGERPRINTS.
+
+    Returns:
+        String: address of the file
+    """
+    content = load_fingerprints(adrs)
+    for admin_label, data in raw_admin.items():
+        panel = PricePanel.from_frame(data, admin_label)
+        months = format_months(panel.months)
+        content[admin_label] = {'months': [months[0], months[-1]],
+                                'series': raw_fingerprints(panel)}
+    Path(adrs).parent.mkdir(parents=True, exist_ok=True)
+    with open(adrs, 'w', encoding='utf-8') as fingerprint_file:
+        json.dump(content, fingerprint_file, indent=1, sort_keys=True)
+    return adrs
+
+def load_previous_imputation(admin_label):
+    """load the imputed data of the previous incremental run from ADRS_INCREMENTAL_IMPUTED
+
+    Args:
+        admin_label (String): admin level in question
+
+    Returns:
+        PricePanel: imputed prices (None if there is no file)
+    """
+    adrs = ADRS_INCREMENTAL_IMPUTED.get(admin_label)
+    if adrs is None or not Path(adrs).is_file():
+        return None
+    data = with_month_index(data_loading(adrs)).drop(columns=['meb'], errors='ignore')
+    return PricePanel.from_frame(data, admin_label)
+
+def store_imputation(imputed_data, raw_admin):
+    """store the imputed data in ADRS_INCREMENTAL_IMPUTED together with the fingerprints of the
+    raw data it was imputed from, so that the next incremental run can reuse it. The
+    ADRS_IMPUTED files of the user are not touched
+
+    Args:
+        imputed_data (dictionary of dataframes): imputed data by admin level
+        raw_admin (dictionary of dataframes): raw data seperated by admins
+    """
+    stored = {admin_label for admin_label in ADMIN_LOCATIONS
+              if admin_label in imputed_data and admin_label in raw_admin}
+    for admin_label in stored:
+        Path(ADRS_INCREMENTAL_IMPUTED[admin_label]).parent.mkdir(parents=True, exist_ok=True)
+        export_file(imputed_data[admin_label], ADRS_INCREMENTAL_IMPUTED[admin_label])
+    save_fingerprints({admin_label: raw_admin[admin_label] for admin_label in stored})
+
+def seed_raw_admin(raw_data, admin_label, previous, stored, window_months=INCREMENTAL_WINDOW_MONTHS):
+    """replace the raw prices before the trailing window by the previous imputation, for the
+    series whose raw data did not change. The imputation then only fills the window of these
+    series, the other ones are imputed over their full history. The reused values are not told
+    apart from the raw prices: the regressions and ARIMA fits of the window use them as
+    observed data.
+
+    Args:
+        raw_data (dataframe): raw data of an admin
+        admin_label (String): admin level of the data
+        previous (PricePanel): imputed data of the previous run (or None)
+        stored (dictionary): fingerprints of the previous run for this admin (or None)
+        window_months (int, optional): trailing months imputed again.
+                                        Defaults to INCREMENTAL_WINDOW_MONTHS.
+
+    Returns:
+        dataframe: raw data with the reused history
+        dictionary: number of 'complete' series (nothing left to impute), 'window' series
+                    (only the window is imputed) and 'full' series (imputed from scratch)
+        list: locations whose series are all complete
+    """
+    panel = PricePanel.from_frame(raw_data, admin_label)
+    n_series = len(panel.locations) * len(panel.products)
+    counts = {'complete': 0, 'window': 0, 'full': n_series}
+    if previous is None or not stored:
+        log.info("%s has no previous imputation, all series are imputed", admin_label)
+        return raw_data, counts, []
+
+    stored_months = list(month_range(*stored['months']))
+    if not set(stored_months).issubset(panel.month_position):
+        log.info("%s: the months of the previous imputation are not part of the data, "
+                 "all series are imputed", admin_label)
+        return raw_data, counts, []
+    current = raw_fingerprints(panel, stored_months)
+
+    # months before the window that the previous imputation covers
+    history = [month for month in panel.months[:max(len(panel.months) - window_months, 0)]
+               if month in previous.month_position]
+    rows = [panel.month_position[month] for month in history]
+    previous_rows = [previous.month_position[month] for month in history]
+
+    counts['full'] = 0
+    for i, location in enumerate(panel.locations):
+        for j, product in enumerate(panel.products):
+            key = series_key(location, product)
+            if stored['series'].get(key) != current[key] or location not in previous \
+                    or product not in previous.product_position:
+                counts['full'] += 1
+                continue
+            panel.values[rows, i, j] = previous.values[previous_rows,
+                                                       previous.location_position[location],
+                                                       previous.product_position[product]]
+            counts['complete' if not np.isnan(panel.values[:, i, j]).any() else 'window'] += 1
+
+    complete_locations = [location for i, location in enumerate(panel.locations)
+                          if not np.isnan(panel.values[:, i, :]).any()]
+    return panel.to_frame(), counts, complete_locations
+
+def drop_locations(data, admin_label, locations):
+    """rows of the data that do not belong to the given locations
+
+    Args:
+        data (dataframe): data of an admin
+        admin_label (String): admin level of the data
+        locations (list): locations to drop (None stands for the only location of admin 0)
+
+    Returns:
+        dataframe: remaining rows
+    """
+    if admin_label not in data.columns:
+        return data.iloc[:0] if locations else data
+    return data[~data[admin_label].isin(locations)].reset_index(drop=True)
+
+def incremental_imput_controler(preprocessed_df, raw_admin, window_months=INCREMENTAL_WINDOW_MONTHS):
+    """same as `imput_controler`, but only imputes the last months and the series whose raw
+    data changed since the previous run. The locations whose series are all complete after
+    reusing the previous imputation are not imputed again, except at admin level 1 where they
+    are the neighbours of the geographic imputation (their complete series are not refitted
+    by ARIMA). The result is stored in ADRS_INCREMENTAL_IMPUTED together with the fingerprints of
+    the raw data, for the next run. Without a previous run everything is imputed.
+
+    Args:
+        preprocessed_df (dataframe): preprocessed raw data
+        raw_admin (dictionary of dataframes): raw data seperated by admins
+        window_months (int, optional): trailing months imputed again.
+                                        Defaults to INCREMENTAL_WINDOW_MONTHS.
+
+    Returns:
+        dictionary of dataframes: imputed data
+        dictionary of dataframes: imputed data with meb
+    """
+    stored = load_fingerprints()
+    seeded_admin = dict(raw_admin)
+    complete_admin = {}
+    report = []
+    for admin_label in ADMIN_LOCATIONS:
+        if admin_label not in raw_admin:
+            continue
+        seeded, counts, complete_locations = seed_raw_admin(
+            raw_admin[admin_label], admin_label, load_previous_imputation(admin_label),
+            stored.get(admin_label), window_months)
+        seeded_admin[admin_label] = seeded
+        skipped = 0
+        if complete_locations and admin_label != 'admin1_label':
+            complete_admin[admin_label] = seeded
+            seeded_admin[admin_label] = drop_locations(seeded, admin_label, complete_locations)
+            n_products = len([col for col in seeded.columns if col not in ('year_month', admin_label)])
+            skipped = len(complete_locations) * n_products
+        log.info("%s: %d series skipped, %d complete series imputed with their neighbours, "
+                 "%d imputed over the last %d months, %d imputed over the full history",
+                 admin_label, skipped, counts['complete'] - skipped, counts['window'],
+                 window_months, counts['full'])
+        report.append({'admin': admin_label, 'skipped': skipped, **counts})
+
+    data_wihtout_meb, imputed_data = imput_controler(preprocessed_df, seeded_admin, complete_admin)
+
+    report = pd.DataFrame(report)
+    log.info("incremental imputation: %d series skipped, %d imputed",
+             report['skipped'].sum(),
+             report['complete'].sum() - report['skipped'].sum()
+             + report['window'].sum() + report['full'].sum())
+
+    store_imputation(imputed_data, raw_admin)
+    return data_wihtout_meb, imputed_data
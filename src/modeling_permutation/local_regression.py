@@ -11,7 +11,7 @@ def perform_local_regression_imputation(df, one_way_window=8):
 
     """
     This function performs local regression on a given DataFrame. 
-    It utilizes the `local_regression_lists()` function, which returns a list of lists, each containing an interval of indexes. A polynomial regression is performed around these indexes, and any existing NaN values within the interval are recalculated.
+    It utilizes the `local_regression_intervals()` function, which returns a list of (start, stop) pairs, each describing an interval of indexes. A polynomial regression is performed around these indexes, and any existing NaN values within the interval are recalculated.
 
     Input: 
         A pandas DataFrame with a single column indexed from 0 to ... (indicating the range of data).
@@ -21,15 +21,15 @@ def perform_local_regression_imputation(df, one_way_window=8):
     """
 
     nan_indices = df[df.isna().any(axis=1)].index.tolist()
-    regression_list = local_regression_lists(nan_indices, len(df), one_way_window)
+    regression_intervals = local_regression_intervals(nan_indices, len(df), one_way_window)
 
 
 
-    for i in range(len(regression_list)):
+    for start, stop in regression_intervals:
 
 
             # Here are the predefined indices
-        indices_to_fit = regression_list[i]
+        indices_to_fit = list(range(start, stop))
 
         #print(indices_to_fit)
         
@@ -60,77 +60,120 @@ def perform_local_regression_imputation(df, one_way_window=8):
 
 
 
-def local_regression_lists(nan_indices_raw, ts_length , one_way_window = 8):
+def local_design_matrix(length, degree=3):
 
     """
-    This function receives a list of indexes, each representing a NaN value in a time series. 
-    For each index, a one-way window is applied in both directions to determine a new interval in which the NaN values reside. 
-    The function ensures that the intervals do not overlap; if they do, they are merged into a single interval. 
-    Additionally, intervals are constrained to contain no negative values and no values exceeding the maximum time series length defined by `ts_length`.
+    This function builds the Vandermonde matrix of a polynomial fit over an interval of consecutive indices.
+    The indices are mapped onto [-1, 1] to keep the matrix well conditioned; the fitted polynomial and its predictions are the same as with the raw indices.
 
-    Furthermore, all resulting intervals are checked to ensure that no interval contains less than 40% of its length as valid values (i.e., no more than 40% of the interval is allowed to be NaN values).
+    Inputs:
+        length: An integer giving the number of indices in the interval.
+        degree: An integer giving the degree of the polynomial.
+
+    Output:
+        A numpy array of shape (length, degree + 1).
+    """
+
+    x = np.linspace(-1.0, 1.0, length) if length > 1 else np.zeros(1)
+    return np.vander(x, degree + 1, increasing=True)
+
+
+
+def perform_local_regression_batch(values, one_way_window=8, degree=3):
+
+    """
+    This function performs the same local regression as `perform_local_regression_imputation()`, but on all the series of a 2-D array at once.
+    The intervals of every series are built with `local_regression_intervals()`. They are processed in rounds: round k fits the k-th interval of every series, so that the values imputed by an interval are known to the next interval of the same series, as in the per-series version.
+    Within a round, the intervals are grouped by length. Every group shares one precomputed Vandermonde matrix, the NaN rows of each system are masked out and all the systems of the group are solved by a single stacked pseudo-inverse.
 
     Inputs:
-        nan_indices_raw: A list of indexes corresponding to NaN values in the time series.
+        values: A numpy float array of shape (n_months, n_series), e.g. the values of a `PricePanel` reshaped to (n_months, n_locations * n_products). Every column is a time series indexed from 0 to n_months - 1.
+        one_way_window: An integer representing half the window size, see `local_regression_intervals()`.
+        degree: An integer giving the degree of the polynomial.
+
+    Output:
+        The array, whose NaN values are updated in place with the results of the local regression.
+    """
+
+    n_months = values.shape[0]
+    nan_mask = np.isnan(values)
+
+    # intervals of every series, computed from the NaN values before any imputation
+    series_intervals = []
+    for series in np.flatnonzero(nan_mask.any(axis=0)):
+        intervals = local_regression_intervals(np.flatnonzero(nan_mask[:, series]), n_months, one_way_window)
+        if intervals:
+            series_intervals.append((series, intervals))
+
+    design_matrices = {}
+    n_rounds = max((len(intervals) for _, intervals in series_intervals), default=0)
+    for k in range(n_rounds):
+
+        groups = {}
+        for series, intervals in series_intervals:
+            if k < len(intervals):
+                start, stop = intervals[k]
+                groups.setdefault(stop - start, []).append((series, start))
+
+        for length, tasks in groups.items():
+            if length not in design_matrices:
+                design_matrices[length] = local_design_matrix(length, degree)
+            design = design_matrices[length]
+
+            series = np.array([series for series, _ in tasks])
+            rows = np.array([start for _, start in tasks])[:, None] + np.arange(length)
+            y = values[rows, series[:, None]]  # (n_tasks, length)
+            known = ~np.isnan(y)
+
+            # masked least squares: the NaN rows of every system are set to zero
+            systems = design[None, :, :] * known[:, :, None]
+            coefs = np.linalg.pinv(systems) @ np.where(known, y, 0.0)[:, :, None]
+            predicted = (design[None, :, :] @ coefs)[:, :, 0]
+
+            values[rows[~known], np.broadcast_to(series[:, None], rows.shape)[~known]] = predicted[~known]
+
+    return values
+
+
+
+def local_regression_intervals(nan_indices_raw, ts_length, one_way_window=8):
+
+    """
+    This function receives the indexes of the NaN values of a time series and builds the intervals in which a local regression is performed.
+    For each index, a one-way window is applied in both directions. Overlapping windows are merged into a single interval, and indexes that are too close to the beginning or to the end of the time series are ignored.
+    The intervals are computed in one sweep over the sorted indexes: a new interval starts wherever two consecutive indexes are at least 2 * one_way_window apart.
+
+    An interval is dropped if both its first two indexes are NaN, if one of its last two indexes is NaN, or if more than 60% of it is NaN. The NaN values are counted with the cumulative sum of a boolean mask.
+
+    Inputs:
+        nan_indices_raw: A sorted list or array of the indexes of the NaN values in the time series.
         ts_length: An integer that determines the maximum allowable length of the time series.
         one_way_window: An integer representing half the overall window size that defines the newly created interval.
 
     Outputs:
-        A list of lists, where each sublist contains a new sorted interval. For example, list_of_lists = [[1, 2, 3, 4, 5], [9, 10, 11, 12, 13, 14, 15], ...].
+        A list of (start, stop) pairs, each describing the interval range(start, stop). For example, [(1, 6), (9, 16), ...].
     """
 
-    list_of_lists = []
-    counter = 0
-    counter_list = 0
-
-    #remove indices if they are toc close to the beginning or to the end 
-    nan_indices = [
-        index for index in nan_indices_raw 
-        if index >= 1+ one_way_window and index < ts_length - one_way_window -1
-    ]
+    nan_indices_raw = np.asarray(nan_indices_raw, dtype=np.intp)
+    is_nan = np.zeros(ts_length, dtype=bool)
+    is_nan[nan_indices_raw] = True
+    nan_count = np.concatenate([[0], np.cumsum(is_nan)])
 
-    #generate new intervals
-    for i in (nan_indices):
-        
-        # generate interval
-        new_list = list(range(i - one_way_window, i + one_way_window + 1))
-
-
-        if counter >0:
-            
-            #check if the some intervals overlap
-            if (nan_indices[counter]-one_way_window) < list_of_lists[counter_list-1][-1]:
-                
-                #merge overlapping intervalls
-                list_of_lists[counter_list-1] = list(set(list_of_lists[counter_list-1] + new_list))
-                counter += 1
-                continue
-                    
-            
-        list_of_lists.append(new_list)
-
-        counter += 1
-        counter_list += 1
-
-    #check if end and starting elements of new_list contains a non nan. If it does, neglect this new_list
-    list_of_lists = [
-    lst for lst in list_of_lists
-    if lst and (lst[0] not in nan_indices_raw or lst[1] not in nan_indices_raw) and (lst[-1] not in nan_indices_raw and lst[-2] not in nan_indices_raw)
-        ]
-
-    #make sure that there is enough known data for each regression and not too much NaN
-    delete_counter = 0
-    for i in range(len(list_of_lists)):
-     
-        #check for matching indices
-        common_elements = set(nan_indices_raw).intersection(set(list_of_lists[i-delete_counter]))
-        count_common = len(common_elements)
+    #remove indices if they are too close to the beginning or to the end
+    nan_indices = nan_indices_raw[(nan_indices_raw >= 1 + one_way_window)
+                                  & (nan_indices_raw < ts_length - one_way_window - 1)]
+    if len(nan_indices) == 0:
+        return []
 
-        if count_common > int(0.6*len(list_of_lists[i-delete_counter])):
-            list_of_lists.pop(i-delete_counter)  #remove list if too many nans are available
-            delete_counter += 1
+    #merge the windows of consecutive indices that overlap
+    new_interval = np.flatnonzero(np.diff(nan_indices) >= 2 * one_way_window) + 1
+    starts = nan_indices[np.concatenate([[0], new_interval])] - one_way_window
+    stops = nan_indices[np.concatenate([new_interval - 1, [len(nan_indices) - 1]])] + one_way_window + 1
 
-    return(list_of_lists)
+    #the interval has to start with a known value in its first two and end with known values in its last two positions
+    keep = (~is_nan[starts] | ~is_nan[starts + 1]) & ~is_nan[stops - 1] & ~is_nan[stops - 2]
 
-    
+    #make sure that there is enough known data for each regression and not too much NaN
+    keep &= nan_count[stops] - nan_count[starts] <= (0.6 * (stops - starts)).astype(int)
 
+    return [(int(start), int(stop)) for start, stop in zip(starts[keep], stops[keep])]
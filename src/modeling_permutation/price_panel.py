@@ -0,0 +1,132 @@
+'''
+    array backed price panel shared by the imputation stages
+'''
+import numpy as np
+import pandas as pd
+
+
+class PricePanel:
+    """Dense (month x location x product) float64 price array with label lookup tables.
+
+    The long admin tables are converted into a panel once at the start of an imputation
+    stage and back into a long table at the end. In between, every (location, product)
+    series is reached by position instead of a boolean mask over all the rows.
+
+    Attributes:
+        values (np.ndarray): C-contiguous float64 array of shape
+                                (n_months, n_locations, n_products)
+        months (list): labels of the month axis
+        locations (list): labels of the location axis ([None] for admin level 0)
+        products (list): labels of the product axis
+        admin_label (String): name of the location column (None for admin level 0)
+    """
+
+    def __init__(self, values, months, locations, products, admin_label=None):
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.months = list(months)
+        self.locations = list(locations)
+        self.products = list(products)
+        self.admin_label = admin_label
+
+        if self.values.shape != (len(self.months), len(self.locations), len(self.products)):
+            raise ValueError("values do not match the month, location and product labels")
+
+        self.month_position = {month: i for i, month in enumerate(self.months)}
+        self.location_position = {loc: i for i, loc in enumerate(self.locations)}
+        self.product_position = {product: i for i, product in enumerate(self.products)}
+
+    @classmethod
+    def from_frame(cls, data, admin_label=None):
+        """build a panel from a long admin table
+
+        Args:
+            data (dataframe): 'year_month' column, optional admin label column and
+                                one column per product
+            admin_label (String, optional): name of the location column. None or
+                                'admin0_label' for data without locations. Defaults to None.
+
+        Returns:
+            PricePanel: panel holding a copy of the prices
+        """
+        if admin_label == 'admin0_label' or admin_label not in data.columns:
+            admin_label = None
+        products = [col for col in data.columns if col not in ["year_month", admin_label]]
+
+        month_codes, months = pd.factorize(data["year_month"], use_na_sentinel=False)
+        if admin_label is None:
+            location_codes, locations = np.zeros(len(data), dtype=np.intp), [None]
+        else:
+            location_codes, locations = pd.factorize(data[admin_label], use_na_sentinel=False)
+
+        values = np.full((len(months), len(locations), len(products)), np.nan)
+        values[month_codes, location_codes, :] = data[products].to_numpy(dtype=np.float64)
+        return cls(values, months, locations, products, admin_label)
+
+    def to_frame(self):
+        """convert the panel back into a long admin table (rows ordered by month, then location)
+
+        Returns:
+            dataframe: long table with 'year_month', the admin label and the product columns
+        """
+        n_months, n_locations, n_products = self.values.shape
+        months = np.asarray(self.months)
+        if months.dtype.kind in 'US':  # month strings are stored as python objects
+            months = months.astype(object)
+        frame = {"year_month": np.repeat(months, n_locations)}
+        if self.admin_label is not None:
+            frame[self.admin_label] = np.tile(np.asarray(self.locations, dtype=object), n_months)
+        prices = self.values.reshape(n_months * n_locations, n_products)
+        for i, product in enumerate(self.products):
+            frame[product] = prices[:, i]
+        return pd.DataFrame(frame)
+
+    def copy(self):
+        """copy the panel
+
+        Returns:
+            PricePanel: panel with its own copy of the values
+        """
+        return PricePanel(self.values.copy(), self.months, self.locations, self.products,
+                          self.admin_label)
+
+    def column(self, location, product):
+        """zero-copy view of a single (location, product) series
+
+        Args:
+            location: location label (None for admin level 0)
+            product (String): product label
+
+        Returns:
+            np.ndarray: 1-D view over the month axis; writing to it updates the panel
+        """
+        return self.values[:, self.location_position[location], self.product_position[product]]
+
+    def column_frame(self, location, product):
+        """single column dataframe on top of `column`, indexed from 0 to n_months - 1.
+        It is the input format of the local and global regression functions.
+
+        Args:
+            location: location label (None for admin level 0)
+            product (String): product label
+
+        Returns:
+            dataframe: one column named after the product
+        """
+        return pd.DataFrame(self.column(location, product)[:, None], columns=[product],
+                            copy=False)
+
+    def set_column(self, location, product, values):
+        """write a series back into the panel
+
+        Args:
+            location: location label (None for admin level 0)
+            product (String): product label
+            values (array like): values over the month axis
+        """
+        column = self.column(location, product)
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if not np.shares_memory(column, values):
+            column[:] = values
+
+    def __contains__(self, location):
+        return location in self.location_position
@@ -0,0 +1,164 @@
+"""
+    forecast every (location, product) series of an imputed admin table in a process pool
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import measure, record_item
+from modeling_permutation.price_panel import PricePanel
+from preprocessing.month_index import months_to_timestamps
+from modeling_prediction.model import train_arima_model
+from set_up.constants import FORECAST_REFIT_EACH_STEP, PREDICTION_WORKERS
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+
+def prepare_forecast_series(data, admin_label, chosen_cities, chosen_quantities):
+    """
+    Extract the log-transformed series the models are trained on.
+    :param data: Imputed admin table ('year_month', admin label and product columns) or PricePanel
+    :param admin_label: Admin level of the data
+    :param chosen_cities: Locations to forecast (ignored for admin0_label)
+    :param chosen_quantities: Products to forecast
+    :return: Dictionary (location, product) -> log series and dictionary location -> last date
+    """
+    date_type = 'year_month'
+    if isinstance(data, PricePanel):
+        data = data.to_frame()
+
+    if admin_label == "admin0_label":
+        df = data[[date_type] + chosen_quantities].copy()
+        df[date_type] = months_to_timestamps(df[date_type])
+        location_frames = {None: df.sort_values(by=[date_type])}
+    else:
+        df = data[[date_type, admin_label] + chosen_quantities]
+        df = df[df[admin_label].isin(chosen_cities)].copy()
+        df[date_type] = months_to_timestamps(df[date_type])
+        df = df.sort_values(by=[admin_label, date_type])
+        grouped = dict(tuple(df.groupby(admin_label, sort=False, observed=True)))
+        location_frames = {}
+        for city in chosen_cities:
+            if city not in grouped:
+                log.warning(f"No data for {city}, it is not forecasted")
+                continue
+            location_frames[city] = grouped[city]
+
+    series = {}
+    last_dates = {}
+    for location, location_df in location_frames.items():
+        last_dates[location] = location_df[date_type].iloc[-1]
+        for commodity in chosen_quantities:
+            ts_data = location_df[[date_type, commodity]].set_index(date_type)[commodity]
+            ts_data = ts_data.replace(0, 1e-9).ffill().bfill()
+            series[(location, commodity)] = np.log(ts_data).replace([np.inf, -np.inf], np.nan).dropna()
+    return series, last_dates
+
+
+def forecast_series(series_key, ts_data_log, n_steps, seasonal, refit, order_cache, garch_workers,
+                    garch_executor=None):
+    """
+    Forecast a single series; runs in a worker process.
+    :param series_key: (admin_label, location, product) of the series
+    :param ts_data_log: Log-transformed series
+    :param n_steps: Number of months to forecast
+    :param seasonal: control between garch, arima and sarima
+    :param refit: refit the model after every forecasted step
+    :param order_cache: ArimaOrderCache holding the cached order of the series (or None)
+    :param garch_workers: Number of processes of the GARCH order search
+    :param garch_executor: Process pool of the GARCH order search (only when run serially)
+    :return: series_key, forecast, seconds spent, CPU seconds spent and the order cache with the searched order
+    """
+    _, location, commodity = series_key
+    log.info(f"Processing {commodity} for {location}...")
+    start, cpu_start = time.perf_counter(), time.process_time()
+    forecast = train_arima_model(ts_data_log, n_steps=n_steps, seasonal=seasonal,
+                                 order_cache=order_cache, series_key=series_key,
+                                 refit=refit, n_workers=garch_workers,
+                                 garch_executor=garch_executor)
+    return (series_key, np.asarray(forecast), time.perf_counter() - start,
+            time.process_time() - cpu_start, order_cache)
+
+
+def batch_forecast(data, admin_label, chosen_cities, chosen_quantities, n_steps=1, seasonal=0,
+                   refit=FORECAST_REFIT_EACH_STEP, order_cache=None, n_workers=PREDICTION_WORKERS):
+    """
+    Forecast all (location, product) series of an admin table. The series are trained in a
+    process pool and every result is written into the preallocated output frame as soon as
+    it is done.
+    :param data: Imputed admin table ('year_month', admin label and product columns) or PricePanel
+    :param admin_label: Admin level of the data
+    :param chosen_cities: Locations to forecast (ignored for admin0_label)
+    :param chosen_quantities: Products to forecast
+    :param n_steps: Number of months to forecast
+    :param seasonal: control between garch, arima and sarima
+    :param refit: refit the models after every forecasted step instead of fitting once
+    :param order_cache: ArimaOrderCache shared by the series (arima and sarima only)
+    :param n_workers: Number of processes (None uses all cores, 1 is serial)
+    :return: Forecast dataframe (admin label, 'year_month' and product columns, one row per
+             location and month) and a dataframe of the seconds spent on every series,
+             slowest first
+    """
+    date_type = 'year_month'
+    series, last_dates = prepare_forecast_series(data, admin_label, chosen_cities, chosen_quantities)
+    locations = list(last_dates)
+    location_position = {location: i for i, location in enumerate(locations)}
+    product_position = {commodity: i for i, commodity in enumerate(chosen_quantities)}
+
+    # Preallocate the output: n_steps rows per location, in the order of the chosen cities
+    forecast_df = pd.DataFrame({
+        date_type: np.concatenate([pd.date_range(start=last_dates[location], periods=n_steps + 1,
+                                                 freq='MS')[1:] for location in locations]),
+    })
+    if admin_label != "admin0_label":
+        forecast_df.insert(0, admin_label, np.repeat(np.asarray(locations, dtype=object), n_steps))
+    first_product = forecast_df.shape[1]
+    for commodity in chosen_quantities:
+        forecast_df[commodity] = np.nan
+
+    # Every worker only receives the cached order of its own series
+    tasks = []
+    for (location, commodity), ts_data_log in series.items():
+        series_key = (admin_label, location, commodity)
+        task_cache = None
+        if order_cache is not None:
+            key = order_cache.key(*series_key, ts_data_log, seasonal=seasonal == 1)
+            task_cache = order_cache.subset([key])
+        tasks.append((series_key, ts_data_log, n_steps, seasonal, refit, task_cache))
+
+    # nested process pools are avoided: the GARCH search runs serially inside the workers
+    garch_workers = (PREDICTION_WORKERS or os.cpu_count() or 1) if n_workers == 1 else 1
+    executor = ProcessPoolExecutor(max_workers=n_workers) if n_workers != 1 else None
+    # the GARCH search pool is created once and used by the searches of all the series
+    garch_executor = ProcessPoolExecutor(max_workers=garch_workers) \
+        if seasonal not in (0, 1) and garch_workers > 1 else None
+    timings = []
+    try:
+        with measure("prediction.batch_forecast", items=len(tasks)):
+            if executor is None:
+                results = (forecast_series(*task, garch_workers, garch_executor) for task in tasks)
+            else:
+                log.info(f"Forecasting {len(tasks)} series in a process pool")
+                futures = [executor.submit(forecast_series, *task, garch_workers) for task in tasks]
+                results = (future.result() for future in as_completed(futures))
+
+            for (_, location, commodity), forecast, seconds, cpu_seconds, task_cache in results:
+                row = location_position[location] * n_steps
+                forecast_df.iloc[row:row + n_steps, first_product + product_position[commodity]] = forecast
+                timings.append((location, commodity, seconds))
+                record_item("prediction.forecast_series", seconds, cpu_seconds)
+                if task_cache is not None:
+                    order_cache.merge(task_cache)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if garch_executor is not None:
+            garch_executor.shutdown(cancel_futures=True)
+
+    timings = pd.DataFrame(timings, columns=[admin_label, 'product', 'seconds'])
+    timings = timings.sort_values(by='seconds', ascending=False, ignore_index=True)
+    return forecast_df, timings
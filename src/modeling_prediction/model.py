@@ -1,3 +1,6 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
 from statsmodels.tsa.arima.model import ARIMA
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 from arch import arch_model
@@ -6,72 +9,172 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import logging
-from set_up.constants import PRODUCTS_LABELS
+from set_up.constants import PRODUCTS_LABELS, FORECAST_REFIT_EACH_STEP, \
+    PREDICTION_WORKERS, GARCH_SEARCH_PATIENCE
 from calculate_meb import generate_average_meb
+from arima_order_cache import ArimaOrderCache
+from preprocessing.month_index import months_to_timestamps
 
 log = logging.getLogger(__name__)  # Logger for this module
 
 
 # Function to automatically determine ARIMA parameters
-def find_arima_parameters(series, seasonal=False):
+def find_arima_parameters(series, seasonal=False, order_cache=None, series_key=None):
     """
     Find the best ARIMA (p, d, q) parameters for a time series using auto_arima.
     :param series: Time series data
+    :param seasonal: also search the seasonal order
+    :param order_cache: ArimaOrderCache to reuse the order of an unchanged series
+    :param series_key: (admin_label, location, product) of the series, needed for the cache
     :return: List of ARIMA parameters [p, d, q]
     """
-    auto_arima_model = pm.auto_arima(series, stepwise=False, seasonal=False)
+    key = None
+    if order_cache is not None and series_key is not None:
+        key = order_cache.key(*series_key, series, seasonal=seasonal)
+        cached_order = order_cache.lookup(key)
+        if cached_order is not None:
+            return cached_order
+
     if seasonal:
         auto_arima_model = pm.auto_arima(series, stepwise=False, seasonal=True, m=12)
+        if key is not None:
+            order_cache.store(key, auto_arima_model.order, auto_arima_model.seasonal_order)
         return auto_arima_model.order, auto_arima_model.seasonal_order
     else:
         auto_arima_model = pm.auto_arima(series, stepwise=False, seasonal=False)
+        if key is not None:
+            order_cache.store(key, auto_arima_model.order)
         return auto_arima_model.order
 
+# Function to fit one row (fixed p) of the GARCH grid
+def fit_garch_row(data, p, q_values, patience=None):
+    """
+    Fit GARCH(p, q) for the given q values in increasing order.
+    :param data: Time series data
+    :param p: GARCH p of the row
+    :param q_values: q values to fit
+    :param patience: stop the row after this many fits without AIC improvement (None fits all of them)
+    :return: List of dictionaries with p, q, aic and error of every fit that was tried
+    """
+    rows = []
+    best_aic = np.inf
+    fits_without_improvement = 0
+
+    for q in q_values:
+        try:
+            # Fit GARCH model
+            model = arch_model(data, vol='Garch', p=p, q=q, dist='normal')
+            model_fit = model.fit(disp="off")
+            rows.append({'p': p, 'q': q, 'aic': model_fit.aic, 'error': None})
+        except Exception as e:
+            rows.append({'p': p, 'q': q, 'aic': np.nan, 'error': str(e)})
+
+        if patience is None:
+            continue
+        if rows[-1]['aic'] < best_aic:
+            best_aic = rows[-1]['aic']
+            fits_without_improvement = 0
+        elif np.isfinite(best_aic):  # failed fits before the first successful one do not count
+            fits_without_improvement += 1
+            if fits_without_improvement >= patience:
+                break
+
+    return rows
+
 # Function to get the best GARCH parameters
-def get_best_garch_params(data, max_p=5, max_q=5):
+def get_best_garch_params(data, max_p=5, max_q=5, n_workers=PREDICTION_WORKERS,
+                          patience=GARCH_SEARCH_PATIENCE, return_table=False, executor=None):
     """
     Automatically select the best GARCH(p, q) parameters based on AIC.
+    The rows of the (p, q) grid are fitted in a process pool. With a patience, a row stops
+    once its AIC stops improving and the search stops once whole rows stop improving it.
+    The result does not depend on the number of workers.
     :param data: Time series data
     :param max_p: Maximum value of p to search
     :param max_q: Maximum value of q to search
-    :return: Best (p, q) parameters
+    :param n_workers: Number of processes (None uses all cores, 1 is serial)
+    :param patience: Number of fits / rows without AIC improvement before the search stops
+                     expanding p or q (None searches the full grid)
+    :param return_table: Also return the AIC table of every fit that was tried
+    :param executor: Process pool of the caller, reused for all its series (a pool of n_workers
+                     processes is created for this search if None)
+    :return: Best (p, q) parameters (and the AIC table if return_table)
+    :raises ValueError: No (p, q) fit succeeded
     """
+    n_workers = n_workers or os.cpu_count() or 1
+    q_values = {p: [q for q in range(max_q + 1) if not (p == 0 and q == 0)]  # Skip invalid GARCH(0, 0)
+                for p in range(max_p + 1)}
+    p_values = list(q_values)
+    # without a patience every row is needed, so they are all fitted at once
+    batch_size = len(p_values) if patience is None else n_workers
+
     best_aic = np.inf
     best_order = None
-    
-    for p in range(max_p + 1):
-        for q in range(max_q + 1):
-            if p == 0 and q == 0:  # Skip invalid GARCH(0, 0)
-                continue
-            
-            try:
-                # Fit GARCH model
-                model = arch_model(data, vol='Garch', p=p, q=q, dist='normal')
-                model_fit = model.fit(disp="off")
-                
-                # Check AIC
-                if model_fit.aic < best_aic:
-                    best_aic = model_fit.aic
-                    best_order = (p, q)
-            except Exception as e:
-                log.error(f"Error fitting GARCH({p}, {q}): {e}")
-                log.error(f"Choose ARIMA instead")                
-                continue
-    
+    table = []
+    rows_without_improvement = 0
+    own_executor = executor is None and n_workers > 1
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=n_workers)
+
+    try:
+        for start in range(0, len(p_values), batch_size):
+            batch = p_values[start:start + batch_size]
+            args = ([data] * len(batch), batch, [q_values[p] for p in batch], [patience] * len(batch))
+            row_results = executor.map(fit_garch_row, *args) if executor else map(fit_garch_row, *args)
+
+            stop_search = False
+            for rows in row_results:
+                row_improved = False
+                for row in rows:
+                    table.append(row)
+                    if row['error'] is not None:
+                        log.error(f"Error fitting GARCH({row['p']}, {row['q']}): {row['error']}")
+                        log.error(f"Choose ARIMA instead")
+                    # Check AIC
+                    elif row['aic'] < best_aic:
+                        best_aic = row['aic']
+                        best_order = (row['p'], row['q'])
+                        row_improved = True
+
+                # rows before the first successful fit (e.g. p = 0) do not use up the patience
+                if row_improved or best_order is None:
+                    rows_without_improvement = 0
+                else:
+                    rows_without_improvement += 1
+                if patience is not None and rows_without_improvement >= patience:
+                    stop_search = True
+                    break
+            if stop_search:
+                break
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+    if best_order is None:
+        raise ValueError(f"none of the {len(table)} GARCH(p, q) fits succeeded, choose ARIMA instead")
+    if return_table:
+        return best_order, pd.DataFrame(table, columns=['p', 'q', 'aic', 'error'])
     return best_order
 
 # Functions for rolling forecast
-def n_step_arima_forecast(data, n_steps):
+def n_step_arima_forecast(data, n_steps, order_cache=None, series_key=None,
+                          refit=FORECAST_REFIT_EACH_STEP):
     """
     Perform n-step recursive (rolling) forecast using ARIMA.
     :param data: Original time series data
     :param n_steps: Number of steps to forecast
+    :param order_cache: ArimaOrderCache passed to find_arima_parameters
+    :param series_key: (admin_label, location, product) of the series
+    :param refit: refit the model after every step instead of forecasting the horizon from one fit
     :return: List of n-step forecasts
     """
-    arima_params = find_arima_parameters(data)
+    arima_params = find_arima_parameters(data, order_cache=order_cache, series_key=series_key)
     model = ARIMA(data, order=arima_params)
     model_fit = model.fit()
     log.info("Model is fit")
+    if not refit:
+        return list(np.asarray(model_fit.forecast(steps=n_steps)))
+
     predictions = []
     history = data.copy() 
     
@@ -90,18 +193,27 @@ def n_step_arima_forecast(data, n_steps):
         
     return predictions
 
-def n_step_garch_forecast(data, n_steps):
+def n_step_garch_forecast(data, n_steps, refit=FORECAST_REFIT_EACH_STEP, n_workers=PREDICTION_WORKERS,
+                          executor=None):
     """
     Perform n-step recursive (rolling) forecast using GARCH.
     :param data: Original time series data
     :param garch_params: GARCH parameters (p, q)
     :param n_steps: Number of steps to forecast
+    :param refit: refit the model after every step instead of forecasting the horizon from one fit
+    :param n_workers: Number of processes of the GARCH order search
+    :param executor: Process pool of the GARCH order search, see get_best_garch_params
     :return: List of n-step forecasts
     """
-    p, q = get_best_garch_params(data)  # GARCH(p, q)
+    (p, q), aic_table = get_best_garch_params(data, n_workers=n_workers, return_table=True,
+                                              executor=executor)  # GARCH(p, q)
+    log.info(f"GARCH({p}, {q}) chosen out of {len(aic_table)} fits")
     model = arch_model(data, vol='Garch', p=p, q=q, dist='normal')
     model_fit = model.fit(disp="off")
-    
+    if not refit:
+        forecast = model_fit.forecast(horizon=n_steps)
+        return list(forecast.mean.iloc[-1].to_numpy())  # Mean forecasts h.1 ... h.n_steps
+
     # Initialize forecast list
     predictions = []
     history = data.copy()  # Simulate rolling updates
@@ -121,10 +233,14 @@ def n_step_garch_forecast(data, n_steps):
         
     return predictions
 
-def n_step_sarima_forecast(data, n_steps):
-    sarima_params, seasonal_order = find_arima_parameters(data, seasonal=True)
+def n_step_sarima_forecast(data, n_steps, order_cache=None, series_key=None,
+                           refit=FORECAST_REFIT_EACH_STEP):
+    sarima_params, seasonal_order = find_arima_parameters(data, seasonal=True, order_cache=order_cache,
+                                                          series_key=series_key)
     model = SARIMAX(data, order=sarima_params, seasonal_order=seasonal_order, enforce_stationarity=False, enforce_invertibility=False)
     model_fit = model.fit(disp=False)
+    if not refit:
+        return list(np.asarray(model_fit.forecast(steps=n_steps)))
     
     # Initialize the forecast list
     predictions = []
@@ -145,21 +261,27 @@ def n_step_sarima_forecast(data, n_steps):
     return predictions
 
 # Main MODEL training function
-def train_arima_model(data, n_steps=1, seasonal = 0):
+def train_arima_model(data, n_steps=1, seasonal = 0, order_cache=None, series_key=None,
+                      refit=FORECAST_REFIT_EACH_STEP, n_workers=PREDICTION_WORKERS, garch_executor=None):
     """
     Train ARIMA models for each commodity, calculate rolling forecasts, and evaluate MEB.
     :param data: DataFrame of log-transformed commodity prices
     :param n_steps: Number of steps to forecast
     :param seasonal: control between garch, arima and sarima
+    :param order_cache: ArimaOrderCache used by the arima and sarima order search
+    :param series_key: (admin_label, location, product) of the series
+    :param refit: refit the model after every forecasted step (slow) instead of fitting once
+    :param n_workers: Number of processes of the GARCH order search
+    :param garch_executor: Process pool of the GARCH order search, shared by the series of the caller
     :return: MAPE of the final MEB forecast or forecast for n_steps
     """
     # Perform n-step forecast for future predictions
     if seasonal == 1:
-        predictions = n_step_sarima_forecast(data, n_steps)
+        predictions = n_step_sarima_forecast(data, n_steps, order_cache, series_key, refit)
     elif seasonal == 0:
-        predictions = n_step_arima_forecast(data, n_steps)
+        predictions = n_step_arima_forecast(data, n_steps, order_cache, series_key, refit)
     else:
-        predictions = n_step_garch_forecast(data, n_steps)
+        predictions = n_step_garch_forecast(data, n_steps, refit, n_workers, garch_executor)
     # convert the log-transformed predictions back to the original scale
     predictions = np.exp(predictions)
     # print(f'Future forecast for {n_steps} steps:', predictions)
@@ -167,7 +289,8 @@ def train_arima_model(data, n_steps=1, seasonal = 0):
        
 
 # Control function to manage data loading and model training
-def model_controler(df_main, admin_label, chosen_cities, chosen_quantities, n_steps=1, seasonal = 0):
+def model_controler(df_main, admin_label, chosen_cities, chosen_quantities, n_steps=1, seasonal = 0,
+                    refit=FORECAST_REFIT_EACH_STEP):
     """
     Control function to manage data loading and model training.
     :param df: DataFrame containing the data
@@ -175,6 +298,7 @@ def model_controler(df_main, admin_label, chosen_cities, chosen_quantities, n_st
     :param chosen_quantities: List of commodities / products to process 
     :param n_steps: Number of steps to forecast / number of months
     :param seasonal: control between garch, arima and sarima
+    :param refit: refit the models after every forecasted step instead of fitting once
     :return: Single dataframe of forecasts for each city and commodity   
     """
 
@@ -185,8 +309,8 @@ def model_controler(df_main, admin_label, chosen_cities, chosen_quantities, n_st
     # get column names
     # convert list element to string
     # if admin_label is empty then set it as admin0_label
-    # deep copy dataframe
-    df = df_main.copy()
+    # batch_forecast only copies the columns it needs
+    df = df_main
     if admin_label != "admin0_label":
         if "all" in chosen_cities or "ALL" in chosen_cities:
             chosen_cities = df[admin_label].unique()
@@ -195,102 +319,27 @@ def model_controler(df_main, admin_label, chosen_cities, chosen_quantities, n_st
         is_meb = True
         chosen_quantities = PRODUCTS_LABELS
 
-        
-    df[date_type] = pd.to_datetime(df[date_type], errors='coerce')
-
-    # Convert 'date' to datetime and sort for time-series modeling
+    # batch_forecast imports this module for train_arima_model, it is imported here so that
+    # neither module depends on the import order
+    from modeling_prediction.batch_forecast import batch_forecast  # pylint: disable=import-outside-toplevel
 
-    overall_forecast = {}
-    # Loop over each city and each commodity, make sure, it is not admin0_label 
-    if admin_label != "admin0_label":
-        filtered_df = df.sort_values(by=[admin_label, date_type])
-
-        # Filter the data to include only the chosen cities and commodities
-        filtered_df = filtered_df[filtered_df[admin_label].isin(chosen_cities)][[date_type, admin_label] + chosen_quantities]
-
-        for city in chosen_cities:
-            city_df = filtered_df[filtered_df[admin_label] == city]
-            commodity_forecast = {}
+    # orders of series that did not change since the last run are reused
+    order_cache = ArimaOrderCache() if seasonal in (0, 1) else None
 
-            for commodity in chosen_quantities:
-                log.info(f"Processing {commodity} for {city}...")
-
-                # Extract time series for the current city and commodity
-                ts_data = city_df[[date_type, commodity]].set_index(date_type)[commodity]
-                ts_data = ts_data.replace(0, 1e-9).fillna(method='ffill').fillna(method='bfill')
-                ts_data_log = np.log(ts_data).replace([np.inf, -np.inf], np.nan).dropna()
-
-                # Train a model and calculate MEB forecast MAPE
-                # Perform n-step future forecasting
-                forecast = train_arima_model(ts_data_log, n_steps=n_steps, seasonal=seasonal)
-                # convert forecast to a dictionary
-                commodity_forecast[commodity] = forecast
-
-            
-            
-            # convert commodity_forecast as a dataframe with date, admin_label and prices as columns
-            forecast_df = pd.DataFrame(commodity_forecast)
-            forecast_df[date_type] = pd.date_range(
-                start=ts_data.index[-1], 
-                periods=len(forecast_df) + 1, 
-                freq='MS'
-            )[1:]
-            forecast_df[admin_label] = city
-            forecast_df = forecast_df[[admin_label, date_type] + chosen_quantities]
-            overall_forecast[city] = forecast_df
-        # combine all forecasted dataframes into a single dataframe
-        overall_forecast = pd.concat(overall_forecast.values(), ignore_index=True)
-    
-    else: # if it is admin0_label
-        filtered_df = df.sort_values(by=[date_type])
-
-        # Filter the data to include only the chosen commodities
-
-        for commodity in chosen_quantities:
-
-            log.info(f"Processing {commodity}... for {admin_label}")
-            commodity_forecast = {}
-            # Extract time series for the current commodity
-            ts_data = filtered_df[[date_type, commodity]].set_index(date_type)[commodity]
-            ts_data = ts_data.replace(0, 1e-9).fillna(method='ffill').fillna(method='bfill')
-            ts_data_log = np.log(ts_data).replace([np.inf, -np.inf], np.nan).dropna()
-
-            # Train a model and calculate MEB forecast MAPE
-            # Perform n-step future forecasting
-            forecast = train_arima_model(ts_data_log, n_steps=n_steps, seasonal=seasonal)
-            # convert forecast to a dictionary
-
-            # convert commodity_forecast as a dataframe with date, prices as columns
-            forecast_df = pd.DataFrame(forecast, columns=[commodity])
-            forecast_df[date_type] = pd.date_range(
-                start=ts_data.index[-1], 
-                periods=len(forecast_df) + 1, 
-                freq='MS'
-            )[1:]
-            log.info(forecast_df.head())
-            overall_forecast[commodity] = forecast_df
-        # Start with an empty dataframe to accumulate the combined results
-        overall_forecast_combined = None
-
-        # Iterate through overall_forecast and merge dataframes
-        for commodity, forecast_df in overall_forecast.items():
-            if overall_forecast_combined is None:
-                # Start with the first forecast dataframe
-                overall_forecast_combined = forecast_df
-            else:
-                # Merge with the existing combined dataframe on the date column
-                overall_forecast_combined = pd.merge(
-                    overall_forecast_combined, 
-                    forecast_df, 
-                    on=date_type,  # Ensure the date column is the same
-                    how='outer'    # Use outer join to include all dates
-                )
+    # Forecast every (city, commodity) series in parallel
+    overall_forecast, timings = batch_forecast(df, admin_label, chosen_cities, chosen_quantities,
+                                               n_steps=n_steps, seasonal=seasonal, refit=refit,
+                                               order_cache=order_cache)
+    log.info(f"Forecasted {len(timings)} series in {timings['seconds'].sum():.1f} s of model time, "
+             f"slowest:\n{timings.head()}")
 
-        # Ensure the final dataframe is sorted by date
-        overall_forecast = overall_forecast_combined.sort_values(by=date_type)
+    if admin_label == "admin0_label":
+        # same column order as the former merge of the per commodity forecasts
+        overall_forecast = overall_forecast[chosen_quantities[:1] + [date_type] + chosen_quantities[1:]]
 
-        # Reset index for a cleaner look
-        overall_forecast.reset_index(drop=True, inplace=True)
+    if order_cache is not None:
+        order_cache.log_stats("prediction")
+        order_cache.save()
 
     if is_meb:
         # Calculate MEB and store it in a new column
@@ -314,8 +363,8 @@ def plot_results(results, filtered_df, admin_label, chosen_cities, chosen_quanti
     :param chosen_quantities: List of commodities to process.
     """
     date_type = 'year_month'
-    filtered_df[date_type] = pd.to_datetime(filtered_df[date_type])
-    results[date_type] = pd.to_datetime(results[date_type])
+    filtered_df[date_type] = months_to_timestamps(filtered_df[date_type])
+    results[date_type] = months_to_timestamps(results[date_type])
 
     if admin_label != "admin0_label":
         for city in chosen_cities:
@@ -1,6 +1,7 @@
 from set_up.constants import PREDICT_ADMIN
 # from preprocessing.prim_imputations import basic_impute_data
 from modeling_prediction.model import model_controler
+from preprocessing.month_index import timestamps_to_months
 import logging
 
 log = logging.getLogger(__name__)  # Logger for this module
@@ -29,6 +30,7 @@ def prediction_controler(imputed_dataframe, admin_label, cities, products, n_mon
     # Get the data for the admin level, cities and products
     # seasonal = 0 (ARIMA), 1 (S-ARIMA), any other integer (GARCH)... GARCH is the better model
     predicted_data = model_controler(imputed_dataframe, admin_label, cities, products, n_steps = n_months, seasonal = 2)
-    predicted_data['year_month'] = predicted_data['year_month'].dt.strftime('%Y-%m') # do we need this line
+    # back to the month index of the imputed data, strings are only written at export
+    predicted_data['year_month'] = timestamps_to_months(predicted_data['year_month'])
 
     return predicted_data
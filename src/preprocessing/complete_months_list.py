@@ -2,70 +2,65 @@
 get a list of all the months in the data range including the missing months
 """
 
-from datetime import datetime
-import pandas as pd
+import numpy as np
 
-def find_matching_id(data, date):
-    """find an index of a month
+from preprocessing.month_index import parse_month, month_range
+
+def trim_months(data, min_date=None, max_date=None):
+    """keep the rows between two months with a binary search over the month column.
+    The bounds do not have to be present in the data.
 
     Args:
-        data (dataframe): data that is being croped
-        date (String): date the is being looked up
+        data (dataframe): data sorted by 'year_month'
+        min_date (int or String, optional): first month to keep. Defaults to None (no lower cut).
+        max_date (int or String, optional): last month to keep. Defaults to None (no upper cut).
 
     Returns:
-        int: index of the month that is being looked up
+        dataframe: row slice of the data (a view, the data is not copied). The rows keep their
+                   index labels; resetting the index would copy the data
     """
-    try:
-        matching_index = data.index[data['year_month'] == date][0]
-        return matching_index
-    except IndexError:
-        return -1
+    months = data['year_month'].to_numpy()
+    start = 0 if min_date is None else np.searchsorted(months, parse_month(min_date), side='left')
+    stop = len(months) if max_date is None \
+        else np.searchsorted(months, parse_month(max_date), side='right')
+    return data.iloc[start:max(start, stop)]
 
 def remover_early_months(data, min_date): # min_date = '2016-03'
     """cut out dates before the max month of interest
 
     Args:
-        data (dataframe): data of an admin
+        data (dataframe): data of an admin, sorted by month
         min_date (String): min date in the range
 
     Returns:
-        dataframe: data without the too early months
+        dataframe: data without the too early months, with a new RangeIndex
     """
-    min_month_id = find_matching_id(data, min_date)
-    cut_data = data.copy()[min_month_id:].reset_index(drop=True)
-    return cut_data
+    return trim_months(data, min_date=min_date).reset_index(drop=True)
 
 def remover_late_months(data, max_date):
     """cut out dates beyond the max month of interest
 
     Args:
-        data (dataframe): data of an admin
+        data (dataframe): data of an admin, sorted by month
         max_date (String): max date in the range
 
     Returns:
-        dataframe: data without the too late months
+        dataframe: data without the too late months, with a new RangeIndex
     """
-    max_month_id = find_matching_id(data, max_date)
-    cut_data = data.copy()[:max_month_id+1].reset_index(drop=True)
-    return cut_data
+    return trim_months(data, max_date=max_date).reset_index(drop=True)
 
 def find_missing_months(start, end):
     """determine a full list of months
 
     Args:
-        start (String): earlier month
-        end (String): latest month
+        start (int or String): earlier month
+        end (int or String): latest month
 
     Returns:
-        list of string: list of all the motnhs
+        list of int: list of all the motnhs (month index)
     """
     # Generate a list of full date range (no missing months)
-    start_date = pd.to_datetime(start, format='%Y-%m') # The earliest date
-    end_date = pd.to_datetime(end, format='%Y-%m')  # The latest date
-    # Generate all months in the range
-    full_date_range = pd.date_range(start=start_date, \
-                                    end=end_date, freq='MS').strftime('%Y-%m').tolist()
-    return full_date_range
+    return list(month_range(start, end))
 
 def get_full_dates_list(data_partial, min_date = None, max_date=None):
     """get a list of all the months in the data range including the missing months
@@ -75,25 +70,22 @@ def get_full_dates_list(data_partial, min_date = None, max_date=None):
         max_date (striing, optional): max month of th data, excluding fututre months. 
                                         Defaults to None.
     """
-    def get_datetime(date):
-        return datetime.strptime(date, '%Y-%m')
-
-    data = data_partial.copy()
+    data = data_partial
 
     if min_date is None:
         min_date = data['year_month'].iloc[0]
     if max_date is None:
         max_date = data['year_month'].iloc[-1]
+    # the bounds can be given as 'yyyy-mm', the data uses the month index
+    min_date, max_date = parse_month(min_date), parse_month(max_date)
 
     earliest_data = data['year_month'].iloc[0]
     latest_data = data['year_month'].iloc[-1]
 
-    if get_datetime(latest_data) > get_datetime(max_date):
-        data = remover_late_months(data, max_date=max_date)
-        latest_data = max_date
-
-    if get_datetime(earliest_data) < get_datetime(min_date):
-        data = remover_early_months(data, min_date=min_date)
+    # the cut data is a view of the rows of interest, it keeps their index labels
+    if latest_data > max_date or earliest_data < min_date:
+        data = trim_months(data, min_date=min_date, max_date=max_date)
+    latest_data = min(latest_data, max_date)
     earliest_data = min_date
 
     months_lst = sorted(find_missing_months(earliest_data, latest_data))
@@ -3,8 +3,21 @@ clean data as part of the preprocessing stage
 """
 
 import numpy as np
+import pandas as pd
 
 from set_up.constants import PRODUCTS_LABELS
+from preprocessing.month_index import month_number, MONTH_DTYPE
+
+# columns of the raw data used by the pipeline, the other columns are dropped
+RELEVANT_COLUMNS = ['uuid', 'year_month', 'date', 'year', 'month', 'admin1_code',
+                    'admin1_label', 'admin2_code', 'admin2_label', 'admin3_code',  
+                    'admin3_label', 'admin4_code', 'admin4_label', 'urban_rural',
+                    'meb', 'bulgur_price','rice_price', 'bread_price', 
+                    'lentil_price', 'vegetable_oil_price','sugar_price', 'salt_price', 
+                    'tomato_price', 'potato_price', 'onion_price', 'cucumber_price', 
+                    'chicken_meat_price', 'egg_price', 'tomato_paste_price',
+                    'soap_price','laundry_soap_bar_price', 'toothpaste_price', 
+                    'sanitary_pad_price', 'kerosene_manually_refined_price']
 
 def isolate_relevant_goods_columns(data):
     """filter the data to have only the relevant columns
@@ -15,16 +28,7 @@ def isolate_relevant_goods_columns(data):
     Returns:
         dataframe: filtered data
     """
-    all_relelvant_labels = ['uuid', 'year_month', 'date', 'year', 'month', 'admin1_code',
-                            'admin1_label', 'admin2_code', 'admin2_label', 'admin3_code',  
-                            'admin3_label', 'admin4_code', 'admin4_label', 'urban_rural',
-                            'meb', 'bulgur_price','rice_price', 'bread_price', 
-                            'lentil_price', 'vegetable_oil_price','sugar_price', 'salt_price', 
-                            'tomato_price', 'potato_price', 'onion_price', 'cucumber_price', 
-                            'chicken_meat_price', 'egg_price', 'tomato_paste_price',
-                            'soap_price','laundry_soap_bar_price', 'toothpaste_price', 
-                            'sanitary_pad_price', 'kerosene_manually_refined_price']
-    present_labels = [label for label in all_relelvant_labels if label in data.columns]
+    present_labels = [label for label in RELEVANT_COLUMNS if label in data.columns]
     relevant_goods_data = data[present_labels]
     return relevant_goods_data
 
@@ -77,7 +81,8 @@ def convert_months_to_num(data):
     return relevant_goods_data
 
 def concat_mont_year(data):
-    """convert the 'date' column of format yyyy-mm-dd to 'year_month' of the format yyyy-mm
+    """convert the 'year' and 'month' columns into a 'year_month' month index
+    (months since 1970-01, see preprocessing.month_index)
 
     Args:
         data (dataframe): data with date column
@@ -86,8 +91,12 @@ def concat_mont_year(data):
         dataframe: data with year-month column
     """
     adjusted_data = data.copy()
-    adjusted_data['year_month'] = data['year'].astype(str) + '-' \
-        + data['month'].astype(str).str.zfill(2)
+    year_month = pd.Series(month_number(pd.to_numeric(data['year'], errors='coerce'),
+                                        pd.to_numeric(data['month'], errors='coerce')),
+                           index=data.index)
+    # rows without a valid year or month get a missing month
+    adjusted_data['year_month'] = year_month.astype('Int32' if year_month.isna().any()
+                                                    else MONTH_DTYPE)
     adjusted_data.drop(columns=['year', 'month'], inplace=True)
     cols = adjusted_data.columns.tolist()  # Get a list of all columns
     cols.insert(1, cols.pop(cols.index('year_month')))
@@ -7,7 +7,8 @@ import logging
 import pandas as pd
 from python_calamine import CalamineWorkbook
 import pyarrow
-from pyarrow import csv
+from pyarrow import csv, feather
+from pyarrow import dataset, fs
 
 log = logging.getLogger(__name__)  # Logger for this module
 
@@ -43,7 +44,60 @@ def load_parquet_file(adrs):
     Returns:
         TBD: loaded data (data needs to be checked)
     """
-    return pd.read_parquet(adrs)
+    return pd.read_parquet(adrs, memory_map=True)
+
+def load_feather_file(adrs):
+    """load data from feather (Arrow IPC). Uncompressed files are memory mapped,
+    so the columns are read without copying the file into memory first.
+
+    Args:
+        adrs (String): data address
+
+    Returns:
+        TBD: loaded data (data needs to be checked)
+    """
+    return feather.read_table(adrs, memory_map=True)
+
+def load_projected_table(adrs, columns=None, min_date=None, max_date=None):
+    """open a parquet/feather/csv file as a memory mapped arrow dataset and only read
+    the given columns and the rows of the years between min_date and max_date.
+    Parquet row groups outside of the years are skipped without being decoded.
+
+    Args:
+        adrs (String): data address
+        columns (list, optional): columns to read; columns missing from the file are ignored.
+                                    Defaults to None (all columns).
+        min_date (String, optional): first month 'yyyy-mm' of interest. Defaults to None.
+        max_date (String, optional): last month 'yyyy-mm' of interest. Defaults to None.
+
+    Returns:
+        pyarrow.lib.Table: loaded data
+    """
+    if check_parquet_extension(adrs):
+        file_format = 'parquet'
+    elif check_feather_extension(adrs):
+        file_format = 'ipc'
+    else:
+        file_format = 'csv'
+    data_set = dataset.dataset(adrs, format=file_format,
+                               filesystem=fs.LocalFileSystem(use_mmap=True))
+    schema = data_set.schema
+
+    if columns is not None:
+        columns = [column for column in columns if column in schema.names]
+
+    # the rows are filtered by year, the months are cut later by get_full_dates_list
+    row_filter = None
+    if 'year' in schema.names and pyarrow.types.is_integer(schema.field('year').type):
+        if min_date is not None:
+            row_filter = dataset.field('year') >= int(min_date[:4])
+        if max_date is not None:
+            max_filter = dataset.field('year') <= int(max_date[:4])
+            row_filter = max_filter if row_filter is None else row_filter & max_filter
+    elif min_date is not None or max_date is not None:
+        log.warning("no integer 'year' column in %s, all rows are loaded", adrs)
+
+    return data_set.to_table(columns=columns, filter=row_filter)
 
 def check_csv_extension(adrs):
     """check extention type is csv
@@ -78,6 +132,17 @@ def check_parquet_extension(adrs):
     """
     return adrs.lower().endswith('.parquet')
 
+def check_feather_extension(adrs):
+    """check extention type is feather
+
+    Args:
+        adrs (String): data loading address
+
+    Returns:
+        bool: return if the type is expected
+    """
+    return adrs.lower().endswith(('.feather', '.arrow'))
+
 def load_raw_data_by_extention(adrs):
     """check extention type
 
@@ -93,6 +158,8 @@ def load_raw_data_by_extention(adrs):
         return load_xlsx_file(adrs)
     if check_parquet_extension(adrs):
         return load_parquet_file(adrs)
+    if check_feather_extension(adrs):
+        return load_feather_file(adrs)
     return 'No valid file type detected.'
 
 # create a data framework to work with
@@ -132,7 +199,8 @@ def convert_table_to_data_frame(table):
     Returns:
         dataframe: converted data
     """
-    data_frame = table.to_pandas()
+    # one block per column: columns of memory mapped files are not copied into a consolidated block
+    data_frame = table.to_pandas(split_blocks=True)
     return data_frame
 
 def convert_to_data_frame(raw_data):
@@ -171,21 +239,29 @@ def convert_table_to_parquet(table, adrs):
     return 1
 
 # main controler function
-def data_loading(adrs, convert2parquet = False):
-    """load data from a csv/xlsx/parquest file.
+def data_loading(adrs, convert2parquet = False, columns=None, min_date=None, max_date=None):
+    """load data from a csv/xlsx/parquest/feather file.
     CSV FILE TYPE IS STRONGLY RECOMDED
     (to get a csv file from xlsx use excel app for fastes results)
+    If columns or dates are given, only that part of the file is read (not for xlsx files).
 
     Args:
         adrs (string): the data adress
         convert2parquet (bool, optional): flag to convert data to parquet for 
                                             future use. Defaults to False.
+        columns (list, optional): columns to load. Defaults to None (all columns).
+        min_date (String, optional): skip the years before this month. Defaults to None.
+        max_date (String, optional): skip the years after this month. Defaults to None.
 
     Returns:
         dataframe: loaded data as a dataframe
     """
     log.info("Started loading data from file")
-    raw_data = load_raw_data_by_extention(adrs)
+    projected = columns is not None or min_date is not None or max_date is not None
+    if projected and not check_xlsx_extension(adrs):
+        raw_data = load_projected_table(adrs, columns, min_date, max_date)
+    else:
+        raw_data = load_raw_data_by_extention(adrs)
     log.info("data has been loaded")
 
     if convert2parquet:
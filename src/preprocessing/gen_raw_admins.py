@@ -1,14 +1,17 @@
 """
     generate a dictionary of raw data frames by admin level
 """
+import numpy as np
 import pandas as pd
 
-from set_up.constants import ADMIN_LOCATIONS, MIN_DATE, MAX_DATE
+from modeling_permutation.price_panel import PricePanel
+from set_up.constants import ADMIN_LOCATIONS, MIN_DATE, MAX_DATE, PRODUCTS_LABELS
 from preprocessing.complete_months_list import get_full_dates_list
 from preprocessing.get_mean import get_mean
 
-def merge_missing_months_n_data(data, date_range, admin_level):
-    """add missing months into the dataframe
+def densify_admin(data, date_range, admin_level):
+    """place the data of an admin into a dense (month x location x product) panel.
+    Months and locations are matched by their integer position, missing ones stay NaN.
 
     Args:
         data (dataframe): raw data of an admin
@@ -16,23 +19,42 @@ def merge_missing_months_n_data(data, date_range, admin_level):
         admin_level (String): in the name
 
     Returns:
-        dataframe: raw data with the missing motnhs as nan
+        PricePanel: panel over all the months of date_range and the locations of the admin
     """
-    if admin_level == 'admin0_label' or admin_level is None:
-        full_index = pd.MultiIndex.from_product([date_range], names=['year_month'])
+    is_admin0 = admin_level == 'admin0_label' or admin_level is None
+    key_columns = ['year_month'] if is_admin0 else ['year_month', admin_level]
+    products = [col for col in data.columns if col not in key_columns]
+    locations = [None] if is_admin0 else list(ADMIN_LOCATIONS[admin_level])
+
+    # integer position of every row; rows outside the months / locations are dropped
+    month_codes = pd.Index(date_range).get_indexer(data['year_month'])
+    unique_locations = pd.Index(pd.unique(pd.Series(locations, dtype=object)))
+    if is_admin0:
+        location_codes = np.zeros(len(data), dtype=np.intp)
     else:
-        cities = ADMIN_LOCATIONS[admin_level]
-        full_index = pd.MultiIndex.from_product([date_range, cities],
-                                                names=['year_month', admin_level])
+        location_codes = unique_locations.get_indexer(data[admin_level])
+    rows = (month_codes >= 0) & (location_codes >= 0)
 
-    full_df =  pd.DataFrame(index=full_index).reset_index()
+    values = np.full((len(date_range), len(unique_locations), len(products)), np.nan)
+    values[month_codes[rows], location_codes[rows], :] = \
+        data[products].to_numpy(dtype=np.float64)[rows]
+    # a location listed twice gets the same values twice
+    values = values[:, unique_locations.get_indexer(locations), :]
+    return PricePanel(values, date_range, locations, products,
+                      None if is_admin0 else admin_level)
 
-    if admin_level == 'admin0_label' or admin_level is None:
-        merged_data = pd.merge(full_df, data, on=['year_month'], how='left')
-    else:
-        merged_data = pd.merge(full_df, data, on=['year_month', admin_level], how='left')
-        merged_data.reset_index()
-    return merged_data
+def merge_missing_months_n_data(data, date_range, admin_level):
+    """add missing months into the dataframe
+
+    Args:
+        data (dataframe): raw data of an admin
+        date_range (list): list of months within the data range
+        admin_level (String): in the name
+
+    Returns:
+        dataframe: raw data with the missing motnhs as nan
+    """
+    return densify_admin(data, date_range, admin_level).to_frame()
 
 def get_single_admin(data, admin_level, min_date=MIN_DATE, max_date=MAX_DATE):
     """seperate the data of the specific admin
@@ -47,12 +69,67 @@ def get_single_admin(data, admin_level, min_date=MIN_DATE, max_date=MAX_DATE):
         dataframe: data after being seperated and cut as needed
     """
     mean_data = get_mean(data, admin_level)
+    return complete_single_admin(mean_data, admin_level, min_date, max_date)
+
+def complete_single_admin(mean_data, admin_level, min_date=MIN_DATE, max_date=MAX_DATE):
+    """cut the monthly means of an admin to the date range and add the missing months
+
+    Args:
+        mean_data (dataframe): monthly mean of the admin (output of `get_mean`)
+        admin_level (String): admin level in question
+        min_date (String, optional): minimum date. Defaults to MIN_DATE.
+        max_date (String, optional): max date. Defaults to MAX_DATE.
+
+    Returns:
+        dataframe: data after being cut as needed
+    """
     date_range, cut_data = get_full_dates_list(mean_data, min_date, max_date)
-    full_admin = merge_missing_months_n_data(cut_data, date_range, admin_level)
-    return full_admin
+    return merge_missing_months_n_data(cut_data, date_range, admin_level)
+
+def get_admin_sums(data, admin_levels):
+    """monthly sums and counts of the prices at the finest combination of admin levels,
+    computed in a single groupby over the data
+
+    Args:
+        data (dataframe): preprocess data
+        admin_levels (iterable): admin levels that will be rolled up
+
+    Returns:
+        dataframe: sums of the prices indexed by 'year_month' and the admin labels
+        dataframe: number of prices of every group (same index)
+    """
+    location_columns = [admin for admin in admin_levels if admin != 'admin0_label']
+    # NaN labels are kept here, they are dropped level by level in `roll_up_mean`
+    grouped = data.groupby(['year_month'] + location_columns, dropna=False, sort=False)
+    grouped = grouped[PRODUCTS_LABELS]
+    return grouped.sum(), grouped.count()
+
+def roll_up_mean(sums, counts, admin_level):
+    """monthly mean of an admin level from the sums and counts of `get_admin_sums`
+
+    Args:
+        sums (dataframe): sums of the prices
+        counts (dataframe): number of prices
+        admin_level (String): admin level in question
+
+    Returns:
+        dataframe: averaged data, same format as `get_mean`
+    """
+    if admin_level == 'admin0_label' or admin_level is None:
+        groupby_levels = ['year_month']
+    else:
+        groupby_levels = ['year_month', admin_level]
+    level_sums = sums.groupby(level=groupby_levels).sum()
+    level_counts = counts.groupby(level=groupby_levels).sum()
+    mean_data = level_sums / level_counts.where(level_counts > 0)
+    return mean_data.reset_index()
 
 def generate_raw_admins(raw_data, min_date=MIN_DATE, max_date=MAX_DATE):
-    """generate a dictionary of raw data frames by admin level
+    """generate a dictionary of raw data frames by admin level.
+    The data is aggregated once and the admin levels are rolled up from the sums and counts.
+    Every admin is placed into a dense panel (`densify_admin`) and returned as a long table:
+    the long tables are what the stage cache, the exports and the visualization read, and the
+    imputation stages build their own `PricePanel` from them.
 
     Args:
         raw_data (dataframe): preprocessed data
@@ -62,7 +139,9 @@ def generate_raw_admins(raw_data, min_date=MIN_DATE, max_date=MAX_DATE):
     Returns:
         dictionary of dataframe: data devided by admin level
     """
+    sums, counts = get_admin_sums(raw_data, ADMIN_LOCATIONS)
     raw_admin_data = {}
     for admin in ADMIN_LOCATIONS:
-        raw_admin_data[admin] = get_single_admin(raw_data, admin, min_date, max_date)
+        mean_data = roll_up_mean(sums, counts, admin)
+        raw_admin_data[admin] = complete_single_admin(mean_data, admin, min_date, max_date)
     return raw_admin_data
@@ -0,0 +1,150 @@
+"""
+    integer month index used for the 'year_month' column inside the pipeline.
+    A month is stored as the number of months since 1970-01 (int32), which is also the
+    integer representation of numpy's datetime64[M]. The 'yyyy-mm' strings are only
+    used when data is read from or written to files and in the plots.
+"""
+import numpy as np
+import pandas as pd
+
+MONTH_DTYPE = np.int32
+
+def month_number(year, month):
+    """months since 1970-01
+
+    Args:
+        year (int or array like): year
+        month (int or array like): month from 1 to 12
+
+    Returns:
+        int or array: month index
+    """
+    return (np.asarray(year) - 1970) * 12 + np.asarray(month) - 1
+
+def is_month_index(values):
+    """check whether months are already stored as integer month index
+
+    Args:
+        values: a month, a list / array / series of months
+
+    Returns:
+        bool: result of the check
+    """
+    if isinstance(values, (int, np.integer)):
+        return True
+    if isinstance(values, (pd.Series, pd.Index, np.ndarray)):
+        return pd.api.types.is_integer_dtype(values.dtype)
+    return all(isinstance(value, (int, np.integer)) for value in values)
+
+def parse_month(month):
+    """convert a single 'yyyy-mm' month into the month index
+
+    Args:
+        month (String or int): month, month index are returned unchanged
+
+    Returns:
+        int: month index
+    """
+    if isinstance(month, (int, np.integer)):
+        return int(month)
+    return int(month_number(int(month[:4]), int(month[5:7])))
+
+def parse_months(months):
+    """convert 'yyyy-mm' months into the month index
+
+    Args:
+        months (array like): months, month index are returned unchanged
+
+    Returns:
+        np.ndarray: int32 month index
+    """
+    if is_month_index(months):
+        return np.asarray(months, dtype=MONTH_DTYPE)
+    months = pd.Series(months, dtype=object).astype(str)
+    return month_number(months.str[:4].astype(int).to_numpy(),
+                        months.str[5:7].astype(int).to_numpy()).astype(MONTH_DTYPE)
+
+def format_months(months):
+    """convert month index into 'yyyy-mm' strings
+
+    Args:
+        months (array like): month index
+
+    Returns:
+        np.ndarray: object array of 'yyyy-mm' strings
+    """
+    return np.datetime_as_string(np.asarray(months, dtype=np.int64).astype('datetime64[M]'),
+                                 unit='M').astype(object)
+
+def month_range(start, end):
+    """all the months from start to end (both included)
+
+    Args:
+        start (int or String): first month
+        end (int or String): last month
+
+    Returns:
+        np.ndarray: int32 month index
+    """
+    return np.arange(parse_month(start), parse_month(end) + 1, dtype=MONTH_DTYPE)
+
+def months_to_timestamps(months):
+    """convert months (month index or strings) into month start timestamps
+
+    Args:
+        months (array like): months
+
+    Returns:
+        pd.DatetimeIndex: first day of every month (NaT if invalid)
+    """
+    if is_month_index(months):
+        return pd.DatetimeIndex(np.asarray(months, dtype=np.int64).astype('datetime64[M]'))
+    return pd.DatetimeIndex(pd.to_datetime(months, errors='coerce'))
+
+def timestamps_to_months(timestamps):
+    """convert timestamps into the month index
+
+    Args:
+        timestamps (array like): dates
+
+    Returns:
+        np.ndarray: int32 month index
+    """
+    timestamps = np.asarray(pd.DatetimeIndex(timestamps), dtype='datetime64[M]')
+    return timestamps.astype(np.int64).astype(MONTH_DTYPE)
+
+def with_month_strings(data):
+    """copy of the data with 'yyyy-mm' strings in the 'year_month' column, for files and plots
+
+    Args:
+        data (dataframe or dictionary of dataframes): data with month index
+
+    Returns:
+        dataframe or dictionary of dataframes: data with month strings (None stays None)
+    """
+    if isinstance(data, dict):
+        converted = data.copy()  # keeps the type, e.g. the default of a defaultdict
+        for key, value in data.items():
+            converted[key] = with_month_strings(value)
+        return converted
+    if not isinstance(data, pd.DataFrame) or 'year_month' not in data.columns \
+            or not is_month_index(data['year_month']):
+        return data
+    data = data.copy()
+    data['year_month'] = format_months(data['year_month'])
+    return data
+
+def with_month_index(data):
+    """copy of the data with month index in the 'year_month' column, for data read from files
+
+    Args:
+        data (dataframe): data with 'yyyy-mm' strings
+
+    Returns:
+        dataframe: data with month index
+    """
+    if 'year_month' not in data.columns or is_month_index(data['year_month']):
+        return data
+    data = data.copy()
+    data['year_month'] = parse_months(data['year_month'])
+    return data
@@ -8,6 +8,7 @@ from preprocessing.data_cleaning import (isolate_relevant_goods_columns,
                                                 replace_blank_with_nan,
                                                 convert_months_to_num, concat_mont_year)
 from preprocessing.gen_raw_admins import generate_raw_admins
+from preprocessing.month_index import with_month_index
 
 log = logging.getLogger(__name__)  # Logger for this module
 
@@ -41,7 +42,8 @@ def preprocessong_controler(data, perform_outlier=True, min_date=None, max_date=
         log.info("start concatonating year_month columns")
         adjusted_data=concat_mont_year(numbered_data)
     else:
-        adjusted_data = short_data
+        log.info("Starting to convert the 'yyyy-mm' months to the month index.")
+        adjusted_data = with_month_index(short_data)
         perform_outlier = False
 
     log.info("removing outliers")
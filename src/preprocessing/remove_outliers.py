@@ -1,5 +1,6 @@
 from set_up.constants import PRODUCTS_LABELS 
 import numpy as np
+import pandas as pd
 
 
 import logging
@@ -43,9 +44,36 @@ def detect_outliers(data_outlierless, columns_to_analyse):
     return data
 
 
+def outlier_bounds(q1, q3, alpha=10):
+    """
+    Computes the outlier bounds of `detect_outliers` for arrays of quartiles.
+
+    Parameters:
+    q1 : numpy.ndarray
+        15th percentiles.
+    q3 : numpy.ndarray
+        85th percentiles.
+    alpha : int
+        Multiplier for the IQR method.
+
+    Returns:
+    tuple of numpy.ndarray
+        The lower and upper bounds.
+    """
+    iqr = q3 - q1  # Interquartile range
+    lower_bound = q1 - alpha * iqr
+    upper_bound = q3 + alpha * iqr
+    # Set a minimum value for the lower bound to avoid excessively low values (NaN stays NaN)
+    lower_bound = np.where(lower_bound < q1 / 20, q1 / 20, lower_bound)
+    return lower_bound, upper_bound
+
+
 def generate_outlierless_data(data):
     """
     Preprocesses a DataFrame by cleaning data, generating relevant subsets, and removing outliers.
+    The quartiles of all dates and products are computed in a single groupby pass and the
+    outliers are masked at once. The result is the same as applying `detect_outliers` to
+    every date: rows are ordered by date and rows without a date are dropped.
 
     Parameters:
     data : pandas.DataFrame
@@ -55,11 +83,25 @@ def generate_outlierless_data(data):
     pandas.DataFrame
         A cleaned and processed DataFrame.
     """
-    relevant_goods_data = data.copy()
-    total_nan_before = relevant_goods_data.isna().sum().sum()  # Count NaN values before outlier removal
-    
-    # Apply the detect_outliers function to each group of data based on 'date'
-    relevant_goods_data = relevant_goods_data.groupby('date').apply(detect_outliers, PRODUCTS_LABELS).reset_index(drop=True)
+    total_nan_before = data.isna().sum().sum()  # Count NaN values before outlier removal
+
+    # Order the rows like the groupby: by date, keeping the original order within a date
+    date_codes, _ = pd.factorize(data['date'], sort=True)
+    order = np.argsort(date_codes, kind='stable')
+    order = order[date_codes[order] >= 0]  # rows without a date do not belong to any group
+    relevant_goods_data = data.iloc[order].reset_index(drop=True)
+    date_codes = date_codes[order]
+
+    # 15th and 85th percentiles of every product and date
+    quantiles = relevant_goods_data[PRODUCTS_LABELS].groupby(date_codes).quantile([0.15, 0.85])
+    q1 = quantiles.xs(0.15, level=1).to_numpy(dtype=np.float64)[date_codes]
+    q3 = quantiles.xs(0.85, level=1).to_numpy(dtype=np.float64)[date_codes]
+    lower_bound, upper_bound = outlier_bounds(q1, q3)
+
+    # Set the identified outliers to NaN
+    prices = relevant_goods_data[PRODUCTS_LABELS].to_numpy(dtype=np.float64)
+    outliers = (prices < lower_bound) | (prices > upper_bound)
+    relevant_goods_data[PRODUCTS_LABELS] = np.where(outliers, np.nan, prices)
 
     total_nan_after = relevant_goods_data.isna().sum().sum()  # Count NaN values after outlier removal
     # Print the difference in the number of NaN values before and after outlier detection
@@ -0,0 +1,257 @@
+"""
+    streaming preprocessing of the raw csv file: the file is read twice in record batches.
+    The first pass spills the dates and prices into temporary files, one per bucket of dates,
+    and computes the outlier bounds of every date one bucket at a time. The second pass
+    removes the outliers and only keeps the monthly sums and counts of every admin, so the
+    file is never all in memory at once
+"""
+import csv
+import logging
+import math
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow
+from pyarrow import csv as arrow_csv, ipc
+
+from set_up.constants import ADMIN_LOCATIONS, PRODUCTS_LABELS, MIN_DATE, MAX_DATE, \
+    STREAMING_BLOCK_SIZE
+from preprocessing.data_loading import check_csv_extension
+from preprocessing.data_cleaning import (RELEVANT_COLUMNS, isolate_relevant_goods_columns,
+                                         replace_blank_with_nan,
+                                         convert_months_to_num, concat_mont_year)
+from preprocessing.remove_outliers import outlier_bounds
+from preprocessing.gen_raw_admins import complete_single_admin
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+# admin columns kept to describe which location lies in which higher admin
+HIERARCHY_COLUMNS = ['admin1_label', 'admin2_label', 'admin3_label', 'admin4_label']
+
+# months written as numbers, read as text by the streaming reader
+MONTH_NUMBERS = [str(month) for month in range(1, 13)]
+
+# most temporary files the dates and prices are spilled into by the first pass
+MAX_SPILL_BUCKETS = 256
+
+def open_csv_batches(adrs, block_size=STREAMING_BLOCK_SIZE):
+    """open a csv file as a stream of record batches with the relevant columns only
+
+    Args:
+        adrs (String): csv address
+        block_size (int, optional): bytes read per batch. Defaults to STREAMING_BLOCK_SIZE.
+
+    Returns:
+        pyarrow.csv.CSVStreamingReader: reader of the batches
+    """
+    # the types are fixed so that they do not depend on the rows of the first batch
+    with open(adrs, encoding='utf-8-sig') as csv_file:
+        # quoted column names can contain commas
+        header = next(csv.reader(csv_file), [])
+    if not header:
+        raise ValueError(f"no rows to stream in {adrs}")
+    columns = [column for column in RELEVANT_COLUMNS if column in header]
+    column_types = {}
+    for column in columns:
+        if column in PRODUCTS_LABELS or column == 'meb':
+            column_types[column] = pyarrow.float64()
+        elif column == 'year':
+            column_types[column] = pyarrow.int64()
+        else:
+            # 'date' and 'month' are grouped / mapped as text
+            column_types[column] = pyarrow.string()
+
+    return arrow_csv.open_csv(adrs, read_options=arrow_csv.ReadOptions(block_size=block_size),
+                              convert_options=arrow_csv.ConvertOptions(include_columns=columns,
+                                                                       column_types=column_types,
+                                                                       # blank cells are NaN, as with pandas
+                                                                       strings_can_be_null=True))
+
+def preprocess_batch(batch):
+    """apply the cleaning steps of `preprocessong_controler` to a single batch
+
+    Args:
+        batch (pyarrow.RecordBatch): raw rows
+
+    Returns:
+        dataframe: rows with a 'year_month' column
+    """
+    clean_data = isolate_relevant_goods_columns(batch.to_pandas())
+    nan_data = replace_blank_with_nan(clean_data)
+    numbered_data = convert_months_to_num(nan_data)
+    # the month is read as text, numbers are not matched by convert_months_to_num
+    month_numbers = nan_data['month'].str.strip().str.lstrip('0')
+    numbered_data['month'] = numbered_data['month'].fillna(
+        month_numbers.where(month_numbers.isin(MONTH_NUMBERS)))
+    return concat_mont_year(numbered_data)
+
+def spill_date_prices(adrs, spill_dir, block_size=STREAMING_BLOCK_SIZE):
+    """first pass over the csv: write the dates and prices into arrow files, the rows of a
+    date always go into the same file. There are about as many files as batches, so a file
+    holds about the prices of a batch (or of its largest date)
+
+    Args:
+        adrs (String): csv address
+        spill_dir (String): directory of the files
+        block_size (int, optional): bytes read per batch. Defaults to STREAMING_BLOCK_SIZE.
+
+    Returns:
+        list: addresses of the files
+    """
+    n_buckets = min(MAX_SPILL_BUCKETS, max(1, math.ceil(os.path.getsize(adrs) / block_size)))
+    writers = {}
+    n_batches = 0
+    try:
+        for batch in open_csv_batches(adrs, block_size):
+            n_batches += 1
+            data = replace_blank_with_nan(isolate_relevant_goods_columns(batch.to_pandas()))
+            data = data.loc[data['date'].notna(), ['date'] + PRODUCTS_LABELS]
+            buckets = pd.util.hash_array(data['date'].to_numpy(dtype=object)) % n_buckets
+            for bucket, rows in data.groupby(buckets):
+                table = pyarrow.Table.from_pandas(rows, preserve_index=False)
+                if bucket not in writers:
+                    writers[bucket] = ipc.new_stream(os.path.join(spill_dir, f"{bucket}.arrow"),
+                                                     table.schema)
+                writers[bucket].write_table(table)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    if not n_batches:
+        raise ValueError(f"no rows to stream in {adrs}")
+    return [os.path.join(spill_dir, f"{bucket}.arrow") for bucket in sorted(writers)]
+
+def date_outlier_bounds(adrs, block_size=STREAMING_BLOCK_SIZE):
+    """outlier bounds of every date and product, the same as the ones of
+    `generate_outlierless_data`. The dates and prices are spilled into temporary files by
+    `spill_date_prices` and the quantiles are computed one file at a time, so only the
+    prices of a single file are in memory
+
+    Args:
+        adrs (String): csv address
+        block_size (int, optional): bytes read per batch. Defaults to STREAMING_BLOCK_SIZE.
+
+    Returns:
+        tuple of dataframe: lower and upper bounds of every product, indexed by date
+    """
+    quantiles = []
+    with tempfile.TemporaryDirectory(prefix="outlier_bounds_") as spill_dir:
+        for spill_adrs in spill_date_prices(adrs, spill_dir, block_size):
+            with pyarrow.memory_map(spill_adrs) as source:
+                prices = ipc.open_stream(source).read_all().to_pandas()
+            # 15th and 85th percentiles of every product and date of the file
+            quantiles.append(prices.groupby('date')[PRODUCTS_LABELS].quantile([0.15, 0.85]))
+            del prices
+    if not quantiles:  # no row has a date
+        no_bounds = pd.DataFrame(columns=PRODUCTS_LABELS, dtype=np.float64,
+                                 index=pd.Index([], dtype=object, name='date'))
+        return no_bounds, no_bounds.copy()
+    quantiles = pd.concat(quantiles).sort_index()
+
+    q1 = quantiles.xs(0.15, level=1)
+    q3 = quantiles.xs(0.85, level=1)
+    lower_bound, upper_bound = outlier_bounds(q1.to_numpy(dtype=np.float64),
+                                              q3.to_numpy(dtype=np.float64))
+    return (pd.DataFrame(lower_bound, index=q1.index, columns=PRODUCTS_LABELS),
+            pd.DataFrame(upper_bound, index=q3.index, columns=PRODUCTS_LABELS))
+
+def remove_batch_outliers(data, lower_bound, upper_bound):
+    """set the prices outside of the bounds of their date to NaN and drop the rows without
+    a date, like `generate_outlierless_data`
+
+    Args:
+        data (dataframe): preprocessed batch
+        lower_bound (dataframe): lower bounds of every product, indexed by date
+        upper_bound (dataframe): upper bounds of every product, indexed by date
+
+    Returns:
+        tuple: batch without outliers and number of removed prices
+    """
+    data = data[data['date'].notna()].reset_index(drop=True)
+    rows = lower_bound.index.get_indexer(data['date'])
+    prices = data[PRODUCTS_LABELS].to_numpy(dtype=np.float64)
+    outliers = (prices < lower_bound.to_numpy()[rows]) | (prices > upper_bound.to_numpy()[rows])
+    data[PRODUCTS_LABELS] = np.where(outliers, np.nan, prices)
+    return data, int(outliers.sum())
+
+def batch_sums(data, admin_level):
+    """monthly sums and counts of the prices of a batch
+
+    Args:
+        data (dataframe): preprocessed batch
+        admin_level (String): admin level of the groups
+
+    Returns:
+        dataframe: 'sum' and 'count' columns of every product, indexed by the groups
+    """
+    if admin_level == 'admin0_label' or admin_level is None:
+        groupby_columns = ['year_month']
+    else:
+        groupby_columns = ['year_month', admin_level]
+    grouped = data.groupby(groupby_columns)[PRODUCTS_LABELS]
+    return pd.concat({'sum': grouped.sum(), 'count': grouped.count()}, axis=1)
+
+def sums_to_mean(totals):
+    """convert accumulated sums and counts into the output of `get_mean`
+
+    Args:
+        totals (dataframe): accumulated output of `batch_sums`
+
+    Returns:
+        dataframe: monthly mean of every product (NaN without any price)
+    """
+    totals = totals.sort_index()
+    mean_data = totals['sum'] / totals['count'].where(totals['count'] > 0)
+    return mean_data[PRODUCTS_LABELS].reset_index()
+
+def streaming_preprocessing(adrs, min_date=MIN_DATE, max_date=MAX_DATE,
+                            block_size=STREAMING_BLOCK_SIZE):
+    """streaming version of `data_loading` followed by `preprocessong_controler`.
+    The outlier bounds of every date are computed in a first pass over the file, the
+    outliers are removed from the batches of the second pass.
+
+    Args:
+        adrs (String): csv address of the raw data
+        min_date (String, optional): min date of the data. Defaults to MIN_DATE.
+        max_date (String, optional): max date of the data. Defaults to MAX_DATE.
+        block_size (int, optional): bytes read per batch. Defaults to STREAMING_BLOCK_SIZE.
+
+    Returns:
+        dataframe: unique combinations of the admin labels, in order of appearance. It
+                    replaces the preprocessed data for the admin 2 / 3 imputation
+        dictionary of dataframe: data devided by admin level
+    """
+    if not check_csv_extension(adrs):
+        raise ValueError(f"streaming ingestion needs a csv file, got {adrs}")
+
+    log.info("Started computing the outlier bounds of the raw data")
+    lower_bound, upper_bound = date_outlier_bounds(adrs, block_size)
+
+    log.info("Started streaming the raw data")
+    totals = dict.fromkeys(ADMIN_LOCATIONS)
+    hierarchy = None
+    n_rows = 0
+    n_outliers = 0
+    for batch in open_csv_batches(adrs, block_size):
+        data, batch_outliers = remove_batch_outliers(preprocess_batch(batch),
+                                                     lower_bound, upper_bound)
+        n_rows += len(data)
+        n_outliers += batch_outliers
+        for admin_level in ADMIN_LOCATIONS:
+            sums = batch_sums(data, admin_level)
+            totals[admin_level] = sums if totals[admin_level] is None \
+                else totals[admin_level].add(sums, fill_value=0)
+
+        hierarchy_columns = [column for column in HIERARCHY_COLUMNS if column in data.columns]
+        locations = data[hierarchy_columns].drop_duplicates()
+        hierarchy = locations if hierarchy is None \
+            else pd.concat([hierarchy, locations]).drop_duplicates()
+    log.info("streamed %d rows", n_rows)
+    log.info("Outliers have been detected: %d", n_outliers)
+
+    raw_admin_data = {}
+    for admin_level, admin_totals in totals.items():
+        raw_admin_data[admin_level] = complete_single_admin(sums_to_mean(admin_totals),
+                                                            admin_level, min_date, max_date)
+    return hierarchy.reset_index(drop=True), raw_admin_data
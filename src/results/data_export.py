@@ -2,14 +2,19 @@
     export data
 """
 import logging
+import os
 
 from time import time
 from pathlib import Path
 from collections import defaultdict
 
 import pandas as pd
+import pyarrow
+from pyarrow import feather, parquet
 
+from preprocessing.month_index import with_month_strings
 from set_up.addresses_constants import ADRS_EXPORT_DIR
+from set_up.constants import EXPORT_FORMAT, EXPORT_FLOAT32
 # needed for assigning values to TIME_FOLDER. it gets wonky otherwise
 import set_up.addresses_constants as ac
 
@@ -31,6 +36,79 @@ def export_csv(data_frame, adrs):
     log.info("exported data to %s", adrs)
     return 1
 
+def typed_table(data_frame, float32=EXPORT_FLOAT32):
+    """convert data to an arrow table with typed columns:
+    location labels become categoricals (dictionary encoded) and prices can be stored as float32
+
+    Args:
+        data_frame (dataframe): data that is to be exported
+        float32 (bool, optional): store the prices as float32. Defaults to EXPORT_FLOAT32.
+
+    Returns:
+        pyarrow.lib.Table: typed table
+    """
+    dtypes = {}
+    for column in data_frame.columns:
+        if column.endswith('_label'):
+            dtypes[column] = 'category'
+        elif float32 and pd.api.types.is_float_dtype(data_frame[column]):
+            dtypes[column] = 'float32'
+    return pyarrow.Table.from_pandas(data_frame.astype(dtypes), preserve_index=False)
+
+def export_parquet(data_frame, adrs, float32=EXPORT_FLOAT32):
+    """export data as parquet
+
+    Args:
+        data_frame (dataframe): data that is to be exported
+        adrs (String): location to export
+        float32 (bool, optional): store the prices as float32. Defaults to EXPORT_FLOAT32.
+
+    Returns:
+        bool: ` for success`
+    """
+    log.info("Started data export to parquet file")
+    parquet.write_table(typed_table(data_frame, float32), adrs)
+    log.info("exported data to %s", adrs)
+    return 1
+
+def export_feather(data_frame, adrs, float32=EXPORT_FLOAT32):
+    """export data as feather (Arrow IPC). The file is not compressed so that
+    it can be memory mapped when it is loaded again.
+
+    Args:
+        data_frame (dataframe): data that is to be exported
+        adrs (String): location to export
+        float32 (bool, optional): store the prices as float32. Defaults to EXPORT_FLOAT32.
+
+    Returns:
+        bool: ` for success`
+    """
+    log.info("Started data export to feather file")
+    feather.write_feather(typed_table(data_frame, float32), adrs, compression='uncompressed')
+    log.info("exported data to %s", adrs)
+    return 1
+
+# export function of every export format
+EXPORT_FUNCTIONS = {'csv' : export_csv,
+                    'parquet' : export_parquet,
+                    'feather' : export_feather}
+
+def export_file(data_frame, adrs):
+    """export data in the format given by the file extension
+
+    Args:
+        data_frame (dataframe): data that is to be exported
+        adrs (String): location to export
+
+    Returns:
+        bool: ` for success`
+    """
+    export_format = os.path.splitext(adrs)[1].lstrip('.').lower()
+    if export_format not in EXPORT_FUNCTIONS:
+        raise ValueError(f"cannot export to {adrs}. Supported formats are {list(EXPORT_FUNCTIONS)}")
+    # the files keep the 'yyyy-mm' months
+    return EXPORT_FUNCTIONS[export_format](with_month_strings(data_frame), adrs)
+
 def export_df_n_dict(data, adress):
     """export dictionary of dataframes
     Args:
@@ -38,13 +116,14 @@ def export_df_n_dict(data, adress):
         adress (String): export address data
     """
     if isinstance(data, pd.DataFrame):
-        export_csv(data, adress)
+        export_file(data, adress)
         print(adress)
     elif isinstance(data, (dict, defaultdict)):
+        adress_root, extension = os.path.splitext(adress)
         for admin_labels in data.keys():
-            adress_admins = adress.replace('.csv', f'_{admin_labels}.csv')
+            adress_admins = f'{adress_root}_{admin_labels}{extension}'
             print(adress_admins)
-            export_csv(data[admin_labels], adress_admins)
+            export_file(data[admin_labels], adress_admins)
     elif len(data.keys()) == 0:
         print("data is empty !!!!!!!!!!!!!!!!!!!!!!!!")
     else:
@@ -62,7 +141,7 @@ def define_dir():
     Path(directory).mkdir(parents=True, exist_ok=True)
     return directory
 
-def imp_pred_dir(choice, adrs_imp=None, adrs_pred=None):
+def imp_pred_dir(choice, adrs_imp=None, adrs_pred=None, export_format=EXPORT_FORMAT):
     """address to store imputed an dpredicted data
 
     Args:
@@ -71,21 +150,26 @@ def imp_pred_dir(choice, adrs_imp=None, adrs_pred=None):
                                         if it already decided. Defaults to None.
         adrs_pred (String, optional): predicted data storage address; 
                                         if it already decided. Defaults to None.
+        export_format (String, optional): 'csv', 'parquet' or 'feather'. Defaults to EXPORT_FORMAT.
 
     Returns:
         String: imputed data storage address
         String: predicted data storage address
     """
+    if export_format not in EXPORT_FUNCTIONS:
+        raise ValueError(f"invalid export format {export_format}. "
+                         f"Supported formats are {list(EXPORT_FUNCTIONS)}")
     current_dir = define_dir()
     if choice in [1, 2]:
         if adrs_imp is None:
-            adrs_imp = current_dir + "imputed.csv"
+            adrs_imp = current_dir + "imputed." + export_format
     if choice in [2, 3]:
         if adrs_pred is None:
-            adrs_pred = current_dir + "predicted.csv"
+            adrs_pred = current_dir + "predicted." + export_format
     return adrs_imp, adrs_pred
 
-def export_controler(choice, imputed_data, predicted_data, adrs_imp=None, adrs_pred=None):
+def export_controler(choice, imputed_data, predicted_data, adrs_imp=None, adrs_pred=None,
+                     export_format=EXPORT_FORMAT):
     """export data
 
     Args:
@@ -94,11 +178,13 @@ def export_controler(choice, imputed_data, predicted_data, adrs_imp=None, adrs_p
         predicted_data (dictionary of dataframe): <-
         adrs_imp (String, optional): address to store imputed data. Defaults to None.
         adrs_pred (String, optional): address to store predicted. Defaults to None.
+        export_format (String, optional): 'csv', 'parquet' or 'feather', used when no
+                                            address is given. Defaults to EXPORT_FORMAT.
 
     Returns:
         bool: return 1 if succful completion
     """
-    adrs_imp, adrs_pred = imp_pred_dir(choice, adrs_imp, adrs_pred)
+    adrs_imp, adrs_pred = imp_pred_dir(choice, adrs_imp, adrs_pred, export_format)
     if choice in {1, 2}:
         log.info("start exporting imputed data.")
         export_df_n_dict(imputed_data, adrs_imp)
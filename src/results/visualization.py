@@ -9,6 +9,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from instrumentation import measure
+from preprocessing.month_index import with_month_strings
 from set_up.constants import (PRODUCTS_LABELS, PREDICT_PRODUCTS,
                               ADMIN_LOCATIONS, PREDICT_CITIES)
 from set_up.addresses_constants import ADRS_DIR_PLOT, TIME_FOLDER
@@ -237,8 +239,14 @@ def visualization_conroler(choice, raw_data, imputed_data, predicted_data):
     Returns:
         bool: return 1 if succful processing
     """
+    # the months are plotted as 'yyyy-mm' labels
+    raw_data = with_month_strings(raw_data)
+    imputed_data = with_month_strings(imputed_data)
+    predicted_data = with_month_strings(predicted_data)
     log.info("start plottng data by product")
-    plot_by_product(choice, raw_data, imputed_data, predicted_data)
+    with measure("visualization.plot_by_product"):
+        plot_by_product(choice, raw_data, imputed_data, predicted_data)
     log.info("start plottng data by region")
-    plot_by_city(choice, raw_data, imputed_data, predicted_data)
+    with measure("visualization.plot_by_city"):
+        plot_by_city(choice, raw_data, imputed_data, predicted_data)
     return 1
@@ -11,7 +11,8 @@ ADRS_RAW_DATA = './../data/raw/dataframe_data.csv'
 # IMPUTED DATA
 ####################
 
-# where the imputation of the entire data store
+# where the imputation of the entire data store; the file extension is replaced by the one of
+# EXPORT_FORMAT (see ADRS_IMPUTED in constants.py)
 ADRS_IMPUTED_ADMIN0 = './../data/processed/imputed_admin0_label_full.csv'
 ADRS_IMPUTED_ADMIN1 = './../data/processed/imputed_admin1_label_full.csv'
 ADRS_IMPUTED_ADMIN2 = './../data/processed/imputed_admin2_label_full.csv'
@@ -23,6 +24,37 @@ ADRS_IMPUTED = {'admin0_label' : ADRS_IMPUTED_ADMIN0,
                 'admin3_label' : ADRS_IMPUTED_ADMIN3,
                 'admin4_label' : ADRS_IMPUTED_ADMIN4}
 
+####################
+# ARIMA ORDER CACHE
+####################
+
+# orders found by auto_arima, reused while the fitted series does not change
+ADRS_ARIMA_ORDER_CACHE = './../data/interim/arima_order_cache.json'
+
+############################
+# IMPUTATION FINGERPRINTS
+############################
+
+# state of the incremental imputation, kept apart from the ADRS_IMPUTED files: the imputed data
+# of its last run (stored in EXPORT_FORMAT, see ADRS_INCREMENTAL_IMPUTED in constants.py) and
+# the fingerprints of the raw series it was imputed from
+ADRS_INCREMENTAL_DIR = './../data/interim/incremental/'
+ADRS_IMPUTATION_FINGERPRINTS = ADRS_INCREMENTAL_DIR + 'imputation_fingerprints.json'
+
+####################
+# STAGE CACHE
+####################
+
+# outputs of the pipeline stages, see stage_cache.py
+ADRS_STAGE_CACHE_DIR = './../data/interim/stage_cache/'
+
+####################
+# BENCHMARKS
+####################
+
+# timings of the benchmark suite, one json line per run (see benchmarking/run_benchmarks.py)
+ADRS_BENCHMARK_HISTORY = './../data/benchmark/history.jsonl'
+
 #######################
 # EXPORT DIR
 ######################
@@ -1,5 +1,7 @@
+import os
+
 from set_up.labels import RAW_MIN_DATE, RAW_MAX_DATE, ALL_ADMIN_LOCATIONS, ALL_PRODUCTS_LABELS, ALL_PRODUCT_MEB_QUANTITIES
-from set_up.addresses_constants import ADRS_RAW_DATA, ADRS_IMPUTED
+from set_up.addresses_constants import ADRS_RAW_DATA, ADRS_IMPUTED, ADRS_INCREMENTAL_DIR
 ##################################################################################
 #                                                             
 #   YOU MAY CHANGE ANY OF THE FOLLOWING CONSTANTS AS NEEDED
@@ -40,6 +42,74 @@ CHOSEN_MIN_DATE = '2016-05' # Do not go before 2016-05' as data was there pretty
 # - max month
 CHOSEN_MAX_DATE = '2024-09'
 
+#################################
+#       Performance
+#################################
+
+# number of processes used to fit the ARIMA imputation series (None uses all cores, 1 is serial)
+IMPUTATION_WORKERS = None
+# search the ARIMA orders again instead of reusing the ones stored in the order cache
+FORCE_ARIMA_ORDER_SEARCH = False
+# refit the prediction model after every forecasted month (the baseline output). Set to False
+# to forecast the whole horizon from a single fit instead: predicting the meb of all admin 1
+# locations (228 series, 6 months) then takes 12 s instead of 70 s once the ARIMA orders are
+# cached (330 s instead of 395 s with the order search), but the forecasts are no longer the
+# refit ones, the predicted meb moves by about 1%
+FORECAST_REFIT_EACH_STEP = True
+# number of processes used by the prediction stage (None uses all cores, 1 is serial)
+PREDICTION_WORKERS = None
+# stop expanding the GARCH (p, q) search after this many fits without AIC improvement
+# (None searches the full grid)
+GARCH_SEARCH_PATIENCE = None
+# load only the relevant columns and the years between MIN_DATE and MAX_DATE of the raw data
+# (memory mapped for parquet / feather files). Locations that only appear outside of these
+# years are then unknown to the admin 2 / 3 imputation.
+MEMORY_MAPPED_LOADING = False
+# read the raw csv in batches and only keep the monthly sums / counts of every admin. The csv
+# is read twice: the first pass spills the dates and prices into temporary files to compute
+# the outlier bounds of every date, one file (about one batch of prices) at a time
+STREAMING_INGESTION = False
+# bytes of the raw csv read per batch by the streaming ingestion
+STREAMING_BLOCK_SIZE = 1 << 22
+# run the admin levels that do not depend on each other (admin 0 and admin 1) in parallel threads
+CONCURRENT_IMPUTATION_LEVELS = True
+# number of processes the admin 2 / 3 imputation is sharded on, one shard per admin 1 region
+# (None uses all cores, 1 is serial). The Syria panel is imputed in less than a second, where
+# starting the pool costs more than it saves, so only use it for much larger panels
+ADMIN_SHARD_WORKERS = 1
+# monthly update: reuse the imputed data of the last incremental run (stored in
+# ADRS_INCREMENTAL_DIR, the first run imputes everything) and only impute the last INCREMENTAL_WINDOW_MONTHS months again, plus the series whose raw
+# data changed. The window is fitted on the reused history as if it was observed data
+INCREMENTAL_IMPUTATION = False
+# trailing months imputed again by the incremental imputation
+INCREMENTAL_WINDOW_MONTHS = 3
+# store the output of the loading, preprocessing, imputation and prediction stages in
+# ADRS_STAGE_CACHE_DIR and reload it while the input, the code and the settings of the stage
+# do not change (or run main.py with --stage-cache)
+USE_STAGE_CACHE = False
+# measure the wall / CPU time of the stages and write a run report into the export directory
+INSTRUMENTATION = True
+# with INSTRUMENTATION, also measure the tracemalloc peak of every stage (the peak resident
+# set size is always recorded). Tracing slows down allocation heavy stages and the forked
+# worker processes inherit it (about 5x slower), so it is only turned on to look for memory
+TRACE_MEMORY = False
+# sizes of the synthetic panels timed by the benchmark suite, relative to the Syria panel.
+# The peak memory is about 0.35 GB + 2.5 KB per submission (0.8 GB at 1x, 2.7 GB at 5x),
+# the 20x panel (3.8 million submissions) needs about 10 GB and fits the ARIMA imputation of
+# 4560 series, so it is only run when asked for (--scales 1 5 20)
+BENCHMARK_SCALES = [1, 5]
+# the benchmark suite flags a stage that got slower than this factor since the previous commit
+BENCHMARK_REGRESSION_TOLERANCE = 1.25
+
+#################################
+#       Export
+#################################
+
+# file format of the exported data: 'csv', 'parquet' or 'feather' (Arrow IPC, memory mapped on reload)
+EXPORT_FORMAT = 'csv'
+# store the prices as float32 in the parquet / feather files (halves the file size)
+EXPORT_FLOAT32 = False
+
 
 
 ##################################################################################
@@ -50,6 +120,14 @@ CHOSEN_MAX_DATE = '2024-09'
 # import address
 ADRS_IMPORT = ADRS_RAW_DATA
 
+# imputed data of the full run, stored in EXPORT_FORMAT so that choice 3 and the incremental
+# imputation read it back without parsing csv
+ADRS_IMPUTED = {admin_label: os.path.splitext(adrs)[0] + '.' + EXPORT_FORMAT
+                for admin_label, adrs in ADRS_IMPUTED.items()}
+# imputed data of the last incremental run, reused by the next one
+ADRS_INCREMENTAL_IMPUTED = {admin_label: f'{ADRS_INCREMENTAL_DIR}imputed_{admin_label}.{EXPORT_FORMAT}'
+                            for admin_label in ADRS_IMPUTED}
+
 MIN_DATE = CHOSEN_MIN_DATE
 MAX_DATE = CHOSEN_MAX_DATE
 
@@ -0,0 +1,313 @@
+"""
+    content addressed cache of the outputs of the pipeline stages. The output of a stage is
+    stored as parquet files under a key derived from the key of its input, the source code of
+    the stage and the settings it depends on, so unchanged stages are reloaded instead of
+    recomputed
+"""
+import ast
+from functools import lru_cache
+import hashlib
+import importlib
+import json
+import logging
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+from set_up.addresses_constants import ADRS_STAGE_CACHE_DIR
+from set_up.constants import USE_STAGE_CACHE
+
+log = logging.getLogger(__name__)  # Logger for this module
+
+# stages in the order they run; invalidating a stage also invalidates the ones after it
+PIPELINE_STAGES = ['loading', 'preprocessing', 'imputation', 'prediction']
+
+SRC_DIR = Path(__file__).resolve().parent
+# entry modules of the stages, the code fingerprint covers every module they import from src
+STAGE_MODULES = {'loading': ['preprocessing.data_loading'],
+                 'preprocessing': ['preprocessing.preprocessong_controler',
+                                   'preprocessing.streaming_ingestion'],
+                 'imputation': ['modeling_permutation.imputation_controler'],
+                 'prediction': ['modeling_prediction.prediction_controler']}
+# the values read from these modules are part of the key, not their source: changing a
+# prediction setting must not invalidate the imputation
+CONFIG_MODULES = ('set_up.constants', 'set_up.labels', 'set_up.addresses_constants')
+
+def file_fingerprint(adrs, chunk_size=1 << 20):
+    """hash of the content of a file
+
+    Args:
+        adrs (String): file address
+        chunk_size (int, optional): bytes read at once. Defaults to 1 << 20.
+
+    Returns:
+        String: hex digest of the file
+    """
+    digest = hashlib.sha1()
+    with open(adrs, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def frame_fingerprint(data):
+    """hash of the content of a dataframe
+
+    Args:
+        data (dataframe): data (None is allowed)
+
+    Returns:
+        String: hex digest of the columns, dtypes and values
+    """
+    digest = hashlib.sha1()
+    if data is not None:
+        digest.update(json.dumps([[str(col), str(dtype)] for col, dtype in data.dtypes.items()])
+                      .encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def module_file(module_name):
+    """source file of a module of the src folder
+
+    Args:
+        module_name (String): dotted module name
+
+    Returns:
+        Path: source file (None for packages and modules outside of src)
+    """
+    adrs = SRC_DIR.joinpath(*module_name.split('.')).with_suffix('.py')
+    return adrs if adrs.is_file() else None
+
+@lru_cache(maxsize=None)
+def stage_dependencies(stage):
+    """source files and settings a stage depends on: the modules of src its entry modules
+    import, directly or through other modules (also inside functions), and the names they
+    import from the configuration modules
+
+    Args:
+        stage (String): name of the stage
+
+    Returns:
+        tuple: source files (relative to src) and (configuration module, name) pairs, sorted
+    """
+    pending = list(STAGE_MODULES.get(stage, []))
+    sources, settings = set(), set()
+    while pending:
+        module_name = pending.pop()
+        adrs = module_file(module_name)
+        if module_name in CONFIG_MODULES or adrs is None or adrs in sources:
+            continue
+        sources.add(adrs)
+        for node in ast.walk(ast.parse(adrs.read_text(encoding='utf-8'))):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                if node.module in CONFIG_MODULES:
+                    settings.update((node.module, alias.name) for alias in node.names)
+                else:
+                    # `from package import module` imports a module as well
+                    pending.append(node.module)
+                    pending.extend(f"{node.module}.{alias.name}" for alias in node.names)
+    return (tuple(sorted(str(adrs.relative_to(SRC_DIR)) for adrs in sources)),
+            tuple(sorted(settings)))
+
+@lru_cache(maxsize=None)
+def code_fingerprint(stage):
+    """hash of the source code a stage depends on (see `stage_dependencies`)
+
+    Args:
+        stage (String): name of the stage
+
+    Returns:
+        String: hex digest of the file names and contents
+    """
+    digest = hashlib.sha1()
+    for adrs in stage_dependencies(stage)[0]:
+        digest.update(adrs.encode('utf-8'))
+        digest.update(file_fingerprint(SRC_DIR / adrs).encode('utf-8'))
+    return digest.hexdigest()
+
+def stage_settings(stage):
+    """current values of all the configuration names a stage reads. They are read when the
+    key is built, so settings changed at run time (e.g. by the benchmarks) are included
+
+    Args:
+        stage (String): name of the stage
+
+    Returns:
+        dict: 'module.name' -> value
+    """
+    return {f"{module_name}.{name}": getattr(importlib.import_module(module_name), name, None)
+            for module_name, name in stage_dependencies(stage)[1]}
+
+class StageCache:
+    """stage outputs keyed by stage name, input key and settings.
+
+    An output is a tuple whose parts are dataframes, dictionaries of dataframes or None.
+    Every entry is a directory with one parquet file per dataframe and a manifest describing
+    how to put the tuple back together.
+
+    Args:
+        directory (String, optional): root directory of the cache. Defaults to ADRS_STAGE_CACHE_DIR.
+        invalidate (iterable, optional): stages that are recomputed even if they are cached,
+                                            together with all the stages after them. Defaults to ().
+        enabled (bool, optional): use the cache. Defaults to USE_STAGE_CACHE.
+    """
+
+    def __init__(self, directory=ADRS_STAGE_CACHE_DIR, invalidate=(), enabled=USE_STAGE_CACHE):
+        self.directory = Path(directory)
+        self.enabled = enabled
+        unknown = set(invalidate) - set(PIPELINE_STAGES)
+        if unknown:
+            raise ValueError(f"unknown stages {unknown}. The stages are {PIPELINE_STAGES}")
+        first = min((PIPELINE_STAGES.index(stage) for stage in invalidate), default=None)
+        self.invalidated = set() if first is None else set(PIPELINE_STAGES[first:])
+
+    @staticmethod
+    def key(stage, input_key, settings=None):
+        """build the key of a stage output from its input, the fingerprint of its code, the
+        values of the configuration it reads and the settings it is called with
+
+        Args:
+            stage (String): name of the stage
+            input_key (String): key (or fingerprint) of the input of the stage
+            settings (dict, optional): setting name -> value the stage is called with.
+                                       Defaults to None.
+
+        Returns:
+            String: cache key
+        """
+        content = json.dumps({'stage': stage, 'input': input_key, 'settings': settings or {},
+                              'code': code_fingerprint(stage), 'config': stage_settings(stage)},
+                             sort_keys=True, default=str)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def entry_dir(self, stage, key):
+        """directory of an entry
+
+        Args:
+            stage (String): name of the stage
+            key (String): output of `key`
+
+        Returns:
+            Path: directory of the entry
+        """
+        return self.directory / f'{stage}-{key}'
+
+    def load(self, stage, key):
+        """reload a stored output
+
+        Args:
+            stage (String): name of the stage
+            key (String): output of `key`
+
+        Returns:
+            tuple: output of the stage (None if it is not cached)
+        """
+        manifest_adrs = self.entry_dir(stage, key) / 'manifest.json'
+        if not manifest_adrs.is_file():
+            return None
+        with open(manifest_adrs, encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+
+        parts = []
+        for i, part in enumerate(manifest['parts']):
+            if part is None:
+                parts.append(None)
+            elif part == 'frame':
+                parts.append(pd.read_parquet(self.entry_dir(stage, key) / f'{i}.parquet'))
+            else:
+                parts.append({name: None if stored is None else
+                              pd.read_parquet(self.entry_dir(stage, key) / f'{i}_{stored}.parquet')
+                              for name, stored in part})
+        return tuple(parts)
+
+    def store(self, stage, key, outputs):
+        """store the output of a stage. The entry is written into a temporary directory first,
+        so an interrupted run does not leave a partial entry behind.
+
+        Args:
+            stage (String): name of the stage
+            key (String): output of `key`
+            outputs (tuple): output of the stage
+        """
+        entry_dir = self.entry_dir(stage, key)
+        tmp_dir = entry_dir.with_name(entry_dir.name + '.tmp')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        try:
+            manifest = self.write_parts(stage, tmp_dir, outputs)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        with open(tmp_dir / 'manifest.json', 'w', encoding='utf-8') as manifest_file:
+            json.dump({'stage': stage, 'parts': manifest}, manifest_file, indent=1)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        tmp_dir.rename(entry_dir)
+
+    @staticmethod
+    def write_parts(stage, directory, outputs):
+        """write the dataframes of a stage output as parquet files
+
+        Args:
+            stage (String): name of the stage
+            directory (Path): directory of the entry
+            outputs (tuple): output of the stage
+
+        Returns:
+            list: manifest of the parts
+        """
+        manifest = []
+        for i, part in enumerate(outputs):
+            if part is None:
+                manifest.append(None)
+            elif isinstance(part, pd.DataFrame):
+                part.to_parquet(directory / f'{i}.parquet', index=False)
+                manifest.append('frame')
+            elif isinstance(part, dict):
+                entries = []
+                for j, (name, frame) in enumerate(part.items()):
+                    if frame is not None:
+                        frame.to_parquet(directory / f'{i}_{j}.parquet', index=False)
+                    entries.append((name, None if frame is None else j))
+                manifest.append(entries)
+            else:
+                raise TypeError(f"{stage} output of type {type(part)} cannot be cached")
+        return manifest
+
+    def run(self, stage, input_key, settings, function, *args, **kwargs):
+        """reload the output of a stage, or run the stage and store its output
+
+        Args:
+            stage (String): name of the stage
+            input_key (String): key (or fingerprint) of the input of the stage
+            settings (dict): setting name -> value the stage depends on
+            function (callable): the stage, returning a tuple
+            *args, **kwargs: arguments of the stage
+
+        Returns:
+            tuple: output of the stage
+            String: key of the output, the input key of the next stage
+        """
+        key = self.key(stage, input_key, settings)
+        if not self.enabled:
+            return function(*args, **kwargs), key
+
+        if stage not in self.invalidated:
+            outputs = self.load(stage, key)
+            if outputs is not None:
+                log.info("%s stage reloaded from the stage cache (%s)", stage, key[:12])
+                return outputs, key
+        else:
+            log.info("%s stage invalidated, it is recomputed", stage)
+
+        outputs = function(*args, **kwargs)
+        try:
+            self.store(stage, key, outputs)
+            log.info("%s stage stored in the stage cache (%s)", stage, key[:12])
+        except (TypeError, ValueError, OSError) as error:
+            # the run goes on without a checkpoint, e.g. for columns parquet cannot store
+            log.warning("%s stage could not be stored in the stage cache: %s", stage, error)
+        return outputs, key
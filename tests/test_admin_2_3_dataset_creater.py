@@ -0,0 +1,30 @@
+"""
+    filling the admin 2 / 3 panels with the values of the admin level above
+"""
+import numpy as np
+import pandas as pd
+
+from modeling_permutation.admin_2_3_dataset_creater import fill_from_higher_admin, \
+    higher_admin_map
+from modeling_permutation.price_panel import PricePanel
+
+
+def test_nan_values_take_the_higher_admin_value():
+    all_admins = pd.DataFrame({'admin2_label': ['Jebel Saman', 'Al Bab', 'Homs', 'Al Bab'],
+                               'admin3_label': ['Jebel Saman', 'Tadaf', 'Homs', 'Al Bab']})
+    higher_locations = higher_admin_map(all_admins, 'admin3_label', 'admin2_label')
+    assert higher_locations['Tadaf'] == 'Al Bab'
+
+    upper = pd.DataFrame({'year_month': [552, 552, 553, 553, 553],
+                          'admin2_label': ['Jebel Saman', 'Al Bab', 'Jebel Saman', 'Al Bab',
+                                           'Homs'],
+                          'bread_price': [1.0, 2.0, 3.0, 4.0, 5.0]})
+    values = np.array([[[10.0], [np.nan], [np.nan], [np.nan]],
+                       [[np.nan], [11.0], [np.nan], [np.nan]]])
+    panel = PricePanel(values, [552, 553], ['Jebel Saman', 'Tadaf', 'Homs', 'Unknown'],
+                       ['bread_price'], 'admin3_label')
+
+    fill_from_higher_admin(panel, upper, 'admin2_label', higher_locations)
+    # Homs has no admin 2 value in the first month, 'Unknown' has no admin 2 location
+    np.testing.assert_array_equal(panel.values[:, :, 0], [[10.0, 2.0, np.nan, np.nan],
+                                                          [3.0, 11.0, 5.0, np.nan]])
@@ -0,0 +1,105 @@
+"""
+    ARIMA imputation of the panels: failed fits and the order cache
+"""
+import numpy as np
+import pytest
+
+import instrumentation
+from arima_order_cache import ArimaOrderCache
+from modeling_permutation import arima_imputation
+from modeling_permutation.price_panel import PricePanel
+
+N_MONTHS = 24
+
+
+@pytest.fixture
+def panels():
+    """imputed panel and the raw panel with its NaN positions, two locations and one product"""
+    rng = np.random.default_rng(0)
+    values = 100 + rng.normal(0, 1, (N_MONTHS, 2, 1)).cumsum(axis=0)
+    raw = values.copy()
+    raw[[8, 15], 0, 0] = np.nan
+    raw[10, 1, 0] = np.nan
+    return (PricePanel(values, range(N_MONTHS), ['Aleppo', 'Homs'], ['bread_price'], 'admin1_label'),
+            PricePanel(raw, range(N_MONTHS), ['Aleppo', 'Homs'], ['bread_price'], 'admin1_label'))
+
+
+def test_failed_fits_keep_the_values_and_are_counted(monkeypatch, panels):
+    panel, nan_panel = panels
+    before = panel.values.copy()
+
+    class FailingArima:
+        def __init__(self, data, order):
+            pass
+
+        def fit(self):
+            raise np.linalg.LinAlgError("Schur decomposition solver error")
+
+    class SearchedModel:
+        order = (1, 1, 0)
+
+    monkeypatch.setattr(arima_imputation, 'ARIMA', FailingArima)
+    monkeypatch.setattr(arima_imputation.pm, 'auto_arima', lambda data, **settings: SearchedModel())
+    instrumentation.start_run(trace_memory=False)
+    cache = ArimaOrderCache(adrs=None)
+    panel, orders = arima_imputation.arima_imputation_panel(panel, nan_panel, n_workers=1,
+                                                            order_cache=cache)
+
+    np.testing.assert_array_equal(panel.values, before)
+    assert orders == {('Aleppo', 'bread_price'): (1, 1, 0), ('Homs', 'bread_price'): (1, 1, 0)}
+    stages = {record['stage']: record for record in instrumentation.run_report()['stages']}
+    assert stages['imputation.admin1_label.arima.failed']['items'] == 2
+    # the orders of the failed fits are not cached
+    assert cache.orders == {}
+
+
+def test_order_cache_round_trip(tmp_path):
+    adrs = str(tmp_path / "orders.json")
+    cache = ArimaOrderCache(adrs=adrs)
+    key = cache.key('admin1_label', 'Aleppo', 'bread_price', [1.0, 2.0, 3.0])
+    assert key != cache.key('admin1_label', 'Aleppo', 'bread_price', [1.0, 2.0, 3.5])
+    assert cache.lookup(key) is None
+    cache.store(key, (2, 1, 0))
+    seasonal_key = cache.key('admin1_label', 'Aleppo', 'bread_price', [1.0], seasonal=True)
+    cache.store(seasonal_key, (1, 0, 0), (0, 1, 1, 12))
+    assert cache.save() == adrs
+
+    reloaded = ArimaOrderCache(adrs=adrs)
+    assert reloaded.lookup(key) == (2, 1, 0)
+    assert reloaded.lookup(seasonal_key) == ((1, 0, 0), (0, 1, 1, 12))
+    assert (reloaded.hits, reloaded.misses) == (2, 0)
+    assert ArimaOrderCache(adrs=adrs, force_search=True).lookup(key) is None
+
+    # a worker gets the orders of its series and sends back its new orders and counts
+    worker = reloaded.subset([key, 'unknown'])
+    assert list(worker.orders) == [key]
+    worker.lookup('unknown')
+    worker.store('unknown', (0, 1, 1))
+    reloaded.merge(worker)
+    assert reloaded.lookup('unknown') == (0, 1, 1)
+    assert reloaded.misses == 1
+
+
+def test_searched_orders_are_reused(monkeypatch, panels):
+    searches = []
+
+    class SearchedModel:
+        order = (1, 0, 0)
+
+    def auto_arima(data, **settings):
+        searches.append(data)
+        return SearchedModel()
+
+    monkeypatch.setattr(arima_imputation.pm, 'auto_arima', auto_arima)
+    cache = ArimaOrderCache(adrs=None)
+    panel, nan_panel = panels
+    for _ in range(2):
+        imputed = PricePanel(panel.values.copy(), panel.months, panel.locations, panel.products,
+                             panel.admin_label)
+        imputed, orders = arima_imputation.arima_imputation_panel(imputed, nan_panel, n_workers=1,
+                                                                  order_cache=cache)
+    # the second run finds the orders of the unchanged series in the cache
+    assert len(searches) == 2
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert set(orders.values()) == {(1, 0, 0)}
+    assert not np.isnan(imputed.values).any()
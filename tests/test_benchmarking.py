@@ -0,0 +1,31 @@
+"""
+    the benchmark configuration of the synthetic panels is restored after the runs
+"""
+from contextlib import nullcontext
+import copy
+
+import pytest
+
+from benchmarking.run_benchmarks import benchmark_configuration
+from benchmarking.synthetic_panel import scaled_panel_settings
+from modeling_permutation.finding_nearest_cities import CITY_COORDINATES
+from set_up.constants import ADMIN_LOCATIONS, PRODUCTS_LABELS
+
+
+def snapshot():
+    return (copy.deepcopy(ADMIN_LOCATIONS), list(PRODUCTS_LABELS), dict(CITY_COORDINATES))
+
+
+@pytest.mark.parametrize("fails", [False, True])
+def test_configuration_is_restored(fails):
+    before = snapshot()
+    settings = {**scaled_panel_settings(2), 'n_products': 3}
+    with pytest.raises(RuntimeError) if fails else nullcontext():
+        with benchmark_configuration(settings):
+            assert len(PRODUCTS_LABELS) == 3
+            assert len(ADMIN_LOCATIONS['admin1_label']) == settings['n_admin1']
+            assert all(location in CITY_COORDINATES
+                       for location in ADMIN_LOCATIONS['admin1_label'])
+            if fails:
+                raise RuntimeError("stage failed")
+    assert snapshot() == before
@@ -0,0 +1,63 @@
+"""
+    month trimming of gapped series (months missing from the data, several rows per month)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing.complete_months_list import get_full_dates_list, remover_early_months, \
+    remover_late_months, trim_months
+from preprocessing.month_index import parse_month
+
+# 2016-01, 2016-02, 2016-04, 2016-07 and 2016-08: 2016-03, 2016-05 and 2016-06 are missing
+GAPPED_MONTHS = [552, 553, 555, 558, 559]
+
+
+@pytest.fixture
+def gapped():
+    """two locations per month, sorted by month"""
+    months = np.repeat(np.asarray(GAPPED_MONTHS, dtype=np.int32), 2)
+    return pd.DataFrame({'year_month': months,
+                         'admin1_label': ['Aleppo', 'Homs'] * len(GAPPED_MONTHS),
+                         'bread_price': np.arange(len(months), dtype=np.float64)})
+
+
+@pytest.mark.parametrize("min_date, max_date, expected", [
+    (553, 558, [553, 555, 558]),  # bounds present in the data
+    (554, 557, [555]),  # bounds inside gaps
+    ('2016-03', '2016-06', [555]),  # 'yyyy-mm' bounds
+    (540, 600, GAPPED_MONTHS),  # bounds outside of the data
+    (None, 555, [552, 553, 555]),
+    (555, None, [555, 558, 559]),
+    (None, None, GAPPED_MONTHS),
+    (556, 557, []),  # only missing months
+    (560, None, []),  # after the data
+    (None, 551, []),  # before the data
+    (558, 553, []),  # empty range
+])
+def test_trim_months(gapped, min_date, max_date, expected):
+    trimmed = trim_months(gapped, min_date, max_date)
+    assert sorted(set(trimmed['year_month'])) == expected
+    # every location of the kept months is kept
+    assert len(trimmed) == 2 * len(expected)
+
+
+def test_trim_months_returns_a_view(gapped):
+    trimmed = trim_months(gapped, 553, 558)
+    assert np.shares_memory(trimmed['bread_price'].to_numpy(), gapped['bread_price'].to_numpy())
+    assert list(trimmed.index) == [2, 3, 4, 5, 6, 7]
+
+
+def test_removers_reset_the_index(gapped):
+    early = remover_early_months(gapped, '2016-03')
+    late = remover_late_months(gapped, '2016-06')
+    assert list(early['year_month'].unique()) == [555, 558, 559]
+    assert list(late['year_month'].unique()) == [552, 553, 555]
+    assert isinstance(early.index, pd.RangeIndex) and early.index[0] == 0
+    assert isinstance(late.index, pd.RangeIndex) and late.index[0] == 0
+
+
+def test_full_dates_list_fills_the_gaps(gapped):
+    months, data = get_full_dates_list(gapped, '2016-02', '2016-07')
+    assert months == list(range(parse_month('2016-02'), parse_month('2016-07') + 1))
+    assert sorted(set(data['year_month'])) == [553, 555, 558]
@@ -0,0 +1,43 @@
+"""
+    exported admin tables read back like `load_imputed` does
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from modeling_permutation.price_panel import PricePanel
+from preprocessing.data_loading import data_loading
+from preprocessing.month_index import MONTH_DTYPE, month_range, with_month_index
+from results.data_export import export_file
+
+
+@pytest.fixture
+def admin_table():
+    """long admin 2 table with missing prices"""
+    months = month_range('2016-01', '2016-06')
+    locations = ['Jebel Saman', 'Al Bab', 'Homs']
+    values = np.arange(len(months) * len(locations) * 2, dtype=np.float64).reshape(
+        len(months), len(locations), 2) + 0.25
+    values[2, 1, 0] = np.nan
+    return PricePanel(values, months, locations, ['bread_price', 'rice_price'],
+                      'admin2_label').to_frame()
+
+
+@pytest.mark.parametrize("extension", ['parquet', 'feather', 'csv'])
+def test_export_round_trip(extension, admin_table, tmp_path):
+    adrs = str(tmp_path / f"imputed_admin2.{extension}")
+    export_file(admin_table, adrs)
+    reloaded = with_month_index(data_loading(adrs))
+
+    if extension != 'csv':
+        # the location labels are stored as categoricals
+        assert isinstance(reloaded['admin2_label'].dtype, pd.CategoricalDtype)
+    assert reloaded['year_month'].dtype == MONTH_DTYPE
+    pd.testing.assert_frame_equal(reloaded.astype({'admin2_label': object}), admin_table,
+                                  check_dtype=False)
+
+    # the panels built from the reloaded table keep the order of the locations
+    panel = PricePanel.from_frame(reloaded, 'admin2_label')
+    expected = PricePanel.from_frame(admin_table, 'admin2_label')
+    assert list(panel.locations) == list(expected.locations)
+    np.testing.assert_array_equal(panel.values, expected.values)
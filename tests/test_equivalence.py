@@ -0,0 +1,55 @@
+"""
+    the optimized imputation steps against their baseline reference on the edge case fixture
+    (gaps at the first and last months, long gaps, series with too few or no values)
+"""
+import pytest
+
+from benchmarking.equivalence import CHECKS, assert_equivalent, edge_case_fixture
+from benchmarking.synthetic_panel import generate_market_panel
+from preprocessing.preprocessong_controler import preprocessong_controler
+
+FAST_CHECKS = [name for name, check in CHECKS.items() if not check['slow']]
+
+
+@pytest.fixture(scope="module")
+def edge_cases():
+    """long admin 1 table with the gap patterns of EDGE_CASE_GAPS"""
+    return edge_case_fixture()
+
+
+@pytest.mark.parametrize("check", FAST_CHECKS)
+def test_candidate_matches_reference(check, edge_cases):
+    report = assert_equivalent(check, edge_cases, 'admin1_label')
+    assert len(report) == 3  # one row per product
+
+
+def test_mismatch_is_reported(edge_cases):
+    def shifted(table, admin_label):
+        output = CHECKS['global_regression']['candidate'](table, admin_label)
+        output['rice_price'] *= 1.001
+        return output
+
+    with pytest.raises(AssertionError, match="rice_price"):
+        assert_equivalent('global_regression', edge_cases, 'admin1_label', candidate=shifted)
+
+
+@pytest.fixture(scope="module")
+def synthetic_admins():
+    """raw admin 2 / 3 tables of the sampled locations of a small synthetic panel"""
+    raw_data = generate_market_panel(n_months=24, n_admin1=2, n_admin2=3, n_admin3=5,
+                                     submissions_per_month=6, missing_rate=0.3,
+                                     first_month='2016-01')
+    _, raw_admins = preprocessong_controler(raw_data, min_date='2016-01', max_date='2017-12')
+    tables = {}
+    for level in ['admin2_label', 'admin3_label']:
+        # the panels hold every location of the admin level, only the sampled ones have data
+        table = raw_admins[level]
+        sampled = table.dropna(subset=table.columns[2:], how='all')[level].unique()
+        tables[level] = table[table[level].isin(sampled)].reset_index(drop=True)
+    return tables
+
+
+@pytest.mark.parametrize("admin_label", ['admin2_label', 'admin3_label'])
+@pytest.mark.parametrize("check", [name for name in FAST_CHECKS if CHECKS[name]['levels'] is None])
+def test_candidate_matches_reference_on_lower_admins(check, admin_label, synthetic_admins):
+    assert_equivalent(check, synthetic_admins[admin_label], admin_label)
@@ -0,0 +1,36 @@
+"""
+    GARCH (p, q) order search of the forecasts
+"""
+import numpy as np
+import pytest
+
+from modeling_prediction import model
+
+
+@pytest.fixture
+def returns():
+    return np.random.default_rng(0).normal(0, 1, 60)
+
+
+def test_search_uses_the_pool_of_the_caller(returns):
+    class SerialPool:
+        calls = 0
+
+        def map(self, function, *args):
+            self.calls += 1
+            return map(function, *args)
+
+    pool = SerialPool()
+    best_order, table = model.get_best_garch_params(returns, max_p=1, max_q=1, n_workers=2,
+                                                     return_table=True, executor=pool)
+    assert pool.calls == 1  # both rows in one batch
+    assert best_order in {(0, 1), (1, 0), (1, 1)}
+    assert len(table) == 3
+
+
+def test_search_without_a_successful_fit_fails(monkeypatch, returns):
+    monkeypatch.setattr(model, 'fit_garch_row', lambda data, p, q_values, patience=None:
+                        [{'p': p, 'q': q, 'aic': np.nan, 'error': "did not converge"}
+                         for q in q_values])
+    with pytest.raises(ValueError, match="none of the 3 GARCH"):
+        model.get_best_garch_params(returns, max_p=1, max_q=1, n_workers=1)
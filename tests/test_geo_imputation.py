@@ -0,0 +1,65 @@
+"""
+    geographic fill of the price cube against the row by row fill of the long table
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modeling_permutation.geo_imputation import build_neighbour_index, \
+    fill_cube_with_neighbours, perform_geo_imputation
+from modeling_permutation.price_panel import PricePanel
+
+LOCATIONS = ['Aleppo', 'Idleb', 'Hama', 'Homs', 'Tartous']
+# Idleb only has Aleppo as neighbour, Hama only Idleb: a fill of Idleb is needed by Hama
+NEAREST_LOCATIONS = {'Aleppo': ['Idleb', 'Hama'], 'Idleb': ['Aleppo'], 'Hama': ['Idleb'],
+                     'Homs': ['Hama', 'Tartous'], 'Tartous': ['Homs', 'Hama']}
+
+
+def baseline_geo_fill(df, admin_label, nearest_locations, number_of_runs):
+    """row by row fill of the baseline admin 1 imputation: fills of earlier rows are
+    visible to the later ones"""
+    df = df.reset_index(drop=True)
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=RuntimeWarning, message="Mean of empty slice")
+        for _ in range(number_of_runs):
+            for index, row in df.iterrows():
+                for col in df.columns:
+                    if pd.isna(row[col]):
+                        current_location = df.iloc[index][admin_label]
+                        current_date = df.iloc[index]["year_month"]
+                        nearest_locations_values = [
+                            df[(df['year_month'] == current_date) & (df[admin_label] == neighbor)][col]
+                            for neighbor in nearest_locations[current_location]]
+                        df.loc[index, col] = np.nanmean(nearest_locations_values)
+    return df
+
+
+def test_neighbour_index():
+    index = build_neighbour_index(['Aleppo', 'Idleb', 'Hama'],
+                                  {'Aleppo': ['Idleb', 'Damascus'], 'Idleb': ['Hama']})
+    # unknown neighbours and missing slots point to the padding position
+    np.testing.assert_array_equal(index, [[1, 3], [2, 3], [3, 3]])
+
+
+def test_fills_are_visible_later_in_the_same_run():
+    values = np.array([[[10.0], [np.nan], [np.nan], [20.0], [np.nan]]])
+    cube = fill_cube_with_neighbours(values, build_neighbour_index(LOCATIONS, NEAREST_LOCATIONS),
+                                     number_of_runs=1)
+    # Idleb is filled from Aleppo, then Hama from the filled Idleb; Tartous from Homs and Hama
+    np.testing.assert_array_equal(cube[0, :, 0], [10.0, 10.0, 10.0, 20.0, 15.0])
+
+
+@pytest.mark.parametrize("number_of_runs", [1, 2])
+def test_matches_the_row_by_row_fill(number_of_runs):
+    rng = np.random.default_rng(0)
+    values = rng.uniform(50, 150, (12, len(LOCATIONS), 2))
+    values[rng.random(values.shape) < 0.5] = np.nan
+    values[:, 0, :] = np.nan  # Aleppo has to wait for the second run
+    table = PricePanel(values, np.arange(552, 564, dtype=np.int32), LOCATIONS,
+                       ['bread_price', 'rice_price'], 'admin1_label').to_frame()
+
+    expected = baseline_geo_fill(table, 'admin1_label', NEAREST_LOCATIONS, number_of_runs)
+    imputed = perform_geo_imputation(table, 'admin1_label', NEAREST_LOCATIONS, number_of_runs)
+    pd.testing.assert_frame_equal(imputed, expected, check_dtype=False)
@@ -0,0 +1,17 @@
+"""
+    running the imputation levels as a task graph
+"""
+from modeling_permutation.imputation_scheduler import run_task_graph
+
+
+def test_tasks_get_the_results_of_their_dependencies():
+    tasks = {'admin1_label': lambda results: 1,
+             'admin2_label': lambda results: results['admin1_label'] + 1}
+    results, report = run_task_graph(tasks, {'admin2_label': ['admin1_label']})
+    assert results == {'admin1_label': 1, 'admin2_label': 2}
+    assert len(report) == 2
+
+
+def test_no_tasks():
+    results, _ = run_task_graph({}, {})
+    assert results == {}
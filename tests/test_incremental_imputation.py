@@ -0,0 +1,108 @@
+"""
+    seeding of the raw data with the previous imputation and merging of the locations that are
+    not imputed again
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modeling_permutation.imputation_controler import merge_complete_locations
+from modeling_permutation.incremental_imputation import drop_locations, raw_fingerprints, \
+    save_fingerprints, seed_raw_admin, store_imputation, load_previous_imputation, \
+    load_fingerprints
+from modeling_permutation.price_panel import PricePanel
+from preprocessing.month_index import format_months
+
+MONTHS = list(range(552, 560))  # 2016-01 to 2016-08
+LOCATIONS = ['Afrin', "A'zaz", 'Harim']
+
+
+def admin2_frame(values):
+    """long admin 2 table of a (month x location) array of bread prices, from the first month"""
+    months = MONTHS[:len(values)]
+    return pd.DataFrame({'year_month': np.repeat(months, len(LOCATIONS)),
+                         'admin2_label': LOCATIONS * len(months),
+                         'bread_price': np.asarray(values, dtype=np.float64).reshape(-1)})
+
+
+@pytest.fixture
+def previous_run():
+    """raw data of this month, imputation and fingerprints of the previous run (one month less)"""
+    raw = np.arange(len(MONTHS) * len(LOCATIONS), dtype=np.float64).reshape(len(MONTHS), -1) + 1
+    raw[2, :] = np.nan
+    imputed = np.nan_to_num(raw[:-1], nan=100.0)
+    raw_panel = PricePanel.from_frame(admin2_frame(raw[:-1]), 'admin2_label')
+    months = format_months(MONTHS[:-1])
+    stored = {'months': [months[0], months[-1]], 'series': raw_fingerprints(raw_panel)}
+    return raw, PricePanel.from_frame(admin2_frame(imputed), 'admin2_label'), stored
+
+
+def test_seeding(previous_run):
+    raw, previous, stored = previous_run
+    current = raw.copy()
+    current[-1, 1] = np.nan  # A'zaz has no price in the new month
+    current[0, 2] = 7.0  # the history of Harim changed
+    seeded, counts, complete = seed_raw_admin(admin2_frame(current), 'admin2_label', previous,
+                                              stored, window_months=2)
+    assert counts == {'complete': 1, 'window': 1, 'full': 1}
+    assert complete == ['Afrin']
+    seeded = PricePanel.from_frame(seeded, 'admin2_label')
+    # the history before the window comes from the previous imputation
+    np.testing.assert_array_equal(seeded.column('Afrin', 'bread_price')[2], 100.0)
+    assert np.isnan(seeded.column("A'zaz", 'bread_price')[-1])
+    # a changed series is imputed from its raw data
+    assert np.isnan(seeded.column('Harim', 'bread_price')[2])
+
+
+def test_without_previous_run_everything_is_imputed(previous_run):
+    raw, _, _ = previous_run
+    seeded, counts, complete = seed_raw_admin(admin2_frame(raw), 'admin2_label', None, None)
+    assert counts == {'complete': 0, 'window': 0, 'full': 3} and complete == []
+    pd.testing.assert_frame_equal(seeded, admin2_frame(raw))
+
+
+def test_complete_locations_are_merged_back(previous_run):
+    raw, _, _ = previous_run
+    complete = admin2_frame(np.nan_to_num(raw, nan=100.0))
+    to_impute = drop_locations(complete, 'admin2_label', ['Afrin'])
+    assert 'Afrin' not in set(to_impute['admin2_label'])
+    imputed = to_impute.assign(bread_price=-1.0)
+    merged = merge_complete_locations(imputed, complete, 'admin2_label')
+    pd.testing.assert_frame_equal(merged[['year_month', 'admin2_label']],
+                                  complete[['year_month', 'admin2_label']])
+    afrin = merged['admin2_label'] == 'Afrin'
+    np.testing.assert_array_equal(merged.loc[afrin, 'bread_price'],
+                                  complete.loc[afrin, 'bread_price'])
+    assert (merged.loc[~afrin, 'bread_price'] == -1.0).all()
+    # an admin level without locations to impute is the complete data
+    pd.testing.assert_frame_equal(merge_complete_locations(None, complete, 'admin2_label'),
+                                  complete)
+
+
+def test_saved_fingerprints_keep_the_other_levels(tmp_path, previous_run):
+    raw, _, _ = previous_run
+    adrs = tmp_path / 'fingerprints.json'
+    adrs.write_text(json.dumps({'admin3_label': {'months': ['2016-01', '2016-08'],
+                                                 'series': {}}}))
+    save_fingerprints({'admin2_label': admin2_frame(raw)}, adrs)
+    content = json.loads(adrs.read_text())
+    assert set(content) == {'admin2_label', 'admin3_label'}
+    assert content['admin2_label']['months'] == ['2016-01', '2016-08']
+    assert len(content['admin2_label']['series']) == len(LOCATIONS)
+
+
+def test_stored_imputation_is_kept_apart_from_the_user_files(tmp_path, monkeypatch, previous_run):
+    raw, imputed, _ = previous_run
+    # the addresses are relative to the src folder
+    (tmp_path / 'src').mkdir()
+    monkeypatch.chdir(tmp_path / 'src')
+    store_imputation({'admin2_label': imputed.to_frame()},
+                     {'admin2_label': admin2_frame(raw[:-1])})
+
+    assert not (tmp_path / 'data' / 'processed').exists()
+    reloaded = load_previous_imputation('admin2_label')
+    np.testing.assert_array_equal(reloaded.values, imputed.values)
+    assert list(load_fingerprints()) == ['admin2_label']
+    assert load_previous_imputation('admin3_label') is None
@@ -0,0 +1,34 @@
+"""
+    stage records of the run report
+"""
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def traced_run():
+    instrumentation.start_run(trace_memory=True)
+    yield
+    tracemalloc.stop()
+
+
+def test_report_has_the_memory_peak_of_every_stage(traced_run):
+    with instrumentation.measure('imputation', items=2):
+        with instrumentation.measure('imputation.admin1_label'):
+            block = np.ones(1 << 20)  # 8 MB
+        del block
+    instrumentation.record_item('imputation.admin1_label.arima.series', 0.5, 0.25)
+
+    report = instrumentation.run_report(choice=1)
+    assert report['tracemalloc'] and report['choice'] == 1
+    stages = {record['stage']: record for record in report['stages']}
+    assert stages['imputation']['items'] == 2
+    # the outer stage sees the peak of the nested one
+    for stage in ('imputation', 'imputation.admin1_label'):
+        assert stages[stage]['tracemalloc_peak_bytes'] >= 8 << 20
+        assert stages[stage]['max_rss_bytes'] > 0
+    assert stages['imputation.admin1_label.arima.series']['cpu_seconds'] == 0.25
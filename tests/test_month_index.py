@@ -0,0 +1,34 @@
+"""
+    conversions between 'yyyy-mm' months and the integer month index
+"""
+import numpy as np
+import pandas as pd
+
+from preprocessing.month_index import MONTH_DTYPE, format_months, month_range, \
+    months_to_timestamps, parse_month, parse_months, timestamps_to_months, \
+    with_month_index, with_month_strings
+
+
+def test_single_months():
+    assert parse_month('1970-01') == 0
+    assert parse_month('2016-01') == 552
+    assert parse_month(552) == 552
+    assert list(format_months([552, 563, 564])) == ['2016-01', '2016-12', '2017-01']
+
+
+def test_month_ranges_and_timestamps():
+    months = month_range('2016-11', '2017-02')
+    assert months.dtype == MONTH_DTYPE
+    assert list(months) == [562, 563, 564, 565]
+    np.testing.assert_array_equal(parse_months(pd.Series(format_months(months))), months)
+    timestamps = months_to_timestamps(months)
+    assert timestamps[0] == pd.Timestamp('2016-11-01')
+    np.testing.assert_array_equal(timestamps_to_months(timestamps), months)
+
+
+def test_table_round_trip():
+    data = pd.DataFrame({'year_month': ['2016-01', '2016-02'], 'bread_price': [1.0, 2.0]})
+    indexed = with_month_index(data)
+    assert indexed['year_month'].dtype == MONTH_DTYPE
+    assert with_month_index(indexed) is indexed  # already converted
+    pd.testing.assert_frame_equal(with_month_strings(indexed), data)
@@ -0,0 +1,50 @@
+"""
+    preprocessing of data that already carries 'yyyy-mm' months instead of 'year' and 'month',
+    and the outlier removal
+"""
+import numpy as np
+import pandas as pd
+
+from preprocessing.month_index import MONTH_DTYPE, parse_month
+from preprocessing.preprocessong_controler import preprocessong_controler
+from preprocessing.remove_outliers import detect_outliers, generate_outlierless_data
+from set_up.constants import PRODUCTS_LABELS
+
+
+def test_year_month_strings_are_converted():
+    data = pd.DataFrame({'year_month': ['2016-01', '2016-01', '2016-03'],
+                         'admin1_label': ['Aleppo', 'Homs', 'Aleppo'],
+                         'admin2_label': ['Jebel Saman', 'Homs', 'Jebel Saman'],
+                         'admin3_label': ['Jebel Saman', 'Homs', 'Jebel Saman']})
+    for product in PRODUCTS_LABELS:
+        data[product] = np.nan
+    data['bread_price'] = [10.0, 20.0, 12.0]
+
+    preprocessed, raw_admins = preprocessong_controler(data, min_date='2016-01',
+                                                       max_date='2016-03')
+    assert preprocessed['year_month'].dtype == MONTH_DTYPE
+    admin0 = raw_admins['admin0_label']
+    assert list(admin0['year_month']) == [parse_month('2016-01'), parse_month('2016-02'),
+                                          parse_month('2016-03')]
+    np.testing.assert_allclose(admin0['bread_price'], [15.0, np.nan, 12.0])
+    aleppo = raw_admins['admin1_label'].query("admin1_label == 'Aleppo'")
+    np.testing.assert_allclose(aleppo['bread_price'], [10.0, np.nan, 12.0])
+
+
+def test_outliers_match_the_per_date_detection():
+    rng = np.random.default_rng(0)
+    n_rows = 400
+    data = pd.DataFrame({'date': rng.choice(['2016-01-05', '2016-01-20', '2016-02-03', None],
+                                            n_rows)})
+    for product in PRODUCTS_LABELS:
+        data[product] = rng.lognormal(4, 0.1, n_rows)
+        data.loc[rng.random(n_rows) < 0.2, product] = np.nan
+    data.loc[rng.choice(n_rows, 10), 'bread_price'] = 1e5
+    data.loc[rng.choice(n_rows, 10), 'rice_price'] = 1e-3
+
+    expected = pd.concat([detect_outliers(group, PRODUCTS_LABELS)
+                          for _, group in data.groupby('date')], ignore_index=True)
+    outlierless = generate_outlierless_data(data)
+    assert outlierless['bread_price'].max() < 1e5
+    assert outlierless['rice_price'].min() > 1e-3
+    pd.testing.assert_frame_equal(outlierless, expected)
@@ -0,0 +1,76 @@
+"""
+    stage cache hits, misses and invalidation
+"""
+import pandas as pd
+import pytest
+
+from modeling_permutation import imputation_controler
+from stage_cache import StageCache
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({'year_month': [552, 553], 'bread_price': [1.0, float('nan')]})
+
+
+def counting_stage(frame, calls):
+    """stage returning a frame and a dictionary of frames, counting its runs"""
+    def stage():
+        calls.append(1)
+        return frame, {'admin0_label': frame, 'admin1_label': None}
+    return stage
+
+
+def test_unchanged_stage_is_reloaded(tmp_path, frame):
+    calls = []
+    cache = StageCache(tmp_path, enabled=True)
+    outputs, key = cache.run('imputation', 'input', {'N': 1}, counting_stage(frame, calls))
+    reloaded, reloaded_key = cache.run('imputation', 'input', {'N': 1},
+                                       counting_stage(frame, calls))
+    assert len(calls) == 1 and key == reloaded_key
+    pd.testing.assert_frame_equal(reloaded[0], outputs[0])
+    pd.testing.assert_frame_equal(reloaded[1]['admin0_label'], frame)
+    assert reloaded[1]['admin1_label'] is None
+
+
+@pytest.mark.parametrize("input_key, settings", [('other input', {'N': 1}),
+                                                 ('input', {'N': 2})])
+def test_changed_input_or_settings_miss(tmp_path, frame, input_key, settings):
+    calls = []
+    cache = StageCache(tmp_path, enabled=True)
+    _, key = cache.run('imputation', 'input', {'N': 1}, counting_stage(frame, calls))
+    _, other_key = cache.run('imputation', input_key, settings, counting_stage(frame, calls))
+    assert len(calls) == 2 and key != other_key
+
+
+def test_invalidated_stages_are_recomputed(tmp_path, frame):
+    calls = []
+    StageCache(tmp_path, enabled=True).run('prediction', 'input', None,
+                                           counting_stage(frame, calls))
+    # invalidating a stage also invalidates the stages after it
+    cache = StageCache(tmp_path, invalidate=['imputation'], enabled=True)
+    assert cache.invalidated == {'imputation', 'prediction'}
+    cache.run('prediction', 'input', None, counting_stage(frame, calls))
+    assert len(calls) == 2
+    with pytest.raises(ValueError):
+        StageCache(tmp_path, invalidate=['unknown'])
+
+
+def test_disabled_cache_does_not_store(tmp_path, frame):
+    calls = []
+    for _ in range(2):
+        StageCache(tmp_path, enabled=False).run('imputation', 'input', None,
+                                                counting_stage(frame, calls))
+    assert len(calls) == 2 and not any(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("levels, reloaded", [
+    (['admin0_label', 'admin1_label', 'admin2_label', 'admin3_label'], []),
+    (['admin2_label', 'admin3_label'], ['admin1_label']),
+    (['admin1_label', 'admin3_label'], ['admin2_label']),
+    (['admin3_label'], ['admin1_label', 'admin2_label']),
+    (['admin0_label'], []),
+])
+def test_reloaded_admin_levels(monkeypatch, levels, reloaded):
+    monkeypatch.setattr(imputation_controler, 'ADMIN_LOCATIONS', dict.fromkeys(levels))
+    assert imputation_controler.reloaded_admin_levels() == reloaded
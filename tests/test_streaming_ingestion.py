@@ -0,0 +1,71 @@
+"""
+    streaming ingestion against the in memory loading and preprocessing of the same csv
+"""
+import pandas as pd
+import pytest
+
+from benchmarking.synthetic_panel import write_market_panel
+from preprocessing.data_loading import data_loading
+from preprocessing.preprocessong_controler import preprocessong_controler
+from preprocessing.streaming_ingestion import preprocess_batch, open_csv_batches, \
+    streaming_preprocessing, spill_date_prices, date_outlier_bounds
+from set_up.constants import PRODUCTS_LABELS
+
+MIN_MONTH = '2016-01'
+MAX_MONTH = '2017-02'
+
+
+@pytest.fixture(scope="module")
+def raw_csv(tmp_path_factory):
+    """small synthetic export with outliers, read in several batches"""
+    adrs = str(tmp_path_factory.mktemp("raw") / "raw.csv")
+    write_market_panel(adrs, n_months=14, n_admin1=2, n_admin2=3, n_admin3=5,
+                       submissions_per_month=6, missing_rate=0.1, outlier_rate=0.05,
+                       first_month=MIN_MONTH)
+    return adrs
+
+
+def test_streaming_matches_the_in_memory_pipeline(raw_csv):
+    _, in_memory = preprocessong_controler(data_loading(raw_csv), min_date=MIN_MONTH,
+                                           max_date=MAX_MONTH)
+    hierarchy, streamed = streaming_preprocessing(raw_csv, MIN_MONTH, MAX_MONTH,
+                                                  block_size=1 << 14)
+    assert set(streamed) == set(in_memory)
+    for admin_level, admin_data in in_memory.items():
+        pd.testing.assert_frame_equal(streamed[admin_level], admin_data, check_dtype=False)
+    assert not hierarchy.duplicated().any()
+
+
+def test_numbered_months_are_read_as_text(tmp_path):
+    adrs = tmp_path / "months.csv"
+    adrs.write_text("date,year,month,admin1_label,bread_price\n"
+                    "2016-01-03,2016,1,Aleppo,10\n"
+                    "2016-02-03,2016,February,Aleppo,11\n"
+                    "2016-03-03,2016,03,Aleppo,12\n")
+    batch = next(iter(open_csv_batches(str(adrs))))
+    assert list(preprocess_batch(batch)['year_month']) == [552, 553, 554]
+
+
+@pytest.mark.parametrize("content", ["", "date,year,month,admin1_label,bread_price\n"])
+def test_empty_file_is_refused(tmp_path, content):
+    adrs = tmp_path / "empty.csv"
+    adrs.write_text(content)
+    with pytest.raises(ValueError, match="no rows to stream"):
+        streaming_preprocessing(str(adrs))
+
+
+def test_outlier_bounds_are_computed_one_spill_file_at_a_time(raw_csv, tmp_path):
+    # a small block size spreads the dates over several spill files
+    assert len(spill_date_prices(raw_csv, str(tmp_path), block_size=1 << 12)) > 1
+    lower, upper = date_outlier_bounds(raw_csv, block_size=1 << 12)
+    expected_lower, expected_upper = date_outlier_bounds(raw_csv, block_size=1 << 30)
+    pd.testing.assert_frame_equal(lower, expected_lower)
+    pd.testing.assert_frame_equal(upper, expected_upper)
+
+
+def test_rows_without_a_date_have_no_bounds(tmp_path):
+    adrs = tmp_path / "no_dates.csv"
+    adrs.write_text("date,year,month,admin1_label," + ",".join(PRODUCTS_LABELS) + "\n"
+                    ",2016,1,Aleppo" + ",10" * len(PRODUCTS_LABELS) + "\n")
+    lower, upper = date_outlier_bounds(str(adrs))
+    assert lower.empty and upper.empty